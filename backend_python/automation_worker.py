@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Automation worker: runs queued project runs from the `automationJobs` collection.
+
+    python automation_worker.py [--concurrency 2] [--worker-id NAME]
+
+Start as many as needed, on any node that reaches the database. SIGINT / SIGTERM
+stop claiming and exit once the runs in hand are finished.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.db import connect_db, get_collections  # noqa: E402
+from src.services.automation_jobs import AutomationWorker  # noqa: E402
+from src.services.case_executor import executor as case_executor  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+load_dotenv()
+
+
+async def serve(concurrency: int, worker_id: str = None):
+    await connect_db()
+    worker = AutomationWorker(get_collections(), concurrency=concurrency, worker_id=worker_id)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:  # Windows: Ctrl+C raises KeyboardInterrupt instead
+            pass
+    try:
+        await worker.run()
+    finally:
+        case_executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=1, help='project runs held at once')
+    parser.add_argument('--worker-id', default=None, help='lease owner name (default host:pid:random)')
+    args = parser.parse_args()
+    asyncio.run(serve(args.concurrency, args.worker_id))
+
+
+if __name__ == '__main__':
+    main()
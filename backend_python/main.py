@@ -1,5 +1,6 @@
 import os
 import ssl
+import asyncio
 import logging
 import sys
 from contextlib import asynccontextmanager
@@ -15,9 +16,15 @@ from dotenv import load_dotenv
 current_dir = Path(__file__).parent
 sys.path.insert(0, str(current_dir))
 
-from src.db import connect_db, ensure_seed_providers
-from src.routes import auth, users, payments, uploads, meetups, profile, automation
-from src.ws.matchmaking import setup_websocket_routes
+from src.db import connect_db, ensure_seed_providers, get_collections, migrate_event_dates
+from src.routes import auth, users, payments, uploads, meetups, profile, automation, presence, events, consults
+from src.ws.matchmaking import (
+    setup_websocket_routes, start_realtime, stop_realtime, PING_INTERVAL_SECONDS, IDLE_TIMEOUT_SECONDS
+)
+from src.services.reminders import scheduler as reminder_scheduler
+from src.services.event_archive import run_event_archiver
+from src.services.case_executor import executor as case_executor
+from src.services.automation_jobs import AutomationWorker
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -44,6 +51,13 @@ logger.info('[BOOT] Starting API with config: {}'.format({
 }))
 
 
+async def start_event_jobs():
+    """Convert old event dates, then load reminders and archive (their range queries read BSON dates)"""
+    await migrate_event_dates()
+    await reminder_scheduler.start()
+    await run_event_archiver()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -51,6 +65,13 @@ async def lifespan(app: FastAPI):
         await connect_db()
         await ensure_seed_providers()
         logger.info("Database connected and seeded successfully")
+        # Online: old events keep being served while they are converted
+        app.state.event_jobs = asyncio.create_task(start_event_jobs())
+        # Project runs are executed by `automation_worker.py`; single-process setups can run one here
+        if os.getenv('AUTOMATION_API_WORKER', 'false').lower() == 'true':
+            app.state.automation_worker = AutomationWorker(get_collections())
+            app.state.automation_worker_task = asyncio.create_task(app.state.automation_worker.run())
+        await start_realtime()
         yield
     except Exception as e:
         logger.error(f"[BOOT] Failed to connect to MongoDB: {e}")
@@ -58,6 +79,16 @@ async def lifespan(app: FastAPI):
     finally:
         # Shutdown
         logger.info("Shutting down...")
+        event_jobs = getattr(app.state, 'event_jobs', None)
+        if event_jobs and not event_jobs.done():
+            event_jobs.cancel()
+        automation_worker_task = getattr(app.state, 'automation_worker_task', None)
+        if automation_worker_task:
+            # Whatever it holds is resumed by another worker once the lease expires
+            automation_worker_task.cancel()
+        await reminder_scheduler.stop()
+        case_executor.shutdown()
+        await stop_realtime()
 
 
 # Create FastAPI app
@@ -75,6 +106,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -91,6 +123,9 @@ app.include_router(payments.router, prefix="/payments", tags=["payments"])
 app.include_router(uploads.router, prefix="/uploads", tags=["uploads"])
 app.include_router(meetups.router, prefix="/meetups", tags=["meetups"])
 app.include_router(automation.router, tags=["automation"])
+app.include_router(presence.router, prefix="/presence", tags=["presence"])
+app.include_router(events.router, prefix="/events", tags=["events"])
+app.include_router(consults.router, prefix="/consults", tags=["consults"])
 
 # Setup WebSocket routes
 setup_websocket_routes(app)
@@ -101,6 +136,13 @@ if __name__ == "__main__":
     use_tls = os.getenv('TLS_KEY') and os.getenv('TLS_CERT')
     # Avoid in-process reload on Windows; use dev scripts/CLI for reload instead.
     reload_flag = os.getenv('UVICORN_RELOAD', '').lower() in {"1", "true", "yes"}
+    # permessage-deflate on WebSockets; turn off to trade bandwidth for CPU
+    ws_deflate = os.getenv('WS_PER_MESSAGE_DEFLATE', 'true').lower() in {"1", "true", "yes"}
+    # Protocol-level pings: browsers answer them, so quiet but healthy sockets stay open
+    ws_ping = {
+        "ws_ping_interval": PING_INTERVAL_SECONDS,
+        "ws_ping_timeout": max(1.0, IDLE_TIMEOUT_SECONDS - PING_INTERVAL_SECONDS)
+    }
 
     if use_tls:
         ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
@@ -113,12 +155,16 @@ if __name__ == "__main__":
             host="0.0.0.0",
             port=port,
             ssl_context=ssl_context,
-            reload=reload_flag
+            reload=reload_flag,
+            ws_per_message_deflate=ws_deflate,
+            **ws_ping
         )
     else:
         uvicorn.run(
             app,
             host="0.0.0.0",
             port=port,
-            reload=reload_flag
+            reload=reload_flag,
+            ws_per_message_deflate=ws_deflate,
+            **ws_ping
         )
@@ -0,0 +1,115 @@
+"""Bytes on the wire and CPU per 1k-recipient broadcast for each WebSocket framing mode.
+
+    python scripts/bench_ws_framing.py [--recipients 1000] [--broadcasts 200] [--burst 8]
+
+Runs the real ConnectionManager against in-memory sockets, so it measures encoding
+and queueing cost without network noise. "deflate" is the size of each frame after
+raw DEFLATE with context takeover, i.e. roughly what permessage-deflate puts on the
+wire; that compression is included in the CPU figure for every mode.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import zlib
+from pathlib import Path
+
+from fastapi.websockets import WebSocketState
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.ws import matchmaking  # noqa: E402
+from src.ws.framing import JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL, supported_subprotocols  # noqa: E402
+
+
+class _CountingSocket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.frames = 0
+        self.bytes = 0
+        self.deflated = 0
+        self._compressor = zlib.compressobj(wbits=-15)
+
+    async def accept(self, subprotocol=None):
+        return None
+
+    def _count(self, payload: bytes):
+        self.frames += 1
+        self.bytes += len(payload)
+        self.deflated += len(self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    async def send_text(self, data: str):
+        self._count(data.encode())
+
+    async def send_bytes(self, data: bytes):
+        self._count(data)
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+def _payload(i: int) -> dict:
+    return {
+        "type": "consult_offer",
+        "requestId": f"req_{i:08d}",
+        "from": "c_5f1e2d3c4b5a69788796a5b4",
+        "symptom": "persistent cough and mild fever for three days",
+        "specialization": "pulmonology",
+        "fallback": False,
+        "expiresInSeconds": 20,
+    }
+
+
+async def _run_mode(subprotocol, batch_ms: float, args) -> dict:
+    matchmaking.BATCH_WINDOW_SECONDS = batch_ms / 1000
+    matchmaking.SEND_QUEUE_SIZE = max(matchmaking.SEND_QUEUE_SIZE, args.burst * 2)
+    mgr = matchmaking.ConnectionManager()
+    sockets = [_CountingSocket() for _ in range(args.recipients)]
+    for i, ws in enumerate(sockets):
+        await mgr.connect(ws, f"bench_{i}", {"role": "provider", "id": f"p{i}"}, subprotocol)
+    await asyncio.sleep(0.05)
+    for ws in sockets:  # ignore the welcome message
+        ws.frames = ws.bytes = ws.deflated = 0
+
+    cpu = time.process_time()
+    for n in range(args.broadcasts // args.burst):
+        for k in range(args.burst):
+            await mgr.publish("role:provider", json.dumps(_payload(n * args.burst + k)))
+        # let writers drain before the next burst
+        await asyncio.sleep(batch_ms / 1000 if batch_ms else 0)
+        while any(c.queue.qsize() for c in mgr.active_connections.values()):
+            await asyncio.sleep(0)
+    await asyncio.sleep(batch_ms / 1000 + 0.01)
+    cpu = time.process_time() - cpu
+
+    for i in range(args.recipients):
+        mgr.disconnect(f"bench_{i}")
+    broadcasts = (args.broadcasts // args.burst) * args.burst
+    per_k = 1000 / args.recipients / broadcasts
+    return {
+        "codec": "msgpack" if subprotocol == MSGPACK_SUBPROTOCOL else "json",
+        "batchMs": batch_ms,
+        "framesPer1k": round(sum(ws.frames for ws in sockets) * per_k, 1),
+        "bytesPer1k": round(sum(ws.bytes for ws in sockets) * per_k),
+        "deflatedBytesPer1k": round(sum(ws.deflated for ws in sockets) * per_k),
+        "cpuMsPer1k": round(cpu * 1000 * 1000 / args.recipients / broadcasts, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=1000)
+    parser.add_argument("--broadcasts", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=8, help="messages published back to back")
+    parser.add_argument("--batch-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    protocols = [JSON_SUBPROTOCOL] + ([MSGPACK_SUBPROTOCOL] if MSGPACK_SUBPROTOCOL in supported_subprotocols() else [])
+    for subprotocol in protocols:
+        for batch_ms in (0, args.batch_ms):
+            print(json.dumps(asyncio.run(_run_mode(subprotocol, batch_ms, args))))
+
+
+if __name__ == "__main__":
+    main()
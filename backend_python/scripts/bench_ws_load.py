@@ -0,0 +1,260 @@
+"""Load test for /ws: N concurrent clients against a locally started app.
+
+    python scripts/bench_ws_load.py --clients 2000 [--guests] [--broadcasts 20]
+
+Starts the WebSocket routes in a uvicorn subprocess (no Mongo, no other services),
+connects the clients, then measures:
+
+- connect rate (sockets accepted per second, welcome received)
+- ping round trip and consult_request ack latency (p50/p99)
+- fan-out latency of a room message to every client (p50/p99/max); signed-in
+  clients only, as guests cannot join rooms
+- server RSS growth per connection and messages dropped on the way
+
+Each run is appended to bench_results/ws_load.jsonl with the git commit, so runs
+can be compared across commits with --history.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+RESULTS_FILE = BACKEND_DIR / 'bench_results' / 'ws_load.jsonl'
+ROOM = 'bench'
+
+
+def serve(port: int):
+    """Child process: only the realtime routes, so no database is needed"""
+    import logging
+    from contextlib import asynccontextmanager
+
+    import uvicorn
+    from fastapi import FastAPI
+    from src.ws.matchmaking import setup_websocket_routes, start_realtime, stop_realtime
+
+    logging.basicConfig(level=logging.ERROR)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await start_realtime()
+        yield
+        await stop_realtime()
+
+    app = FastAPI(lifespan=lifespan)
+    setup_websocket_routes(app)
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='error', ws_max_queue=1024)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _rss_kb(pid: int) -> int:
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def _percentiles(samples) -> dict:
+    if not samples:
+        return {"p50": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {"p50": pick(0.50), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 3)}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def _raise_fd_limit(clients: int):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, clients * 2 + 256))
+    if wanted > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+class _Client:
+    def __init__(self, ws):
+        self.ws = ws
+        self.pending = {}  # reply type -> future
+        self.fanout = []  # latencies of room messages received
+        self.room_messages = 0
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                kind = message.get('type')
+                if kind == 'room_message':
+                    self.room_messages += 1
+                    self.fanout.append(time.monotonic() - message['data']['sentAt'])
+                future = self.pending.pop(kind, None)
+                if future and not future.done():
+                    future.set_result(message)
+        except Exception:
+            pass
+
+    async def request(self, message: dict, reply: str, timeout: float = 10):
+        future = self.pending[reply] = asyncio.get_running_loop().create_future()
+        started = time.monotonic()
+        await self.ws.send(json.dumps(message))
+        await asyncio.wait_for(future, timeout)
+        return time.monotonic() - started
+
+
+async def _run(args, port: int, server_pid: int) -> dict:
+    import httpx
+    import websockets
+    from src.utils.auth import generate_token
+
+    url = f'ws://127.0.0.1:{port}/ws'
+    rss_before = _rss_kb(server_pid)
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    failed = 0
+
+    async def _open(i: int):
+        nonlocal failed
+        query = '' if args.guests else '?token=' + generate_token({"role": "admin", "id": f"bench{i}", "username": f"bench{i}"})
+        async with semaphore:
+            try:
+                ws = await websockets.connect(url + query, max_queue=None, open_timeout=30)
+                await asyncio.wait_for(ws.recv(), 30)  # welcome
+                return ws
+            except Exception:
+                failed += 1
+                return None
+
+    started = time.monotonic()
+    sockets = [ws for ws in await asyncio.gather(*(_open(i) for i in range(args.clients))) if ws]
+    connect_seconds = time.monotonic() - started
+    clients = [_Client(ws) for ws in sockets]
+    await asyncio.sleep(0.5)
+    rss_after = _rss_kb(server_pid)
+
+    # Request/response traffic from a sample of clients
+    sample = clients[:min(len(clients), args.sample)]
+    pings = await asyncio.gather(*(c.request({"type": "ping"}, 'pong') for c in sample), return_exceptions=True)
+    acks = await asyncio.gather(*(
+        c.request({"type": "consult_request", "symptom": "load test"}, 'consult_request_ack') for c in sample
+    ), return_exceptions=True)
+
+    fanout = []
+    expected = 0
+    if not args.guests and clients:
+        await asyncio.gather(*(c.request({"type": "subscribe", "room": ROOM}, 'subscribed') for c in clients), return_exceptions=True)
+        sender = clients[0]
+        for _ in range(args.broadcasts):
+            await sender.ws.send(json.dumps({"type": "room_message", "room": ROOM, "data": {"sentAt": time.monotonic()}}))
+            await asyncio.sleep(args.broadcast_interval)
+        await asyncio.sleep(2)
+        expected = args.broadcasts * (len(clients) - 1)  # the sender is excluded
+        fanout = [latency for c in clients for latency in c.fanout]
+
+    admin = generate_token({"role": "admin", "username": "bench"})
+    async with httpx.AsyncClient() as http:
+        response = await http.get(f'http://127.0.0.1:{port}/ws/stats', headers={"Authorization": f"Bearer {admin}"})
+        stats = response.json() if response.status_code == 200 else {}
+
+    for c in clients:
+        c.reader.cancel()
+    await asyncio.gather(*(c.ws.close() for c in clients), return_exceptions=True)
+
+    received = sum(c.room_messages for c in clients)
+    return {
+        "clients": args.clients,
+        "connected": len(clients),
+        "connectFailures": failed,
+        "connectPerSecond": round(len(clients) / connect_seconds, 1) if connect_seconds else None,
+        "pingMs": _percentiles([x for x in pings if isinstance(x, float)]),
+        "consultAckMs": _percentiles([x for x in acks if isinstance(x, float)]),
+        "fanoutMs": _percentiles(fanout),
+        "fanoutExpected": expected,
+        "fanoutReceived": received,
+        "fanoutMissing": expected - received,
+        "serverDroppedMessages": stats.get('droppedMessages'),
+        "rssKbPerConnection": round((rss_after - rss_before) / len(clients), 2) if clients else None,
+    }
+
+
+def _history(limit: int):
+    if not RESULTS_FILE.exists():
+        print('No results yet')
+        return
+    runs = [json.loads(line) for line in RESULTS_FILE.read_text().splitlines() if line.strip()][-limit:]
+    print(f"{'commit':<10}{'clients':>8}{'guests':>7}{'conn/s':>9}{'fan p50':>9}{'fan p99':>9}{'missing':>8}{'KB/conn':>9}")
+    for run in runs:
+        r = run['result']
+        print(f"{run['commit']:<10}{r['clients']:>8}{str(run['guests'])[0]:>7}{r['connectPerSecond'] or 0:>9}"
+              f"{r['fanoutMs']['p50'] or 0:>9}{r['fanoutMs']['p99'] or 0:>9}{r['fanoutMissing']:>8}{r['rssKbPerConnection'] or 0:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--guests', action='store_true', help='connect without tokens')
+    parser.add_argument('--broadcasts', type=int, default=20)
+    parser.add_argument('--broadcast-interval', type=float, default=0.05)
+    parser.add_argument('--sample', type=int, default=200, help='clients that send ping/consult_request')
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--history', type=int, metavar='N', help='print the last N saved runs and exit')
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+    if args.history:
+        _history(args.history)
+        return
+
+    _raise_fd_limit(args.clients)
+    port = _free_port()
+    env = dict(os.environ, JWT_SECRET=os.getenv('JWT_SECRET', 'dev_jwt_secret'), WS_BACKPLANE='none',
+               # The harness talks faster than a real client; don't measure the rate limiter
+               WS_RATE_LIMIT_BURST=os.getenv('WS_RATE_LIMIT_BURST', '1000'),
+               WS_GUEST_RATE_LIMIT_BURST=os.getenv('WS_GUEST_RATE_LIMIT_BURST', '1000'))
+    os.environ['JWT_SECRET'] = env['JWT_SECRET']
+    server = subprocess.Popen([sys.executable, __file__, '--serve', str(port)], cwd=str(BACKEND_DIR), env=env)
+    try:
+        deadline = time.time() + 20
+        while True:
+            with socket.socket() as s:
+                if s.connect_ex(('127.0.0.1', port)) == 0:
+                    break
+            if time.time() > deadline or server.poll() is not None:
+                raise SystemExit('benchmark server did not start')
+            time.sleep(0.1)
+        result = asyncio.run(_run(args, port, server.pid))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    run = {"commit": _git_commit(), "at": time.strftime('%Y-%m-%dT%H:%M:%S'), "guests": args.guests, "result": result}
+    print(json.dumps(run, indent=2))
+    if not args.no_save:
+        RESULTS_FILE.parent.mkdir(exist_ok=True)
+        with RESULTS_FILE.open('a') as f:
+            f.write(json.dumps(run) + '\n')
+
+
+if __name__ == '__main__':
+    main()
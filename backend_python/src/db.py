@@ -1,6 +1,8 @@
 import os
+import asyncio
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import UpdateOne
 from pymongo.errors import DuplicateKeyError
 
 logger = logging.getLogger(__name__)
@@ -37,9 +39,18 @@ def get_collections():
         'providers': database['providers'],
         'verificationTokens': database['verificationTokens'],
         'events': database['events'],
+        'meetupSeries': database['meetupSeries'],
+        'calendarFeeds': database['calendarFeeds'],
+        'reminderClaims': database['reminderClaims'],
+        'eventsArchive': database['eventsArchive'],
+        'eventSummaries': database['eventSummaries'],
         'automationProjects': database['automationProjects'],
         'automationTestCases': database['automationTestCases'],
         'automationTestRuns': database['automationTestRuns'],
+        'automationProjectRuns': database['automationProjectRuns'],
+        'automationJobs': database['automationJobs'],
+        'consultRequests': database['consultRequests'],
+        'messages': database['messages'],
     }
 
 
@@ -57,8 +68,27 @@ async def ensure_indexes():
         await collections['providers'].create_index("id", unique=True)
         await collections['providers'].create_index("email", unique=True)
         await collections['events'].create_index("id", unique=True)
-        await collections['events'].create_index([("requesterId", 1), ("start", 1)])
-        await collections['events'].create_index([("participantId", 1), ("start", 1)])
+        # Meetup listings and busy-interval scans: one user's events in (start, id) order
+        await collections['events'].create_index([("requesterId", 1), ("start", 1), ("id", 1)])
+        await collections['events'].create_index([("participantId", 1), ("start", 1), ("id", 1)])
+        # Reminder scheduler and archiver: meetups of one status by start time
+        await collections['events'].create_index([("status", 1), ("start", 1)])
+        await collections['reminderClaims'].create_index(
+            "createdAt",
+            expireAfterSeconds=60 * 60 * 24 * 2  # 2 days, longer than any reminder lead
+        )
+        # Archived meetups: history listings per side, and per-user counts
+        await collections['eventsArchive'].create_index("id", unique=True)
+        await collections['eventsArchive'].create_index([("requesterId", 1), ("start", 1), ("id", 1)])
+        await collections['eventsArchive'].create_index([("participantId", 1), ("start", 1), ("id", 1)])
+        await collections['eventSummaries'].create_index("userId", unique=True)
+        # Recurring meetups: a user's series that started before a window's end
+        await collections['meetupSeries'].create_index("id", unique=True)
+        await collections['meetupSeries'].create_index([("requesterId", 1), ("start", 1)])
+        await collections['meetupSeries'].create_index([("participantId", 1), ("start", 1)])
+        # Per-user .ics feeds: looked up by token hash, watermark moved by userId
+        await collections['calendarFeeds'].create_index("tokenHash", unique=True)
+        await collections['calendarFeeds'].create_index("userId", unique=True)
         await collections['verificationTokens'].create_index("token", unique=True)
         await collections['verificationTokens'].create_index(
             "createdAt", 
@@ -66,12 +96,36 @@ async def ensure_indexes():
         )
         # Automation indexes
         await collections['automationProjects'].create_index("id", unique=True)
-        await collections['automationProjects'].create_index("name")
+        # Project listing: name prefix filter and (name, id) keyset pages
+        await collections['automationProjects'].create_index([("name", 1), ("id", 1)])
         await collections['automationTestCases'].create_index("id", unique=True)
-        await collections['automationTestCases'].create_index("projectId")
+        # A project's test cases, in id order for batched project runs
+        await collections['automationTestCases'].create_index([("projectId", 1), ("id", 1)])
         await collections['automationTestRuns'].create_index("id", unique=True)
         await collections['automationTestRuns'].create_index("projectId")
         await collections['automationTestRuns'].create_index("testCaseId")
+        await collections['automationProjectRuns'].create_index("id", unique=True)
+        # Job queue: partial indexes only hold queued / leased jobs, so claiming and
+        # reaping stay one index seek however many finished jobs pile up
+        await collections['automationJobs'].create_index("id", unique=True)
+        await collections['automationJobs'].create_index("runId")
+        await collections['automationJobs'].create_index(
+            [("status", 1), ("priority", -1), ("createdAt", 1)],
+            partialFilterExpression={"status": "queued"}
+        )
+        await collections['automationJobs'].create_index(
+            [("status", 1), ("leaseExpiresAt", 1)],
+            partialFilterExpression={"status": "leased"}
+        )
+        # Consult request queue: pending lookups by specialization, oldest first
+        await collections['consultRequests'].create_index("id", unique=True)
+        await collections['consultRequests'].create_index([("status", 1), ("specialization", 1), ("createdAt", 1)])
+        await collections['consultRequests'].create_index(
+            "expiresAt",
+            expireAfterSeconds=int(os.getenv('CONSULT_RETENTION_SECONDS', 60 * 60 * 24))  # purge a day after expiry
+        )
+        # Consultation chat history, paged by seq within a conversation
+        await collections['messages'].create_index([("conversationId", 1), ("seq", 1)], unique=True)
         logger.info("[DB] Indexes created successfully")
     except DuplicateKeyError:
         logger.info("[DB] Indexes already exist")
@@ -92,3 +146,41 @@ async def ensure_seed_providers():
             logger.info("[SEED] Providers already exist, skipping seed")
     except Exception as e:
         logger.warning(f"[SEED] Seed providers failed: {e}")
+
+
+async def migrate_event_dates(batch_size: int = None) -> int:
+    """Convert meetup start/end from ISO strings to BSON dates, a batch at a time.
+
+    Runs in the background while the API serves traffic; each update only applies if
+    the event still holds the strings it was read with, so concurrent edits win.
+    """
+    from src.utils.dates import as_datetime
+    batch_size = batch_size or int(os.getenv('EVENT_MIGRATION_BATCH_SIZE', 500))
+    events = get_collections()['events']
+    skipped = []
+    migrated = 0
+    try:
+        while True:
+            docs = await events.find(
+                {"$or": [{"start": {"$type": "string"}}, {"end": {"$type": "string"}}], "id": {"$nin": skipped}},
+                {"_id": 0, "id": 1, "start": 1, "end": 1}
+            ).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            updates = []
+            for doc in docs:
+                try:
+                    fields = {k: as_datetime(doc[k]) for k in ("start", "end")}
+                except (KeyError, TypeError, ValueError):
+                    skipped.append(doc.get("id"))
+                    continue
+                updates.append(UpdateOne({"id": doc["id"], "start": doc["start"], "end": doc["end"]}, {"$set": fields}))
+            if updates:
+                await events.bulk_write(updates, ordered=False)
+                migrated += len(updates)
+            await asyncio.sleep(0)  # let requests in between batches
+    except Exception as e:
+        logger.error(f"[DB] Event date migration stopped: {e}")
+    if migrated or skipped:
+        logger.info(f"[DB] Migrated {migrated} event dates to BSON dates, skipped {len(skipped)} unparseable")
+    return migrated
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from pymongo import UpdateOne
+from typing import Dict, List, Optional
+import re
 import uuid
 from datetime import datetime
 import logging
 
 from src.db import get_collections
 from src.utils.auth import verify_token_middleware
+from src.services.automation_runs import cancel_project_run, create_project_run, execute_test_case, test_run_record
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/automation", tags=["automation"])
@@ -27,6 +30,7 @@ class ProjectResponse(BaseModel):
     framework: str = ""
     environment: str = ""
     createdAt: str
+    testCaseCount: int = 0
     testCases: List[dict] = []
 
 class TestCase(BaseModel):
@@ -54,29 +58,68 @@ class TestRun(BaseModel):
     createdAt: str
     results: dict = {}
 
+async def backfill_test_case_counts(collections, project_ids: List[str]) -> Dict[str, int]:
+    """Count test cases of projects created before `testCaseCount` was kept, in one aggregation"""
+    counts = {project_id: 0 for project_id in project_ids}
+    async for group in collections['automationTestCases'].aggregate([
+        {"$match": {"projectId": {"$in": project_ids}}},
+        {"$group": {"_id": "$projectId", "count": {"$sum": 1}}},
+    ]):
+        counts[group['_id']] = group['count']
+    await collections['automationProjects'].bulk_write([
+        UpdateOne({"id": project_id, "testCaseCount": {"$exists": False}}, {"$set": {"testCaseCount": count}})
+        for project_id, count in counts.items()
+    ], ordered=False)
+    return counts
+
+
+async def adjust_test_case_count(collections, project_id: str, amount: int):
+    # Projects without the counter yet are left to the backfill, which counts from scratch
+    await collections['automationProjects'].update_one(
+        {"id": project_id, "testCaseCount": {"$exists": True}},
+        {"$inc": {"testCaseCount": amount}}
+    )
+
+
 # Projects endpoints
 @router.get("/projects", response_model=List[ProjectResponse])
-async def get_projects(current_user: dict = Depends(verify_token_middleware)):
-    """Get all automation projects"""
+async def get_projects(
+    response: Response,
+    name: Optional[str] = Query(None, description="name prefix"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    current_user: dict = Depends(verify_token_middleware)
+):
+    """Get automation projects by name; the next page's cursor is in X-Next-Cursor"""
     collections = get_collections()
     
     try:
-        cursor = collections['automationProjects'].find({})
-        projects = await cursor.to_list(length=None)
-        
-        # Convert MongoDB _id to id and format response
-        result = []
+        query = {}
+        if name:
+            # Anchored and case-sensitive, so it is a range scan on the name index
+            query["name"] = {"$regex": f"^{re.escape(name)}"}
+        if cursor:
+            after_name, _, after_id = cursor.rpartition('|')
+            query["$or"] = [
+                {"name": {"$gt": after_name}},
+                {"name": after_name, "id": {"$gt": after_id}},
+            ]
+        projects = await collections['automationProjects'].find(query).sort(
+            [("name", 1), ("id", 1)]
+        ).limit(limit).to_list(limit)
         for project in projects:
             project['id'] = project.get('id', str(project['_id']))
             project.pop('_id', None)
-            
-            # Get test cases count for each project
-            test_cases_count = await collections['automationTestCases'].count_documents({"projectId": project['id']})
-            project['testCases'] = [{"count": test_cases_count}]
-            
-            result.append(project)
         
-        return result
+        missing = [p['id'] for p in projects if 'testCaseCount' not in p]
+        counts = await backfill_test_case_counts(collections, missing) if missing else {}
+        for project in projects:
+            project['testCaseCount'] = project.get('testCaseCount', counts.get(project['id'], 0))
+            project['testCases'] = [{"count": project['testCaseCount']}]
+        
+        if len(projects) == limit:
+            response.headers["X-Next-Cursor"] = f"{projects[-1]['name']}|{projects[-1]['id']}"
+        return projects
     except Exception as e:
         logger.error(f"Error fetching projects: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch projects")
@@ -96,6 +139,7 @@ async def create_project(project: Project, current_user: dict = Depends(verify_t
             "framework": project.framework,
             "environment": project.environment,
             "createdAt": datetime.utcnow().isoformat(),
+            "testCaseCount": 0,
             "testCases": []
         }
         
@@ -125,6 +169,7 @@ async def get_project(project_id: str, current_user: dict = Depends(verify_token
         project['id'] = project.get('id', str(project['_id']))
         project.pop('_id', None)
         project['testCases'] = [{"id": tc.get('id', str(tc['_id'])), "name": tc.get('name', '')} for tc in test_cases]
+        project['testCaseCount'] = len(test_cases)
         
         return project
     except HTTPException:
@@ -178,6 +223,7 @@ async def create_test_case(test_case: TestCase, current_user: dict = Depends(ver
         }
         
         await collections['automationTestCases'].insert_one(test_case_data)
+        await adjust_test_case_count(collections, test_case.projectId, 1)
         
         test_case_data.pop('_id', None)
         return test_case_data
@@ -218,113 +264,87 @@ async def run_test_case(test_case_id: str, current_user: dict = Depends(verify_t
         if not test_case:
             raise HTTPException(status_code=404, detail="Test case not found")
         
-        # Simulate test execution (in real implementation, this would trigger actual test runner)
-        import random
-        result = random.choice(["passed", "failed"])
-        duration = random.randint(1000, 5000)  # milliseconds
+        outcome = await execute_test_case(test_case)
         
         # Create test run record
-        run_id = str(uuid.uuid4())
-        test_run_data = {
-            "id": run_id,
-            "projectId": test_case["projectId"],
-            "testCaseId": test_case_id,
-            "status": result,
-            "duration": duration,
-            "createdAt": datetime.utcnow().isoformat(),
-            "results": {
-                "steps": len(test_case.get("steps", "").split("\n")),
-                "assertions": random.randint(1, 10),
-                "screenshots": random.randint(0, 3)
-            }
-        }
-        
+        test_run_data = test_run_record(test_case, outcome)
         await collections['automationTestRuns'].insert_one(test_run_data)
         
         # Update test case with latest result
         await collections['automationTestCases'].update_one(
             {"id": test_case_id},
             {"$set": {
-                "lastResult": result,
-                "lastRun": datetime.utcnow().isoformat()
+                "lastResult": outcome["status"],
+                "lastRun": test_run_data["createdAt"]
             }}
         )
         
-        return {"message": "Test case executed", "result": result, "duration": duration}
+        return {
+            "message": "Test case executed",
+            "result": outcome["status"],
+            "duration": outcome["duration"],
+            "error": outcome.get("error")
+        }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error running test case {test_case_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to run test case")
 
-@router.post("/projects/{project_id}/run")
-async def run_project_tests(project_id: str, current_user: dict = Depends(verify_token_middleware)):
-    """Run all test cases in a project"""
+@router.post("/projects/{project_id}/run", status_code=202)
+async def run_project_tests(
+    project_id: str,
+    priority: int = Query(0, ge=-100, le=100, description="higher runs are claimed by workers first"),
+    current_user: dict = Depends(verify_token_middleware)
+):
+    """Queue a run of all test cases in a project; poll GET /automation/runs/{runId} for progress"""
     collections = get_collections()
     
     try:
-        # Get all test cases for the project
-        cursor = collections['automationTestCases'].find({"projectId": project_id})
-        test_cases = await cursor.to_list(length=None)
-        
-        if not test_cases:
+        total = await collections['automationTestCases'].count_documents({"projectId": project_id})
+        if not total:
             raise HTTPException(status_code=404, detail="No test cases found for this project")
         
-        results = []
-        total_duration = 0
-        
-        for test_case in test_cases:
-            # Simulate test execution
-            import random
-            result = random.choice(["passed", "failed"])
-            duration = random.randint(1000, 5000)
-            total_duration += duration
-            
-            # Create test run record
-            run_id = str(uuid.uuid4())
-            test_run_data = {
-                "id": run_id,
-                "projectId": project_id,
-                "testCaseId": test_case.get("id", str(test_case["_id"])),
-                "status": result,
-                "duration": duration,
-                "createdAt": datetime.utcnow().isoformat(),
-                "results": {
-                    "steps": len(test_case.get("steps", "").split("\n")),
-                    "assertions": random.randint(1, 10),
-                    "screenshots": random.randint(0, 3)
-                }
-            }
-            
-            await collections['automationTestRuns'].insert_one(test_run_data)
-            
-            # Update test case with latest result
-            await collections['automationTestCases'].update_one(
-                {"id": test_case.get("id", str(test_case["_id"]))},
-                {"$set": {
-                    "lastResult": result,
-                    "lastRun": datetime.utcnow().isoformat()
-                }}
-            )
-            
-            results.append({
-                "testCaseId": test_case.get("id", str(test_case["_id"])),
-                "name": test_case["name"],
-                "result": result,
-                "duration": duration
-            })
-        
-        return {
-            "message": f"Executed {len(test_cases)} test cases",
-            "totalDuration": total_duration,
-            "results": results
-        }
+        run = await create_project_run(collections, project_id, total, priority)
+        return {"message": f"Queued {total} test cases", "runId": run['id'], "status": run['status']}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error running project tests {project_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to run project tests")
 
+@router.get("/runs/{run_id}")
+async def get_project_run(run_id: str, current_user: dict = Depends(verify_token_middleware)):
+    """Status and progress of a project run"""
+    collections = get_collections()
+    
+    try:
+        run = await collections['automationProjectRuns'].find_one({"id": run_id}, {"_id": 0})
+        if not run:
+            raise HTTPException(status_code=404, detail="Run not found")
+        return run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching project run {run_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch project run")
+
+@router.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: str, current_user: dict = Depends(verify_token_middleware)):
+    """Cancel a queued or running project run"""
+    collections = get_collections()
+    
+    try:
+        if not await cancel_project_run(collections, run_id):
+            raise HTTPException(status_code=409, detail="Run is not queued or running")
+        run = await collections['automationProjectRuns'].find_one({"id": run_id}, {"_id": 0, "status": 1})
+        return {"message": "Run cancelled" if run['status'] == 'cancelled' else "Run cancelling", "runId": run_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error cancelling project run {run_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to cancel project run")
+
 @router.get("/projects/{project_id}/runs")
 async def get_project_runs(project_id: str, current_user: dict = Depends(verify_token_middleware)):
     """Get test run history for a project"""
@@ -393,6 +413,8 @@ async def update_test_case(test_case_id: str, test_case: TestCase, current_user:
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
+        previous_project_id = existing_test_case.get('projectId')
+        
         # Update test case
         update_data = {
             "name": test_case.name,
@@ -410,6 +432,10 @@ async def update_test_case(test_case_id: str, test_case: TestCase, current_user:
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="Failed to update test case")
         
+        if previous_project_id != test_case.projectId:
+            await adjust_test_case_count(collections, previous_project_id, -1)
+            await adjust_test_case_count(collections, test_case.projectId, 1)
+        
         # Get updated test case
         updated_test_case = await collections['automationTestCases'].find_one({"id": test_case_id})
         updated_test_case['id'] = updated_test_case.get('id', str(updated_test_case['_id']))
@@ -428,9 +454,11 @@ async def delete_test_case(test_case_id: str, current_user: dict = Depends(verif
     collections = get_collections()
     
     try:
+        test_case = await collections['automationTestCases'].find_one({"id": test_case_id}, {"_id": 0, "projectId": 1})
         result = await collections['automationTestCases'].delete_one({"id": test_case_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Test case not found")
+        await adjust_test_case_count(collections, test_case.get('projectId'), -1)
         
         # Also delete associated test runs
         await collections['automationTestRuns'].delete_many({"testCaseId": test_case_id})
@@ -0,0 +1,94 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+
+from ..utils.auth import verify_token_middleware
+from ..services.consult_requests import ConsultRequestStore
+from ..ws import matchmaking
+from ..ws.topics import normalize_specialization
+
+router = APIRouter()
+
+
+def _require_provider(user: dict):
+    if user.get("role") not in ("provider", "admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="providers only"
+        )
+
+
+def _encode_cursor(doc: dict) -> str:
+    return f"{doc['createdAt'].isoformat()}|{doc['id']}"
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, request_id = cursor.split("|", 1)
+        return datetime.fromisoformat(created_at), request_id
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="invalid cursor"
+        )
+
+
+def _store() -> ConsultRequestStore:
+    return matchmaking.manager.engine.store
+
+
+@router.get("/pending")
+async def list_pending_consults(
+    specialization: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    user: dict = Depends(verify_token_middleware)
+):
+    """Unclaimed consult requests, oldest first; providers load this when they connect"""
+    _require_provider(user)
+    items = await _store().pending(
+        normalize_specialization(specialization),
+        limit,
+        _decode_cursor(cursor) if cursor else None
+    )
+    return {
+        "items": items,
+        "nextCursor": _encode_cursor(items[-1]) if len(items) == limit else None
+    }
+
+
+@router.post("/{request_id}/claim")
+async def claim_consult(request_id: str, user: dict = Depends(verify_token_middleware)):
+    """Take a pending request; when several providers race, exactly one wins"""
+    _require_provider(user)
+    claimed, doc = await _store().claim(request_id, user.get("id"))
+    if not claimed or doc is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="request already claimed or expired"
+        )
+    await matchmaking.manager.engine.claimed(request_id, user.get("id"), doc)
+    return doc
+
+
+@router.get("/{request_id}/messages")
+async def list_consult_messages(
+    request_id: str,
+    before: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    user: dict = Depends(verify_token_middleware)
+):
+    """Chat history of a consult, newest first; page back with nextBefore"""
+    if user.get("role") != "admin":
+        doc = await _store().get(request_id)
+        participants = {doc.get("requesterId"), doc.get("providerId")} if doc else set()
+        if user.get("id") not in participants:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="not a participant of this consult"
+            )
+    items = await matchmaking.manager.chat.history(request_id, before, limit)
+    return {
+        "items": items,
+        "nextBefore": items[-1]["seq"] if len(items) == limit else None
+    }
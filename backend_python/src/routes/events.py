@@ -0,0 +1,59 @@
+import asyncio
+import uuid
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+from ..utils.auth import verify_token
+from ..ws import matchmaking
+from ..ws.streams import StreamSubscriber, format_event, parse_event_id, SSE_KEEPALIVE_SECONDS, SSE_RETRY_MS
+
+router = APIRouter()
+optional_bearer = HTTPBearer(auto_error=False)
+
+
+@router.get("/stream")
+async def event_stream(
+    token: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Query(None, alias="lastEventId"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer)
+):
+    """Server-Sent Events: the same notifications as /ws, one way, for clients that only listen.
+
+    EventSource cannot set headers, so the token may also come as ?token=.
+    """
+    raw_token = credentials.credentials if credentials else token
+    if not raw_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"error": "missing token"}
+        )
+    user_data = verify_token(raw_token)
+
+    manager = matchmaking.manager
+    subscriber = StreamSubscriber(f"sse_{uuid.uuid4().hex}", user_data, matchmaking.SEND_QUEUE_SIZE)
+    # The browser resends the last id it saw in Last-Event-ID when it reconnects
+    since = parse_event_id(last_event_id_header or last_event_id)
+
+    async def _events():
+        # Registered once the response starts, so the finally below always unregisters it
+        manager.connect_stream(subscriber, since)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while manager.active_connections.get(subscriber.connection_id) is subscriber:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(frame)
+        finally:
+            manager.disconnect(subscriber.connection_id)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
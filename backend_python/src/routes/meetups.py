@@ -1,11 +1,29 @@
+import re
+import json
+import heapq
+import itertools
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional, List
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, validator
 
 from ..db import get_collections
 from ..utils.auth import verify_token_middleware, normalize_email
+from ..ws import matchmaking
+from ..ws.topics import user_topic
+from ..utils.dates import as_datetime, iso, stored, to_utc
+from ..services.availability import (
+    MEETUP_MAX_DURATION, busy_bitmap, busy_intervals, busy_slots, conflicts, first_free_run, free_slots
+)
+from ..services import calendar_feed
+from ..services.event_archive import TERMINAL_STATUSES
+from ..services.reminders import scheduler as reminder_scheduler
+from ..services.recurrence import (
+    FREQUENCIES, MAX_COUNT, SERIES_CONFLICT_HORIZON, last_end, occurrence_at, occurrences,
+    overlapping_query, series_id_of
+)
 
 router = APIRouter()
 
@@ -44,6 +62,44 @@ class MeetupUpdate(BaseModel):
         return v
 
 
+class MeetupSeriesCreate(MeetupCreate):
+    freq: str  # daily | weekly
+    interval: int = 1
+    count: Optional[int] = None
+    until: Optional[str] = None  # ISO datetime string; last occurrence starts at or before it
+
+    @validator('freq')
+    def valid_freq(cls, v):
+        if v not in FREQUENCIES:
+            raise ValueError(f'freq must be one of {", ".join(FREQUENCIES)}')
+        return v
+
+    @validator('interval')
+    def valid_interval(cls, v):
+        if not 1 <= v <= 52:
+            raise ValueError('interval must be between 1 and 52')
+        return v
+
+    @validator('count')
+    def valid_count(cls, v):
+        if v is not None and not 1 <= v <= MAX_COUNT:
+            raise ValueError(f'count must be between 1 and {MAX_COUNT}')
+        return v
+
+
+class MeetupSeriesUpdate(BaseModel):
+    status: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    skip: Optional[List[str]] = None  # occurrence start times to drop from the series
+
+    @validator('status')
+    def valid_status(cls, v):
+        if v is not None and v not in ['scheduled', 'cancelled']:
+            raise ValueError('Status must be scheduled or cancelled')
+        return v
+
+
 def parse_datetime(date_string: str) -> datetime:
     """Parse ISO datetime string"""
     try:
@@ -55,6 +111,101 @@ def parse_datetime(date_string: str) -> datetime:
         )
 
 
+def check_duration(start_date: datetime, end_date: datetime):
+    if end_date <= start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    if end_date - start_date > MEETUP_MAX_DURATION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Meetups can last at most {MEETUP_MAX_DURATION}"
+        )
+
+
+def public_event(event: dict) -> dict:
+    """Event as returned by the API: start/end as ISO strings"""
+    event = {k: v for k, v in event.items() if k != '_id'}
+    for field in ('start', 'end'):
+        if field in event:
+            event[field] = iso(event[field])
+    return event
+
+
+def public_series(series: dict) -> dict:
+    """Series as returned by the API: dates as ISO strings"""
+    series = public_event(series)
+    for field in ('until', 'lastEnd'):
+        if series.get(field) is not None:
+            series[field] = iso(series[field])
+    series['exdates'] = [iso(d) for d in series.get('exdates') or []]
+    return series
+
+
+def check_access(event: dict, user: dict):
+    if (event['requesterId'] != user.get("id") and
+        event['participantId'] != user.get("id") and
+        user.get("role") != 'admin'):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="forbidden"
+        )
+
+
+async def find_target_user(collections, user_role: str, target_id: str):
+    """The other side of a meetup: consumers book providers and vice versa"""
+    target_user = None
+    target_role = None
+    
+    if user_role == "consumer":
+        target_user = await collections['providers'].find_one({"id": target_id})
+        target_role = "provider"
+    elif user_role == "provider":
+        target_user = await collections['consumers'].find_one({"id": target_id})
+        target_role = "consumer"
+    
+    if not target_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="target user not found"
+        )
+    return target_role
+
+
+async def notify_participants(event: dict, message: dict):
+    """Push a meetup change to every connection of both participants (all workers)"""
+    payload = json.dumps(message)
+    for user_id in {event['requesterId'], event['participantId']}:
+        await matchmaking.manager.publish(user_topic(user_id), payload)
+
+
+def changed_fields(update_fields: dict) -> dict:
+    return {k: iso(v) if k in ('start', 'end') else v for k, v in update_fields.items()}
+
+
+def encode_cursor(event: dict) -> str:
+    return f"{iso(event['start'])}|{event['id']}"
+
+
+def decode_cursor(cursor: str):
+    try:
+        start, event_id = cursor.split("|", 1)
+        return stored(datetime.fromisoformat(start)), event_id
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="invalid cursor"
+        )
+
+
+def conflict_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="overlaps another scheduled meetup"
+    )
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_meetup(
     meetup_data: MeetupCreate,
@@ -73,32 +224,13 @@ async def create_meetup(
         )
     
     # Parse and validate dates
-    start_date = parse_datetime(meetup_data.start)
-    end_date = parse_datetime(meetup_data.end)
-    
-    if end_date <= start_date:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="End time must be after start time"
-        )
+    start_date = to_utc(parse_datetime(meetup_data.start))
+    end_date = to_utc(parse_datetime(meetup_data.end))
+    check_duration(start_date, end_date)
     
     # Find target user
     collections = get_collections()
-    target_user = None
-    target_role = None
-    
-    if user_role == "consumer":
-        target_user = await collections['providers'].find_one({"id": meetup_data.targetUserId})
-        target_role = "provider"
-    elif user_role == "provider":
-        target_user = await collections['consumers'].find_one({"id": meetup_data.targetUserId})
-        target_role = "consumer"
-    
-    if not target_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="target user not found"
-        )
+    target_role = await find_target_user(collections, user_role, meetup_data.targetUserId)
     
     # Create event
     event_id = str(uuid.uuid4())
@@ -107,8 +239,8 @@ async def create_meetup(
         "type": "meetup",
         "title": meetup_data.title or "Meetup",
         "description": meetup_data.description or "",
-        "start": start_date.isoformat(),
-        "end": end_date.isoformat(),
+        "start": stored(start_date),
+        "end": stored(end_date),
         "createdAt": datetime.now().timestamp() * 1000,  # milliseconds
         "requesterId": user_id,
         "requesterRole": user_role,
@@ -117,17 +249,33 @@ async def create_meetup(
         "status": "scheduled"
     }
     
+    # Insert, then look for overlaps: of two racing bookings at least one sees the
+    # other and backs out, so a double booking never survives
     await collections['events'].insert_one(event)
+    if await conflicts(collections, (user_id, meetup_data.targetUserId), [(start_date, end_date)], exclude_id=event_id):
+        await collections['events'].delete_one({"id": event_id})
+        raise conflict_error()
+    await calendar_feed.touch(collections, (user_id, meetup_data.targetUserId))
     
     # Remove MongoDB _id from response
-    event.pop('_id', None)
-    
-    return event
+    reminder_scheduler.schedule(event)
+    created = public_event(event)
+    await notify_participants(event, {"type": "meetup.created", "by": user_id, "meetup": created})
+    return created
 
 
 @router.get("/")
-async def get_meetups(user: dict = Depends(verify_token_middleware)):
-    """List events for current user"""
+async def get_meetups(
+    response: Response,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = Query(None),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    archived: bool = Query(False, description="list archived (finished, older) meetups instead"),
+    user: dict = Depends(verify_token_middleware)
+):
+    """List events for current user, by start time; the next page's cursor is in X-Next-Cursor"""
     user_id = user.get("id")
     
     if not user_id:
@@ -138,39 +286,357 @@ async def get_meetups(user: dict = Depends(verify_token_middleware)):
     
     collections = get_collections()
     
-    # Find events where user is requester or participant
-    events = await collections['events'].find(
-        {
-            "$or": [
-                {"requesterId": user_id},
-                {"participantId": user_id}
+    window = {}
+    if from_:
+        window["$gte"] = stored(parse_datetime(from_))
+    if to:
+        window["$lt"] = stored(parse_datetime(to))
+    after = decode_cursor(cursor) if cursor else None
+    lower = max(filter(None, (window.get("$gte"), after and after[0])), default=None)
+    
+    def listed(occurrence: dict) -> bool:
+        if lower is not None and occurrence['start'] < window.get("$gte", lower):
+            return False
+        return after is None or (occurrence['start'], occurrence['id']) > after
+    
+    # One indexed scan per side of the meetup, each already in (start, id) order and
+    # cut at `limit`; merging them costs the page, not the user's whole history
+    pages = []
+    for field in ("requesterId", "participantId"):
+        query = {field: user_id}
+        if window:
+            query["start"] = dict(window)
+        if status_filter:
+            query["status"] = status_filter
+        if after:
+            query["$or"] = [
+                {"start": {"$gt": after[0]}},
+                {"start": after[0], "id": {"$gt": after[1]}},
             ]
-        },
-        {"_id": 0}
+        pages.append(await collections['eventsArchive' if archived else 'events'].find(query, {"_id": 0}).sort(
+            [("start", 1), ("id", 1)]
+        ).limit(limit).to_list(limit))
+        if archived:
+            continue
+        
+        # Recurring series: occurrences are generated in order and only as far as the page needs
+        series_query = overlapping_query(field, user_id, lower, window.get("$lt"))
+        if status_filter:
+            series_query["status"] = status_filter
+        for series in await collections['meetupSeries'].find(series_query, {"_id": 0}).to_list(None):
+            expanded = occurrences(series, lower or as_datetime(series['start']), window.get("$lt"))
+            pages.append(o for o in expanded if listed(o))
+    
+    merged = heapq.merge(*pages, key=lambda e: (as_datetime(e['start']), e['id']))
+    events = list(itertools.islice(merged, limit))
+    if len(events) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(events[-1])
+    
+    return [public_event(e) for e in events]
+
+
+@router.get("/availability")
+async def get_availability(
+    providerId: str,
+    from_: str = Query(..., alias="from"),
+    to: str = Query(...),
+    slot: int = Query(30, ge=5, le=24 * 60, description="slot length in minutes"),
+    user: dict = Depends(verify_token_middleware)
+):
+    """Free slots of a provider between `from` and `to`"""
+    start_date = to_utc(parse_datetime(from_))
+    end_date = to_utc(parse_datetime(to))
+    if end_date <= start_date or end_date - start_date > timedelta(days=31):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="range must be positive and at most 31 days"
+        )
+    
+    collections = get_collections()
+    if not await collections['providers'].find_one({"id": providerId}, {"_id": 0, "id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="provider not found"
+        )
+    
+    busy = await busy_intervals(collections, providerId, start_date, end_date)
+    slots = free_slots(busy, start_date, end_date, timedelta(minutes=slot))
+    return {
+        "providerId": providerId,
+        "slotMinutes": slot,
+        "free": [{"start": iso(a), "end": iso(b)} for a, b in slots]
+    }
+
+
+@router.get("/availability/providers")
+async def search_available_providers(
+    from_: str = Query(..., alias="from"),
+    to: str = Query(...),
+    duration: int = Query(30, ge=5, le=24 * 60, description="minutes the provider must be free"),
+    slot: int = Query(15, ge=5, le=24 * 60, description="slot length in minutes"),
+    specialization: Optional[str] = Query(None),
+    user: dict = Depends(verify_token_middleware)
+):
+    """Active providers with `duration` free minutes between `from` and `to`, earliest first"""
+    start_date = to_utc(parse_datetime(from_))
+    end_date = to_utc(parse_datetime(to))
+    if end_date <= start_date or end_date - start_date > timedelta(days=31):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="range must be positive and at most 31 days"
+        )
+    
+    collections = get_collections()
+    query = {"active": True}
+    if specialization and specialization.strip():
+        query["specialization"] = {"$regex": f"^{re.escape(specialization.strip())}$", "$options": "i"}
+    providers = await collections['providers'].find(
+        query, {"_id": 0, "id": 1, "name": 1, "specialization": 1}
     ).to_list(None)
+    slot_length = timedelta(minutes=slot)
+    busy = await busy_slots(collections, [p['id'] for p in providers], start_date, end_date, slot_length)
+    
+    # One bit per slot: a provider is free when `length` consecutive bits are clear
+    slots = -(-(end_date - start_date) // slot_length)
+    length = -(-duration // slot)
+    available = []
+    for provider in providers:
+        first = first_free_run(busy_bitmap(busy.get(provider['id'], ()), slots), slots, length)
+        if first is not None and start_date + slot_length * first + timedelta(minutes=duration) <= end_date:
+            available.append((first, provider))
+    available.sort(key=lambda a: (a[0], a[1]['id']))
+    return {
+        "slotMinutes": slot,
+        "durationMinutes": duration,
+        "providers": [
+            {
+                "providerId": p['id'],
+                "name": p.get('name'),
+                "specialization": p.get('specialization'),
+                "firstFree": iso(start_date + slot_length * first)
+            }
+            for first, p in available
+        ]
+    }
+
+
+@router.post("/series", status_code=status.HTTP_201_CREATED)
+async def create_meetup_series(
+    series_data: MeetupSeriesCreate,
+    user: dict = Depends(verify_token_middleware)
+):
+    """Create a recurring meetup, stored once and expanded when read"""
+    user_role = user.get("role")
+    user_id = user.get("id")
     
-    # Sort by start time
-    events.sort(key=lambda x: datetime.fromisoformat(x['start'].replace('Z', '+00:00')))
+    if user_role not in ["consumer", "provider"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="only authenticated consumer or provider can create meetups"
+        )
     
-    return events
+    start_date = to_utc(parse_datetime(series_data.start))
+    end_date = to_utc(parse_datetime(series_data.end))
+    check_duration(start_date, end_date)
+    period = FREQUENCIES[series_data.freq] * series_data.interval
+    if end_date - start_date >= period:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="occurrences of a series must not overlap each other"
+        )
+    until = to_utc(parse_datetime(series_data.until)) if series_data.until else None
+    if until is not None and until < start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="until must not be before start"
+        )
+    
+    collections = get_collections()
+    target_role = await find_target_user(collections, user_role, series_data.targetUserId)
+    
+    series = {
+        "id": str(uuid.uuid4()),
+        "type": "series",
+        "title": series_data.title or "Meetup",
+        "description": series_data.description or "",
+        "start": stored(start_date),
+        "end": stored(end_date),
+        "freq": series_data.freq,
+        "interval": series_data.interval,
+        "count": series_data.count,
+        "until": stored(until) if until else None,
+        "exdates": [],
+        "createdAt": datetime.now().timestamp() * 1000,  # milliseconds
+        "requesterId": user_id,
+        "requesterRole": user_role,
+        "participantId": series_data.targetUserId,
+        "participantRole": target_role,
+        "status": "scheduled"
+    }
+    series["lastEnd"] = last_end(series)
+    
+    # Same insert-then-verify rule as single meetups, over the series' first
+    # MEETUP_SERIES_HORIZON_DAYS (its whole length when it is shorter)
+    await collections['meetupSeries'].insert_one(series)
+    intervals = [(o['start'], o['end']) for o in occurrences(series, start_date, start_date + SERIES_CONFLICT_HORIZON)]
+    if await conflicts(collections, (user_id, series_data.targetUserId), intervals, exclude_id=series["id"]):
+        await collections['meetupSeries'].delete_one({"id": series["id"]})
+        raise conflict_error()
+    await calendar_feed.touch(collections, (user_id, series_data.targetUserId))
+    
+    reminder_scheduler.schedule_series(series)
+    created = public_series(series)
+    await notify_participants(series, {"type": "meetup.created", "by": user_id, "meetup": created})
+    return created
+
+
+@router.get("/series/{series_id}")
+async def get_meetup_series(
+    series_id: str,
+    user: dict = Depends(verify_token_middleware)
+):
+    """Get a recurring meetup's rule (must be participant)"""
+    series = await get_collections()['meetupSeries'].find_one({"id": series_id}, {"_id": 0})
+    if not series:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="not found"
+        )
+    check_access(series, user)
+    return public_series(series)
+
+
+@router.patch("/series/{series_id}")
+async def update_meetup_series(
+    series_id: str,
+    update_data: MeetupSeriesUpdate,
+    user: dict = Depends(verify_token_middleware)
+):
+    """Cancel a series, edit its details, or skip single occurrences"""
+    collections = get_collections()
+    series = await collections['meetupSeries'].find_one({"id": series_id}, {"_id": 0})
+    if not series:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="not found"
+        )
+    check_access(series, user)
+    
+    update = {}
+    update_fields = {k: v for k, v in (
+        ('status', update_data.status), ('title', update_data.title), ('description', update_data.description)
+    ) if v is not None}
+    if update_fields:
+        update["$set"] = update_fields
+    if update_data.skip:
+        update["$addToSet"] = {"exdates": {"$each": [stored(parse_datetime(d)) for d in update_data.skip]}}
+    if update:
+        await collections['meetupSeries'].update_one({"id": series_id}, update)
+        if update_fields.get('status') == 'scheduled' and series.get('status') != 'scheduled':
+            # Re-activated: upcoming slots may have been booked in the meantime
+            start_date = max(as_datetime(series['start']), to_utc(datetime.utcnow()))
+            horizon = start_date + SERIES_CONFLICT_HORIZON
+            intervals = [(o['start'], o['end']) for o in occurrences(series, start_date, horizon)]
+            if await conflicts(collections, (series['requesterId'], series['participantId']), intervals, exclude_id=series_id):
+                await collections['meetupSeries'].update_one({"id": series_id}, {"$set": {"status": series.get('status')}})
+                raise conflict_error()
+        matchmaking.manager.signaling.forget(series_id)
+        await calendar_feed.touch(collections, (series['requesterId'], series['participantId']))
+    
+    updated_series = await collections['meetupSeries'].find_one({"id": series_id}, {"_id": 0})
+    if update:
+        reminder_scheduler.schedule_series(updated_series)
+    updated_series = public_series(updated_series)
+    if update:
+        changes = {**update_fields, **({"exdates": updated_series["exdates"]} if update_data.skip else {})}
+        await notify_participants(series, {"type": "meetup.updated", "by": user.get("id"),
+                                           "meetupId": series_id, "changes": changes})
+    return updated_series
+
+
+@router.post("/calendar/token")
+async def create_calendar_feed(user: dict = Depends(verify_token_middleware)):
+    """Issue (or rotate) the secret URL of the current user's .ics feed"""
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="unauthorized"
+        )
+    
+    token = calendar_feed.new_token()
+    await get_collections()['calendarFeeds'].update_one(
+        {"userId": user_id},
+        {"$set": {"tokenHash": calendar_feed.token_hash(token),
+                  "changedAt": to_utc(datetime.utcnow()).replace(microsecond=0)},
+         "$inc": {"version": 1}},
+        upsert=True
+    )
+    return {"url": f"/meetups/calendar/{token}.ics"}
+
+
+@router.get("/calendar/{token}.ics")
+async def get_calendar_feed(
+    token: str,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
+    """The user's meetups as iCalendar; the token in the URL is the credential"""
+    collections = get_collections()
+    feed = await collections['calendarFeeds'].find_one({"tokenHash": calendar_feed.token_hash(token)}, {"_id": 0})
+    if not feed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="not found"
+        )
+    
+    headers = {
+        "ETag": calendar_feed.etag(feed),
+        "Last-Modified": calendar_feed.last_modified(feed["changedAt"]),
+        "Cache-Control": "private, no-cache"
+    }
+    # Unchanged since the client's copy: answered from the feed document alone
+    if calendar_feed.not_modified(feed, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return StreamingResponse(
+        calendar_feed.stream(collections, feed["userId"]),
+        media_type="text/calendar; charset=utf-8",
+        headers=headers
+    )
+
+
+@router.get("/summary")
+async def get_meetup_summary(user: dict = Depends(verify_token_middleware)):
+    """Counts of the current user's archived meetups by status"""
+    collections = get_collections()
+    summary = await collections['eventSummaries'].find_one({"userId": user.get("id")}, {"_id": 0}) or {}
+    return {
+        "userId": user.get("id"),
+        "archived": {s: summary.get(s, 0) for s in TERMINAL_STATUSES}
+    }
 
 
 @router.get("/{event_id}")
 async def get_meetup(
     event_id: str,
+    archived: bool = Query(False, description="look the meetup up in the archive"),
     user: dict = Depends(verify_token_middleware)
 ):
     """Get single event (must be participant)"""
-    user_id = user.get("id")
-    user_role = user.get("role")
-    
     collections = get_collections()
     
-    event = await collections['events'].find_one(
+    event = await collections['eventsArchive' if archived else 'events'].find_one(
         {"id": event_id},
         {"_id": 0}
     )
     
+    series_id = series_id_of(event_id)
+    if not event and series_id and not archived:
+        # One occurrence of a recurring series
+        series = await collections['meetupSeries'].find_one({"id": series_id}, {"_id": 0})
+        event = series and occurrence_at(series, int(event_id.rsplit(':', 1)[1]))
+    
     if not event:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -178,15 +644,9 @@ async def get_meetup(
         )
     
     # Check if user has access to this event
-    if (event['requesterId'] != user_id and 
-        event['participantId'] != user_id and 
-        user_role != 'admin'):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="forbidden"
-        )
+    check_access(event, user)
     
-    return event
+    return public_event(event)
 
 
 @router.patch("/{event_id}")
@@ -232,34 +692,46 @@ async def update_meetup(
         update_fields['description'] = update_data.description
     
     if update_data.start is not None:
-        start_date = parse_datetime(update_data.start)
-        update_fields['start'] = start_date.isoformat()
+        update_fields['start'] = stored(parse_datetime(update_data.start))
     
     if update_data.end is not None:
-        end_date = parse_datetime(update_data.end)
-        update_fields['end'] = end_date.isoformat()
-    
-    # Validate that end is still after start if both are being updated
-    if 'start' in update_fields and 'end' in update_fields:
-        start_dt = datetime.fromisoformat(update_fields['start'].replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(update_fields['end'].replace('Z', '+00:00'))
-        if end_dt <= start_dt:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="End time must be after start time"
-            )
+        update_fields['end'] = stored(parse_datetime(update_data.end))
+    
+    # Validate the resulting time range
+    start_dt = as_datetime(update_fields.get('start', event['start']))
+    end_dt = as_datetime(update_fields.get('end', event['end']))
+    if 'start' in update_fields or 'end' in update_fields:
+        check_duration(start_dt, end_dt)
     
     # Update the event
     if update_fields:
+        previous = {k: event.get(k) for k in update_fields}
         await collections['events'].update_one(
             {"id": event_id},
             {"$set": update_fields}
         )
+        # Moved or re-scheduled: same insert-then-verify rule as creation
+        rescheduled = 'start' in update_fields or 'end' in update_fields or update_fields.get('status') == 'scheduled'
+        if (rescheduled and update_fields.get('status', event.get('status')) == 'scheduled'
+                and await conflicts(collections, (event['requesterId'], event['participantId']),
+                                    [(start_dt, end_dt)], exclude_id=event_id)):
+            await collections['events'].update_one(
+                {"id": event_id},
+                {"$set": previous}
+            )
+            raise conflict_error()
+        # A cancelled meetup must stop relaying call signaling right away
+        matchmaking.manager.signaling.forget(event_id)
+        await calendar_feed.touch(collections, (event['requesterId'], event['participantId']))
+        await notify_participants(event, {"type": "meetup.updated", "by": user_id,
+                                          "meetupId": event_id, "changes": changed_fields(update_fields)})
     
     # Return updated event
     updated_event = await collections['events'].find_one(
         {"id": event_id},
         {"_id": 0}
     )
+    if update_fields:
+        reminder_scheduler.schedule(updated_event)
     
-    return updated_event
+    return public_event(updated_event)
@@ -0,0 +1,16 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+
+from ..utils.auth import verify_token_middleware
+from ..ws import matchmaking
+
+router = APIRouter()
+
+
+@router.get("/providers")
+async def get_online_providers(
+    specialization: Optional[str] = Query(None),
+    user: dict = Depends(verify_token_middleware)
+):
+    """Providers with an open WebSocket on any worker (served from memory, never hits Mongo)"""
+    return matchmaking.manager.presence.providers(specialization)
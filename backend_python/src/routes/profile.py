@@ -4,6 +4,7 @@ from pydantic import BaseModel, validator
 
 from ..db import get_collections
 from ..utils.auth import verify_token_middleware, normalize_email
+from ..ws import matchmaking
 
 router = APIRouter()
 
@@ -170,6 +171,10 @@ async def update_profile(
         {"$set": update_data}
     )
     
+    # Re-route live sockets when a provider's specialization changes
+    if role == "provider" and 'specialization' in update_data:
+        await matchmaking.manager.update_profile(user_id, {"specialization": update_data['specialization']})
+    
     # Get updated user data
     updated_user = await collection.find_one({"id": user_id})
     
@@ -0,0 +1,182 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Set
+
+from pymongo import ReturnDocument
+
+from . import automation_runs
+
+logger = logging.getLogger(__name__)
+
+# A claimed job belongs to its worker until the lease runs out; heartbeats extend it
+AUTOMATION_JOB_LEASE = timedelta(seconds=float(os.getenv('AUTOMATION_JOB_LEASE_SECONDS', 30)))
+AUTOMATION_JOB_POLL_SECONDS = float(os.getenv('AUTOMATION_JOB_POLL_SECONDS', 1))
+# A job whose lease expired this many times (its workers died) is given up
+AUTOMATION_JOB_MAX_ATTEMPTS = int(os.getenv('AUTOMATION_JOB_MAX_ATTEMPTS', 3))
+
+# Claim order; the (status, priority, createdAt) index serves it as one index seek
+CLAIM_SORT = [("priority", -1), ("createdAt", 1)]
+# Final job status for a run's final status
+JOB_OUTCOMES = {"completed": "done", "cancelled": "cancelled", "failed": "failed"}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue_job(collections, run_id: str, project_id: str, priority: int = 0) -> dict:
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": "projectRun",
+        "runId": run_id,
+        "projectId": project_id,
+        "priority": priority,
+        "status": "queued",
+        "attempts": 0,
+        "leaseOwner": None,
+        "leaseExpiresAt": None,
+        "createdAt": _now(),
+        "finishedAt": None
+    }
+    await collections['automationJobs'].insert_one(job)
+    job.pop('_id', None)
+    return job
+
+
+async def cancel_queued_job(collections, run_id: str) -> bool:
+    """Withdraw a run's job if no worker has claimed it yet"""
+    result = await collections['automationJobs'].update_one(
+        {"runId": run_id, "status": "queued"},
+        {"$set": {"status": "cancelled", "finishedAt": _now()}}
+    )
+    return result.modified_count > 0
+
+
+async def claim_job(collections, worker_id: str, lease: timedelta = None) -> Optional[dict]:
+    """Atomically lease the highest-priority, oldest queued job"""
+    now = _now()
+    return await collections['automationJobs'].find_one_and_update(
+        {"status": "queued"},
+        {"$set": {"status": "leased", "leaseOwner": worker_id, "leaseExpiresAt": now + (lease or AUTOMATION_JOB_LEASE),
+                  "claimedAt": now},
+         "$inc": {"attempts": 1}},
+        sort=CLAIM_SORT,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def renew_lease(collections, job_id: str, worker_id: str, lease: timedelta = None) -> bool:
+    """Heartbeat: False once the lease was lost (expired and taken by another worker)"""
+    result = await collections['automationJobs'].update_one(
+        {"id": job_id, "status": "leased", "leaseOwner": worker_id},
+        {"$set": {"leaseExpiresAt": _now() + (lease or AUTOMATION_JOB_LEASE)}}
+    )
+    return result.modified_count > 0
+
+
+async def finish_job(collections, job_id: str, worker_id: str, job_status: str = "done"):
+    await collections['automationJobs'].update_one(
+        {"id": job_id, "status": "leased", "leaseOwner": worker_id},
+        {"$set": {"status": job_status, "leaseExpiresAt": None, "finishedAt": _now()}}
+    )
+
+
+async def requeue_expired(collections, max_attempts: int = None) -> int:
+    """Put jobs of dead workers back in the queue; give up on ones that keep dying"""
+    jobs = collections['automationJobs']
+    expired = {"status": "leased", "leaseExpiresAt": {"$lt": _now()}}
+    exhausted = await jobs.find(
+        {**expired, "attempts": {"$gte": max_attempts or AUTOMATION_JOB_MAX_ATTEMPTS}}, {"_id": 0, "id": 1, "runId": 1}
+    ).to_list(None)
+    if exhausted:
+        await jobs.update_many(
+            {**expired, "id": {"$in": [job['id'] for job in exhausted]}},
+            {"$set": {"status": "failed", "leaseOwner": None, "finishedAt": _now()}}
+        )
+        await collections['automationProjectRuns'].update_many(
+            {"id": {"$in": [job['runId'] for job in exhausted]}, "status": {"$in": automation_runs.ACTIVE_STATUSES + ['cancelling']}},
+            {"$set": {"status": "failed", "error": "Workers running it stopped responding",
+                      "finishedAt": datetime.utcnow().isoformat()}}
+        )
+    requeued = await jobs.update_many(expired, {"$set": {"status": "queued", "leaseOwner": None}})
+    if exhausted or requeued.modified_count:
+        logger.warning(f"[JOBS] Re-queued {requeued.modified_count} expired jobs, gave up on {len(exhausted)}")
+    return requeued.modified_count
+
+
+class AutomationWorker:
+    """Claims automation jobs and runs them, `concurrency` at a time.
+
+    Any number of workers (on any node) share the `automationJobs` queue. A worker
+    heartbeats each job it holds; when it dies the lease expires and any worker puts
+    the job back, and the run resumes after its last saved batch.
+    """
+
+    def __init__(self, collections, concurrency: int = 1, lease: timedelta = None, poll_seconds: float = None,
+                 worker_id: str = None):
+        self.collections = collections
+        self.concurrency = concurrency
+        self.lease = lease or AUTOMATION_JOB_LEASE
+        self.poll_seconds = AUTOMATION_JOB_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def run(self):
+        logger.info(f"[JOBS] Worker {self.worker_id} started, {self.concurrency} at a time")
+        try:
+            while not self._stopping:
+                try:
+                    await requeue_expired(self.collections)
+                    while len(self._running) < self.concurrency and not self._stopping:
+                        job = await claim_job(self.collections, self.worker_id, self.lease)
+                        if job is None:
+                            break
+                        task = asyncio.create_task(self._work(job))
+                        self._running.add(task)
+                        task.add_done_callback(self._running.discard)
+                except Exception as e:
+                    logger.error(f"[JOBS] Worker {self.worker_id} could not claim: {e}")
+                await asyncio.sleep(self.poll_seconds)
+        except asyncio.CancelledError:
+            # Abandoned runs are resumed elsewhere once their leases expire
+            for task in self._running:
+                task.cancel()
+            raise
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stop(self):
+        """Claim nothing more; run() returns once the jobs it holds are finished"""
+        self._stopping = True
+
+    async def _work(self, job: dict):
+        stop = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(job, stop))
+        try:
+            outcome = await automation_runs.execute_project_run(self.collections, job['runId'], job['projectId'], stop)
+            if outcome != "interrupted":
+                await finish_job(self.collections, job['id'], self.worker_id, JOB_OUTCOMES.get(outcome, "done"))
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job: dict, stop: asyncio.Event):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                if not await renew_lease(self.collections, job['id'], self.worker_id, self.lease):
+                    logger.warning(f"[JOBS] Lost the lease on job {job['id']}, stopping it")
+                    stop.set()
+                    return
+                run = await self.collections['automationProjectRuns'].find_one(
+                    {"id": job['runId']}, {"_id": 0, "status": 1}
+                )
+                if run and run.get('status') == 'cancelling':
+                    stop.set()
+            except Exception as e:
+                logger.error(f"[JOBS] Heartbeat for job {job['id']} failed: {e}")
@@ -0,0 +1,162 @@
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from . import case_executor
+from . import automation_jobs
+
+logger = logging.getLogger(__name__)
+
+# Test cases executed and persisted together: one insert_many + one bulk_write + one progress update
+AUTOMATION_RUN_BATCH_SIZE = int(os.getenv('AUTOMATION_RUN_BATCH_SIZE', 1000))
+ACTIVE_STATUSES = ['queued', 'running']
+
+
+async def execute_test_case(test_case: dict, cancelled: Optional[asyncio.Event] = None) -> Optional[dict]:
+    """Run one test case's steps on the executor; None if cancelled before it started"""
+    return await case_executor.executor.execute(test_case, cancelled)
+
+
+def test_run_record(test_case: dict, outcome: dict, project_run_id: Optional[str] = None) -> dict:
+    """The automationTestRuns document for one executed test case"""
+    return {
+        "id": str(uuid.uuid4()),
+        "projectId": test_case["projectId"],
+        "projectRunId": project_run_id,
+        "testCaseId": test_case["id"],
+        "status": outcome["status"],
+        "duration": outcome["duration"],
+        "createdAt": datetime.utcnow().isoformat(),
+        "results": {k: outcome.get(k) for k in ("steps", "failedStep", "error", "stdout", "stderr")}
+    }
+
+
+async def create_project_run(collections, project_id: str, total: int, priority: int = 0) -> dict:
+    """Record a queued run of a whole project and put it on the `automationJobs` queue"""
+    run = {
+        "id": str(uuid.uuid4()),
+        "projectId": project_id,
+        "status": "queued",
+        "priority": priority,
+        "total": total,
+        "completed": 0,
+        "passed": 0,
+        "failed": 0,
+        "skipped": 0,
+        "totalDuration": 0,
+        "after": None,
+        "createdAt": datetime.utcnow().isoformat(),
+        "startedAt": None,
+        "finishedAt": None
+    }
+    await collections['automationProjectRuns'].insert_one(run)
+    run.pop('_id', None)
+    await automation_jobs.enqueue_job(collections, run['id'], project_id, priority)
+    return run
+
+
+async def cancel_project_run(collections, run_id: str) -> bool:
+    """Stop a queued or running run; cases already executing finish, the rest are not started"""
+    runs = collections['automationProjectRuns']
+    if await automation_jobs.cancel_queued_job(collections, run_id):
+        # No worker has it yet: done right away
+        result = await runs.update_one(
+            {"id": run_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "finishedAt": datetime.utcnow().isoformat()}}
+        )
+        return result.modified_count > 0
+    # The worker holding it sees this on its next heartbeat or batch
+    result = await runs.update_one(
+        {"id": run_id, "status": {"$in": ACTIVE_STATUSES}},
+        {"$set": {"status": "cancelling"}}
+    )
+    return result.modified_count > 0
+
+
+async def execute_project_run(collections, run_id: str, project_id: str, stop: Optional[asyncio.Event] = None) -> str:
+    """Run every test case of a project, persisting each batch with a few bulk writes.
+
+    Resumes after the last persisted batch, so a run picked up again after its worker
+    died does not repeat work. `stop` is set by the worker on cancellation or a lost
+    lease; returns the final status, or "interrupted" when the run was left for another
+    worker to resume.
+    """
+    runs = collections['automationProjectRuns']
+    stop = stop or asyncio.Event()
+    await runs.update_one(
+        {"id": run_id, "status": "queued"},
+        {"$set": {"status": "running", "startedAt": datetime.utcnow().isoformat()}}
+    )
+    try:
+        while True:
+            # Cancelled through the API (any server): seen between batches
+            run = await runs.find_one({"id": run_id}, {"_id": 0, "status": 1, "after": 1})
+            if not run or run.get('status') not in ('running', 'cancelling'):
+                return run.get('status') if run else "failed"
+            if run['status'] == 'cancelling':
+                break
+            # Keyset batches on (projectId, id): memory stays at one batch however big the project
+            query = {"projectId": project_id}
+            if run.get('after') is not None:
+                query["id"] = {"$gt": run['after']}
+            batch = await collections['automationTestCases'].find(query, {"_id": 0}).sort("id", 1).limit(
+                AUTOMATION_RUN_BATCH_SIZE
+            ).to_list(AUTOMATION_RUN_BATCH_SIZE)
+            if not batch:
+                break
+            if not await _run_batch(collections, run_id, batch, stop):
+                return "interrupted"
+        final = "cancelled" if run and run.get('status') == 'cancelling' else "completed"
+        await runs.update_one(
+            {"id": run_id},
+            {"$set": {"status": final, "finishedAt": datetime.utcnow().isoformat()}}
+        )
+        return final
+    except Exception as e:
+        logger.error(f"Project run {run_id} failed: {e}")
+        await runs.update_one(
+            {"id": run_id},
+            {"$set": {"status": "failed", "error": str(e), "finishedAt": datetime.utcnow().isoformat()}}
+        )
+        return "failed"
+
+
+async def _run_batch(collections, run_id: str, test_cases: list, stop: asyncio.Event) -> bool:
+    """Execute a batch in parallel on the executor, then persist it with three writes.
+
+    False when it was stopped for anything but a cancellation: nothing is saved and
+    the batch is run again by whoever resumes the run.
+    """
+    outcomes = await asyncio.gather(*(execute_test_case(tc, stop) for tc in test_cases))
+    executed = [(tc, outcome) for tc, outcome in zip(test_cases, outcomes) if outcome is not None]
+    if stop.is_set() or len(executed) < len(test_cases):
+        run = await collections['automationProjectRuns'].find_one({"id": run_id}, {"_id": 0, "status": 1})
+        if not run or run.get('status') != 'cancelling':
+            return False
+    if not executed:
+        return True
+    test_runs = [test_run_record(tc, outcome, run_id) for tc, outcome in executed]
+    await collections['automationTestRuns'].insert_many(test_runs, ordered=False)
+    await collections['automationTestCases'].bulk_write([
+        UpdateOne({"id": record["testCaseId"]}, {"$set": {"lastResult": record["status"], "lastRun": record["createdAt"]}})
+        for record in test_runs
+    ], ordered=False)
+    passed = sum(1 for record in test_runs if record["status"] == "passed")
+    failed = sum(1 for record in test_runs if record["status"] == "failed")
+    await collections['automationProjectRuns'].update_one(
+        {"id": run_id},
+        {"$inc": {
+            "completed": len(test_runs),
+            "passed": passed,
+            "failed": failed,
+            "skipped": len(test_runs) - passed - failed,
+            "totalDuration": sum(record["duration"] for record in test_runs)
+        },
+         "$set": {"after": test_cases[-1]["id"]}}
+    )
+    return True
@@ -0,0 +1,170 @@
+import os
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..utils.dates import as_datetime, stored
+from .recurrence import occurrences, overlapping_query
+
+# Upper bound on a meetup's length; lets a range query bound `start` from below too
+MEETUP_MAX_DURATION = timedelta(hours=float(os.getenv('MEETUP_MAX_DURATION_HOURS', 24)))
+BUSY_STATUSES = ['scheduled']
+
+Interval = Tuple[datetime, datetime]
+
+
+async def busy_intervals(collections, user_id: str, start: datetime, end: datetime,
+                         exclude_id: Optional[str] = None) -> List[Interval]:
+    """A user's scheduled meetups overlapping [start, end), merged and sorted.
+
+    One range scan per side of the meetup on the (requesterId, start) and
+    (participantId, start) indexes, plus the user's recurring series expanded inside
+    the window only. Every source is already sorted, so merging them is linear in the
+    number of meetups in the window.
+    """
+    window = {"$gt": stored(start - MEETUP_MAX_DURATION), "$lt": stored(end)}
+    scans = []
+    for field in ("requesterId", "participantId"):
+        docs = await collections['events'].find(
+            {field: user_id, "status": {"$in": BUSY_STATUSES}, "start": window},
+            {"_id": 0, "id": 1, "start": 1, "end": 1}
+        ).sort("start", 1).to_list(None)
+        scans.append([
+            (as_datetime(d["start"]), as_datetime(d["end"])) for d in docs
+            if d.get("id") != exclude_id
+        ])
+        series = await collections['meetupSeries'].find(
+            {**overlapping_query(field, user_id, start, end), "status": {"$in": BUSY_STATUSES}},
+            {"_id": 0}
+        ).to_list(None)
+        scans.extend(
+            [(o["start"], o["end"]) for o in occurrences(s, start, end)]
+            for s in series if s["id"] != exclude_id
+        )
+    merged: List[Interval] = []
+    for busy_start, busy_end in heapq.merge(*scans):
+        if busy_end <= start:
+            continue
+        if merged and busy_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], busy_end))
+        else:
+            merged.append((busy_start, busy_end))
+    return merged
+
+
+def overlaps(busy: List[Interval], intervals: List[Interval]) -> bool:
+    """Whether two sorted interval lists intersect (busy intervals disjoint)"""
+    i = 0
+    for start, end in intervals:
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        if i < len(busy) and busy[i][0] < end:
+            return True
+    return False
+
+
+async def conflicts(collections, user_ids, intervals: List[Interval], exclude_id: Optional[str] = None) -> bool:
+    """Whether any of these users has a scheduled meetup overlapping one of the (sorted) intervals"""
+    if not intervals:
+        return False
+    for user_id in user_ids:
+        busy = await busy_intervals(collections, user_id, intervals[0][0], intervals[-1][1], exclude_id)
+        if overlaps(busy, intervals):
+            return True
+    return False
+
+
+def free_slots(busy: List[Interval], start: datetime, end: datetime, slot: timedelta) -> List[Interval]:
+    """Slots of length `slot` from `start` to `end` that overlap no busy interval"""
+    slots = []
+    cursor = start
+    i = 0
+    while cursor + slot <= end:
+        slot_end = cursor + slot
+        # Busy intervals are sorted and disjoint: skip the ones that ended already
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+        if i < len(busy) and busy[i][0] < slot_end:
+            # Jump to the next slot boundary at or after this busy interval's end
+            steps = -(-(busy[i][1] - cursor) // slot)
+            cursor += slot * steps
+            continue
+        slots.append((cursor, slot_end))
+        cursor = slot_end
+    return slots
+
+
+
+def _slot_range(start: datetime, slot: timedelta, busy_start: datetime, busy_end: datetime) -> Tuple[int, int]:
+    return (busy_start - start) // slot, -((start - busy_end) // slot)
+
+
+async def busy_slots(collections, user_ids: List[str], start: datetime, end: datetime,
+                     slot: timedelta) -> Dict[str, List[Tuple[int, int]]]:
+    """Scheduled meetups of many users overlapping [start, end), as [first, last) slot indices.
+
+    One aggregation over `events` for all users: the $in match uses the
+    (requesterId, start) and (participantId, start) indexes, and the server turns
+    dates into slot numbers so the caller only does integer work per meetup.
+    Recurring series are few and expanded here.
+    """
+    wanted = set(user_ids)
+    sides = [{field: {"$in": user_ids}} for field in ("requesterId", "participantId")]
+    slot_ms = int(slot.total_seconds() * 1000)
+    origin = stored(start)
+    busy: Dict[str, List[Tuple[int, int]]] = {}
+
+    def add(meetup: dict, first: int, last: int):
+        for uid in (meetup.get("requesterId"), meetup.get("participantId")):
+            if uid in wanted:
+                busy.setdefault(uid, []).append((first, last))
+
+    async for event in collections['events'].aggregate([
+        {"$match": {
+            "$or": sides,
+            "status": {"$in": BUSY_STATUSES},
+            "start": {"$gt": stored(start - MEETUP_MAX_DURATION), "$lt": stored(end)},
+        }},
+        {"$project": {
+            "_id": 0, "requesterId": 1, "participantId": 1,
+            "first": {"$toLong": {"$floor": {"$divide": [{"$subtract": ["$start", origin]}, slot_ms]}}},
+            "last": {"$toLong": {"$ceil": {"$divide": [{"$subtract": ["$end", origin]}, slot_ms]}}},
+        }},
+    ]):
+        add(event, event["first"], event["last"])
+    async for series in collections['meetupSeries'].find(
+        {"$or": sides, "status": {"$in": BUSY_STATUSES}, "start": {"$lt": end},
+         "$and": [{"$or": [{"lastEnd": None}, {"lastEnd": {"$gt": start}}]}]},
+        {"_id": 0}
+    ):
+        for occurrence in occurrences(series, start, end):
+            add(series, *_slot_range(start, slot, occurrence["start"], occurrence["end"]))
+    return busy
+
+
+def busy_bitmap(busy: Iterable[Tuple[int, int]], slots: int) -> int:
+    """Bit i set when slot i is (partly) busy; `busy` holds [first, last) slot ranges"""
+    bitmap = 0
+    for first, last in busy:
+        if first < 0:
+            first = 0
+        if last > slots:
+            last = slots
+        if first < last:
+            bitmap |= ((1 << (last - first)) - 1) << first
+    return bitmap
+
+
+def first_free_run(bitmap: int, slots: int, length: int) -> Optional[int]:
+    """Index of the first run of `length` free slots, None when there is none.
+
+    Free runs are found with shifts and ANDs over the whole window at once: after
+    each step bit i says whether slots i .. i + covered - 1 are all free.
+    """
+    runs = ~bitmap & ((1 << slots) - 1)
+    covered = 1
+    while runs and covered < length:
+        shift = min(covered, length - covered)
+        runs &= runs >> shift
+        covered += shift
+    return (runs & -runs).bit_length() - 1 if runs else None
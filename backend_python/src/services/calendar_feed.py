@@ -0,0 +1,120 @@
+import os
+import hashlib
+import secrets
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Iterable, Optional
+
+from ..utils.dates import as_datetime
+
+# The feed covers meetups from this many days back onwards
+CALENDAR_FEED_PAST_DAYS = int(os.getenv('CALENDAR_FEED_PAST_DAYS', 90))
+PRODID = '-//ConsultFlow//Meetups//EN'
+BYDAY = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def token_hash(token: str) -> str:
+    """Feeds are looked up by the token's hash; the token itself is only shown once"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def touch(collections, user_ids: Iterable[str]):
+    """Bump the version of these users' feeds (if they have one) and move their watermark"""
+    ids = [uid for uid in user_ids if uid]
+    if ids:
+        await collections['calendarFeeds'].update_many(
+            {"userId": {"$in": ids}},
+            {"$set": {"changedAt": datetime.now(timezone.utc).replace(microsecond=0)}, "$inc": {"version": 1}}
+        )
+
+
+def etag(feed: dict) -> str:
+    """From the version counter, so edits within the same second still change it"""
+    return f'"v{feed.get("version", 0)}"'
+
+
+def last_modified(changed_at: datetime) -> str:
+    return format_datetime(as_datetime(changed_at), usegmt=True)
+
+
+def not_modified(feed: dict, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """Conditional GET: If-None-Match wins over If-Modified-Since, as in RFC 9110"""
+    changed_at = feed["changedAt"]
+    if if_none_match is not None:
+        return etag(feed) in [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+    if if_modified_since:
+        try:
+            return as_datetime(changed_at) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _escape(text: str) -> str:
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _fold(line: str) -> str:
+    """Content lines are at most 75 octets; longer ones continue after CRLF + space"""
+    data = line.encode()
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    while data:
+        cut = 75 if not parts else 74
+        # Never split a UTF-8 sequence
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode())
+        data = data[cut:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _stamp(value) -> str:
+    return as_datetime(value).strftime('%Y%m%dT%H%M%SZ')
+
+
+def vevent(event: dict) -> str:
+    """One meetup, or a whole recurring series as a single VEVENT with its RRULE"""
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{event['id']}@consultflow",
+        f"DTSTAMP:{_stamp(datetime.fromtimestamp(event.get('createdAt', 0) / 1000, timezone.utc))}",
+        f"DTSTART:{_stamp(event['start'])}",
+        f"DTEND:{_stamp(event['end'])}",
+        f"SUMMARY:{_escape(event.get('title'))}",
+        f"STATUS:{'CANCELLED' if event.get('status') == 'cancelled' else 'CONFIRMED'}",
+    ]
+    if event.get('description'):
+        lines.append(f"DESCRIPTION:{_escape(event['description'])}")
+    if event.get('type') == 'series':
+        rule = f"RRULE:FREQ={event['freq'].upper()};INTERVAL={event.get('interval', 1)}"
+        if event.get('count'):
+            rule += f";COUNT={event['count']}"
+        elif event.get('until'):
+            rule += f";UNTIL={_stamp(event['until'])}"
+        if event['freq'] == 'weekly':
+            rule += f";BYDAY={BYDAY[as_datetime(event['start']).weekday()]}"
+        lines.append(rule)
+        lines.extend(f"EXDATE:{_stamp(d)}" for d in event.get('exdates') or ())
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+async def stream(collections, user_id: str) -> AsyncIterator[str]:
+    """The feed body, one VEVENT at a time straight off the database cursors"""
+    yield _fold('BEGIN:VCALENDAR') + _fold('VERSION:2.0') + _fold(f'PRODID:{PRODID}') + _fold('CALSCALE:GREGORIAN')
+    since = datetime.now(timezone.utc) - timedelta(days=CALENDAR_FEED_PAST_DAYS)
+    for field in ('requesterId', 'participantId'):
+        async for event in collections['events'].find({field: user_id, "start": {"$gte": since}}, {"_id": 0}):
+            yield vevent(event)
+        # Series are few per user; each one is a single VEVENT however long it runs
+        async for series in collections['meetupSeries'].find(
+            {field: user_id, "$or": [{"lastEnd": None}, {"lastEnd": {"$gt": since}}]}, {"_id": 0}
+        ):
+            yield vevent(series)
+    yield _fold('END:VCALENDAR')
@@ -0,0 +1,152 @@
+import os
+import time
+import signal
+import asyncio
+import logging
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Test cases run in worker processes, at most this many at once (default: one per core)
+AUTOMATION_WORKERS = int(os.getenv('AUTOMATION_WORKERS', 0)) or os.cpu_count() or 1
+AUTOMATION_CASE_TIMEOUT_SECONDS = float(os.getenv('AUTOMATION_CASE_TIMEOUT_SECONDS', 60))
+# Captured stdout/stderr kept per test run
+AUTOMATION_OUTPUT_LIMIT = int(os.getenv('AUTOMATION_OUTPUT_LIMIT', 64 * 1024))
+# Shell steps run arbitrary commands on the server, so they are opt-in
+AUTOMATION_ALLOW_SHELL = os.getenv('AUTOMATION_ALLOW_SHELL', 'false').lower() == 'true'
+
+Step = Tuple[str, str]  # driver name, arguments
+
+
+class StepFailed(Exception):
+    pass
+
+
+def shell_step(command: str, timeout: float, allow_shell: bool) -> Tuple[str, str]:
+    """`shell: <command>` passes when the command exits with 0"""
+    if not allow_shell:
+        raise StepFailed("shell steps are disabled (AUTOMATION_ALLOW_SHELL)")
+    # Own process group, so a timeout also stops whatever the command started
+    with subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True, start_new_session=True) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            if hasattr(os, 'killpg'):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            process.communicate()
+            raise StepFailed(f"timed out after {timeout:.0f}s") from e
+    if process.returncode != 0:
+        raise StepFailed(f"exit status {process.returncode}\n{stderr}")
+    return stdout, stderr
+
+
+def http_step(spec: str, timeout: float, allow_shell: bool) -> Tuple[str, str]:
+    """`http: <METHOD> <url> [<expected status>]` passes on the expected (default 2xx) status"""
+    parts = spec.split()
+    if len(parts) not in (2, 3):
+        raise StepFailed(f"expected 'METHOD URL [STATUS]', got {spec!r}")
+    method, url = parts[0].upper(), parts[1]
+    try:
+        response = httpx.request(method, url, timeout=timeout)
+    except httpx.HTTPError as e:
+        raise StepFailed(f"{method} {url}: {e}") from e
+    expected = int(parts[2]) if len(parts) == 3 else None
+    if (expected is None and not response.is_success) or (expected is not None and response.status_code != expected):
+        raise StepFailed(f"{method} {url} answered {response.status_code}")
+    return f"{method} {url} -> {response.status_code}\n", ''
+
+
+# Step drivers by the prefix a step line starts with; lines without one are notes
+STEP_DRIVERS: Dict[str, Callable[[str, float, bool], Tuple[str, str]]] = {
+    'shell': shell_step,
+    'http': http_step,
+}
+
+
+def parse_steps(steps: str) -> List[Step]:
+    parsed = []
+    for line in (steps or '').splitlines():
+        driver, separator, arguments = line.strip().partition(':')
+        if separator and driver.strip().lower() in STEP_DRIVERS and arguments.strip():
+            parsed.append((driver.strip().lower(), arguments.strip()))
+    return parsed
+
+
+def run_case(steps: List[Step], timeout: float, allow_shell: bool, output_limit: int) -> dict:
+    """Run one test case's steps in order, in a worker process; stops at the first failure"""
+    started = time.monotonic()
+    stdout, stderr = [], []
+    outcome = {"status": "passed", "steps": len(steps), "failedStep": None, "error": None}
+    if not steps:
+        outcome["status"] = "skipped"
+    for index, (driver, arguments) in enumerate(steps):
+        remaining = timeout - (time.monotonic() - started)
+        try:
+            if remaining <= 0:
+                raise StepFailed(f"timed out after {timeout:.0f}s")
+            out, err = STEP_DRIVERS[driver](arguments, remaining, allow_shell)
+            stdout.append(out)
+            stderr.append(err)
+        except Exception as e:
+            outcome.update(status="failed", failedStep=index, error=str(e)[:output_limit])
+            break
+    outcome["duration"] = int((time.monotonic() - started) * 1000)
+    outcome["stdout"] = ''.join(stdout)[-output_limit:]
+    outcome["stderr"] = ''.join(stderr)[-output_limit:]
+    return outcome
+
+
+class CaseExecutor:
+    """Runs test cases in a process pool, AUTOMATION_WORKERS at a time.
+
+    Worker processes are spawned (not forked from the threaded server) on first use.
+    Each case gets AUTOMATION_CASE_TIMEOUT_SECONDS over all of its steps.
+    """
+
+    def __init__(self, workers: int = None, timeout: float = None):
+        self.workers = workers or AUTOMATION_WORKERS
+        self.timeout = AUTOMATION_CASE_TIMEOUT_SECONDS if timeout is None else timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            self._slots = asyncio.Semaphore(self.workers)
+
+    async def execute(self, test_case: dict, cancelled: Optional[asyncio.Event] = None) -> Optional[dict]:
+        """Outcome of one test case, or None if the run was cancelled before it started"""
+        self._ensure_pool()
+        async with self._slots:
+            if cancelled is not None and cancelled.is_set():
+                return None
+            future = asyncio.get_running_loop().run_in_executor(
+                self._pool, run_case, parse_steps(test_case.get('steps', '')),
+                self.timeout, AUTOMATION_ALLOW_SHELL, AUTOMATION_OUTPUT_LIMIT
+            )
+            try:
+                # Steps enforce the timeout themselves; this only guards against a stuck worker
+                return await asyncio.wait_for(future, self.timeout + 10)
+            except asyncio.TimeoutError:
+                return {"status": "failed", "steps": 0, "failedStep": None, "duration": int(self.timeout * 1000),
+                        "error": f"timed out after {self.timeout:.0f}s", "stdout": '', "stderr": ''}
+            except Exception as e:
+                logger.error(f"Test case {test_case.get('id')} could not be executed: {e}")
+                return {"status": "failed", "steps": 0, "failedStep": None, "duration": 0,
+                        "error": str(e), "stdout": '', "stderr": ''}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+executor = CaseExecutor()
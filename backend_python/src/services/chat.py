@@ -0,0 +1,127 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from ..db import get_collections
+
+logger = logging.getLogger(__name__)
+
+# Write-behind: buffered messages go out in one insert_many every few ms or every N messages
+CHAT_FLUSH_SECONDS = float(os.getenv('CHAT_FLUSH_MS', 5)) / 1000
+CHAT_FLUSH_BATCH = int(os.getenv('CHAT_FLUSH_BATCH', 500))
+CHAT_MAX_LENGTH = int(os.getenv('CHAT_MAX_LENGTH', 4000))
+SEQ_CACHE_SIZE = 10000
+# The last digit of every seq is the stamping worker's node id, so two workers stamping one
+# conversation in the same millisecond never collide. Pin distinct ids per worker to be sure
+CHAT_NODES = 10
+CHAT_NODE_ID = int(os.getenv('CHAT_NODE_ID', random.randrange(CHAT_NODES))) % CHAT_NODES
+
+
+def _collection():
+    """messages, or None while the database is not connected (tests, benchmarks)"""
+    try:
+        return get_collections()['messages']
+    except (RuntimeError, KeyError):
+        return None
+
+
+class ChatLog:
+    """Consultation chat: sequence numbers per conversation and batched persistence.
+
+    record() is synchronous and never waits for Mongo; a message is delivered as soon
+    as it is recorded and written with the next batch. A crash loses at most one batch.
+    """
+
+    def __init__(self, node_id: int = None):
+        self.node_id = CHAT_NODE_ID if node_id is None else node_id % CHAT_NODES
+        self._buffer: List[dict] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self._last_seq: 'OrderedDict[str, int]' = OrderedDict()
+        self.recorded = 0
+        self.batches = 0
+        self.failed = 0
+
+    def next_seq(self, conversation_id: str) -> int:
+        # Same magnitude as the replay buffer's hybrid clock (ms * 1000, below 2**53 for JS
+        # clients): ms * 100 + a counter, then the node digit. Increasing without asking Mongo
+        # Idle conversations fall out of the cache; the clock alone keeps their next seq increasing
+        tick = max(self._last_seq.pop(conversation_id, 0) + 1, int(time.time() * 1000) * 100)
+        self._last_seq[conversation_id] = tick
+        if len(self._last_seq) > SEQ_CACHE_SIZE:
+            self._last_seq.popitem(last=False)
+        return tick * CHAT_NODES + self.node_id
+
+    def record(self, conversation_id: str, sender_id: str, text: str) -> dict:
+        doc = {
+            "conversationId": conversation_id,
+            "seq": self.next_seq(conversation_id),
+            "from": sender_id,
+            "text": text,
+            "createdAt": datetime.utcnow(),
+        }
+        self.recorded += 1
+        if _collection() is None:
+            return doc
+        self._buffer.append(dict(doc))
+        if len(self._buffer) >= CHAT_FLUSH_BATCH:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(CHAT_FLUSH_SECONDS, self._schedule_flush)
+        return doc
+
+    def _schedule_flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write everything buffered so far; later messages wait for the next batch"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        while self._buffer:
+            batch, self._buffer = self._buffer[:CHAT_FLUSH_BATCH], self._buffer[CHAT_FLUSH_BATCH:]
+            try:
+                await _collection().insert_many(batch, ordered=False)
+                self.batches += 1
+            except BulkWriteError as e:
+                # Another worker with the same node id took these seqs: save them under new ones
+                errors = e.details.get('writeErrors', [])
+                taken = [batch[error['index']] for error in errors if error.get('code') == 11000]
+                for doc in taken:
+                    doc['seq'] = self.next_seq(doc['conversationId'])
+                self._buffer.extend(taken)
+                self.failed += len(errors) - len(taken)
+                logger.warning(f"[CHAT] Re-numbered {len(taken)} messages whose seq was taken")
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"[CHAT] Failed to write {len(batch)} messages: {e}")
+
+    async def history(self, conversation_id: str, before: int = None, limit: int = 50) -> List[dict]:
+        """Newest-first page of a conversation, keyset-paginated on seq"""
+        collection = _collection()
+        if collection is None:
+            return []
+        await self.flush()  # include what this worker has not written yet
+        query = {"conversationId": conversation_id}
+        if before is not None:
+            query["seq"] = {"$lt": before}
+        return await collection.find(query, {"_id": 0}).sort("seq", -1).limit(limit).to_list(limit)
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "buffered": len(self._buffer),
+            "batches": self.batches,
+            "failed": self.failed,
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from ..db import get_collections
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+OFFERED = 'offered'
+ACCEPTED = 'accepted'
+EXPIRED = 'expired'
+CANCELLED = 'cancelled'
+OPEN_STATUSES = [PENDING, OFFERED]
+
+
+def _collection():
+    """consultRequests, or None while the database is not connected (tests, benchmarks)"""
+    try:
+        return get_collections()['consultRequests']
+    except (RuntimeError, KeyError):
+        return None
+
+
+class ConsultRequestStore:
+    """Write-through persistence of the matchmaking engine's consult requests.
+
+    The engine never waits on these writes: each request's updates are chained so
+    they reach Mongo in order, while writes for different requests run concurrently.
+    Only the open statuses can be overwritten, so `accepted` is final.
+    """
+
+    def __init__(self):
+        self._tails: Dict[str, asyncio.Future] = {}
+        self.failed_writes = 0
+
+    def _chain(self, request_id: str, write: Callable[..., Awaitable]):
+        if _collection() is None:
+            return
+        previous = self._tails.get(request_id)
+
+        async def _run():
+            if previous is not None:
+                await asyncio.wait([previous])
+            try:
+                await write(_collection())
+            except Exception as e:
+                self.failed_writes += 1
+                logger.error(f"[CONSULT] Failed to persist {request_id}: {e}")
+
+        task = asyncio.ensure_future(_run())
+        self._tails[request_id] = task
+        task.add_done_callback(lambda t: self._tails.pop(request_id, None) if self._tails.get(request_id) is t else None)
+
+    async def flush(self, request_id: str = None):
+        """Wait for queued writes (of one request, or all of them)"""
+        pending = [self._tails[request_id]] if request_id in self._tails else ([] if request_id else list(self._tails.values()))
+        if pending:
+            await asyncio.wait(pending)
+
+    def created(self, request_id: str, requester_id: Optional[str], role: str, symptom: str,
+                specialization: str, ttl_seconds: float):
+        now = datetime.utcnow()
+        doc = {
+            "id": request_id,
+            "requesterId": requester_id,
+            "requesterRole": role,
+            "symptom": symptom,
+            "specialization": specialization or '',
+            "status": PENDING,
+            "offeredTo": None,
+            "createdAt": now,
+            "updatedAt": now,
+            "expiresAt": now + timedelta(seconds=ttl_seconds),
+        }
+        self._chain(request_id, lambda c: c.insert_one(doc))
+
+    def offered(self, request_id: str, provider_id: str):
+        self._transition(request_id, {"status": OFFERED, "offeredTo": provider_id})
+
+    def requeued(self, request_id: str):
+        self._transition(request_id, {"status": PENDING, "offeredTo": None})
+
+    def finished(self, request_id: str, status: str):
+        self._transition(request_id, {"status": status, "offeredTo": None})
+
+    def _transition(self, request_id: str, fields: dict):
+        fields = {**fields, "updatedAt": datetime.utcnow()}
+        self._chain(request_id, lambda c: c.update_one(
+            {"id": request_id, "status": {"$in": OPEN_STATUSES}},
+            {"$set": fields}
+        ))
+
+    async def claim(self, request_id: str, provider_id: str) -> Tuple[bool, Optional[dict]]:
+        """Atomically take an open request; exactly one provider can win.
+
+        Returns (ok, document). Without a database the caller's in-memory state decides.
+        """
+        collection = _collection()
+        if collection is None:
+            return True, None
+        await self.flush(request_id)
+        now = datetime.utcnow()
+        doc = await collection.find_one_and_update(
+            {"id": request_id, "status": {"$in": OPEN_STATUSES}, "expiresAt": {"$gt": now}},
+            # Accepted consults are history, not queue entries: take them out of the TTL
+            {"$set": {"status": ACCEPTED, "providerId": provider_id, "offeredTo": None,
+                      "acceptedAt": now, "updatedAt": now},
+             "$unset": {"expiresAt": ""}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        return doc is not None, doc
+
+    async def get(self, request_id: str) -> Optional[dict]:
+        collection = _collection()
+        if collection is None:
+            return None
+        await self.flush(request_id)
+        return await collection.find_one({"id": request_id}, {"_id": 0})
+
+    async def pending(self, specialization: str = None, limit: int = 50,
+                      after: Tuple[datetime, str] = None) -> List[dict]:
+        """Oldest-first page of unclaimed requests, keyset-paginated on (createdAt, id)"""
+        collection = _collection()
+        if collection is None:
+            return []
+        query = {"status": PENDING, "expiresAt": {"$gt": datetime.utcnow()}}
+        if specialization:
+            # Requests for this specialization plus the ones anybody may take
+            query["specialization"] = {"$in": [specialization, '']}
+        if after:
+            created_at, request_id = after
+            query["$or"] = [
+                {"createdAt": {"$gt": created_at}},
+                {"createdAt": created_at, "id": {"$gt": request_id}},
+            ]
+        return await collection.find(query, {"_id": 0}).sort(
+            [("createdAt", 1), ("id", 1)]
+        ).limit(limit).to_list(limit)
+
+    def stats(self) -> dict:
+        return {"queuedWrites": len(self._tails), "failedWrites": self.failed_writes}
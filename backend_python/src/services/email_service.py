@@ -1,4 +1,5 @@
 import os
+import html
 import logging
 import aiosmtplib
 from email.mime.text import MIMEText
@@ -152,3 +153,35 @@ This is an automated message. Please do not reply to this email.
     except Exception as e:
         logger.error(f"Failed to send registration email to {to}: {e}")
         # Don't raise - registration should succeed even if email fails
+
+
+async def send_meetup_reminder_email(to: str, title: str, start: str, minutes_before: int):
+    """Send a reminder for an upcoming meetup"""
+    if not SMTP_HOST:
+        return  # Skip if not configured
+    
+    try:
+        html_content = f"""
+        <div style="font-family:Arial,Helvetica,sans-serif;line-height:1.5;font-size:15px;color:#222;">
+            <h2 style="margin:0 0 16px;">{html.escape(title)} starts in {minutes_before} minutes</h2>
+            <p>Your meetup on the ConsultFlow Platform is scheduled for <strong>{start}</strong> (UTC).</p>
+            <p><a href="{CLIENT_URL}/meetups">Open your meetups</a></p>
+            <hr style="border:none;border-top:1px solid #ddd;margin:20px 0;">
+            <p style="font-size:12px;color:#666;">
+                This is an automated message. Please do not reply to this email.
+            </p>
+        </div>
+        """
+        
+        text_content = f"""
+{title} starts in {minutes_before} minutes.
+
+Your meetup on the ConsultFlow Platform is scheduled for {start} (UTC).
+
+This is an automated message. Please do not reply to this email.
+        """
+        
+        await send_email(to, f"Reminder: {title} in {minutes_before} minutes", html_content, text_content)
+        
+    except Exception as e:
+        logger.error(f"Failed to send meetup reminder to {to}: {e}")
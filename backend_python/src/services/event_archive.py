@@ -0,0 +1,73 @@
+import os
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from ..db import get_collections
+
+logger = logging.getLogger(__name__)
+
+# Finished meetups that started longer ago than this move to `eventsArchive`
+EVENT_RETENTION = timedelta(days=float(os.getenv('EVENT_RETENTION_DAYS', 180)))
+EVENT_ARCHIVE_BATCH_SIZE = int(os.getenv('EVENT_ARCHIVE_BATCH_SIZE', 500))
+EVENT_ARCHIVE_INTERVAL = timedelta(hours=float(os.getenv('EVENT_ARCHIVE_INTERVAL_HOURS', 24)))
+TERMINAL_STATUSES = ['cancelled', 'completed']
+
+
+async def archive_events(batch_size: int = None, now: Optional[datetime] = None) -> int:
+    """Move finished meetups past the retention window out of `events`, a batch at a time.
+
+    Each batch is copied with one bulk upsert (a rerun after a crash copies nothing
+    twice), removed from `events` with one delete, then added to the participants'
+    `eventSummaries` counts. Uses the (status, start) index.
+    """
+    batch_size = batch_size or EVENT_ARCHIVE_BATCH_SIZE
+    collections = get_collections()
+    events, archive = collections['events'], collections['eventsArchive']
+    done = {"status": {"$in": TERMINAL_STATUSES}, "start": {"$lt": (now or datetime.now(timezone.utc)) - EVENT_RETENTION}}
+    archived = 0
+    while True:
+        docs = await events.find(done, {"_id": 0}).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        ids = [doc['id'] for doc in docs]
+        await archive.bulk_write(
+            [UpdateOne({"id": doc['id']}, {"$setOnInsert": doc}, upsert=True) for doc in docs], ordered=False
+        )
+        result = await events.delete_many({**done, "id": {"$in": ids}})
+        if result.deleted_count != len(docs):
+            # Re-opened since it was read: it stays hot, so drop the copy
+            kept = [doc['id'] for doc in await events.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(None)]
+            await archive.delete_many({"id": {"$in": kept}})
+            docs = [doc for doc in docs if doc['id'] not in kept]
+        counts = Counter(
+            (user_id, doc['status']) for doc in docs for user_id in {doc['requesterId'], doc['participantId']}
+        )
+        users = {}
+        for (user_id, doc_status), count in counts.items():
+            users.setdefault(user_id, {})[doc_status] = count
+        if users:
+            await collections['eventSummaries'].bulk_write(
+                [UpdateOne({"userId": uid}, {"$inc": inc}, upsert=True) for uid, inc in users.items()], ordered=False
+            )
+        archived += len(docs)
+        await asyncio.sleep(0)  # let requests in between batches
+    if archived:
+        logger.info(f"[ARCHIVE] Moved {archived} finished meetups to eventsArchive")
+    return archived
+
+
+async def run_event_archiver():
+    """Archive once now, then every EVENT_ARCHIVE_INTERVAL"""
+    while True:
+        try:
+            await archive_events()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[ARCHIVE] Event archival failed: {e}")
+        await asyncio.sleep(EVENT_ARCHIVE_INTERVAL.total_seconds())
@@ -0,0 +1,87 @@
+import os
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from ..utils.dates import as_datetime
+
+# A series is one document with a rule; its occurrences only exist inside the window asked for
+FREQUENCIES = {'daily': timedelta(days=1), 'weekly': timedelta(weeks=1)}
+MAX_COUNT = 500
+# How far ahead an open-ended series is checked for conflicts when it is created
+SERIES_CONFLICT_HORIZON = timedelta(days=int(os.getenv('MEETUP_SERIES_HORIZON_DAYS', 365)))
+OCCURRENCE_SEPARATOR = ':'
+
+
+def step(series: dict) -> timedelta:
+    return FREQUENCIES[series['freq']] * series.get('interval', 1)
+
+
+def last_end(series: dict) -> Optional[datetime]:
+    """End of the final occurrence, or None for a series without count/until"""
+    first_start, first_end = as_datetime(series['start']), as_datetime(series['end'])
+    if series.get('count'):
+        return first_end + step(series) * (series['count'] - 1)
+    if series.get('until'):
+        return first_end + step(series) * ((as_datetime(series['until']) - first_start) // step(series))
+    return None
+
+
+def occurrence_id(series_id: str, index: int) -> str:
+    return f"{series_id}{OCCURRENCE_SEPARATOR}{index}"
+
+
+def series_id_of(meetup_id: str) -> Optional[str]:
+    """The series an occurrence id belongs to, None for a plain meetup id"""
+    series_id, separator, index = meetup_id.rpartition(OCCURRENCE_SEPARATOR)
+    return series_id if separator and index.isdigit() else None
+
+
+def occurrences(series: dict, start: datetime, end: Optional[datetime] = None) -> Iterator[dict]:
+    """Occurrences overlapping [start, end), in start order.
+
+    Jumps straight to the first one in the window, so the cost is the occurrences
+    yielded. With `end=None` the caller decides when to stop consuming.
+    """
+    first_start, first_end = as_datetime(series['start']), as_datetime(series['end'])
+    period = step(series)
+    count = series.get('count')
+    until = as_datetime(series['until']) if series.get('until') else None
+    skipped = {as_datetime(d) for d in series.get('exdates') or ()}
+    fields = {k: v for k, v in series.items()
+              if k not in ('_id', 'freq', 'interval', 'count', 'until', 'exdates', 'lastEnd')}
+    index = (start - first_end) // period + 1 if start >= first_end else 0
+    while True:
+        occurrence_start = first_start + period * index
+        if (count and index >= count) or (until and occurrence_start > until) \
+                or (end is not None and occurrence_start >= end):
+            return
+        if occurrence_start not in skipped:
+            yield {
+                **fields,
+                "type": "meetup",
+                "id": occurrence_id(series['id'], index),
+                "seriesId": series['id'],
+                "start": occurrence_start,
+                "end": occurrence_start + (first_end - first_start),
+            }
+        index += 1
+
+
+def occurrence_at(series: dict, index: int) -> Optional[dict]:
+    """Occurrence number `index` of a series, None if it does not exist or was skipped"""
+    if index < 0:
+        return None
+    occurrence_start = as_datetime(series['start']) + step(series) * index
+    for occurrence in occurrences(series, occurrence_start, occurrence_start + step(series)):
+        return occurrence if occurrence['id'] == occurrence_id(series['id'], index) else None
+    return None
+
+
+def overlapping_query(field: str, user_id: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """Series of a user with occurrences possibly inside [start, end)"""
+    query = {field: user_id}
+    if start is not None:
+        query["$or"] = [{"lastEnd": None}, {"lastEnd": {"$gt": start}}]
+    if end is not None:
+        query["start"] = {"$lt": end}
+    return query
@@ -0,0 +1,271 @@
+import os
+import json
+import heapq
+import asyncio
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from ..db import get_collections
+from ..utils.dates import as_datetime, iso
+from ..ws import matchmaking
+from ..ws.topics import user_topic
+from .email_service import send_meetup_reminder_email
+from .recurrence import OCCURRENCE_SEPARATOR, occurrence_at, occurrences, series_id_of
+
+logger = logging.getLogger(__name__)
+
+# Reminders go out this long before a meetup starts (comma-separated minutes)
+REMINDER_LEADS = sorted(
+    timedelta(minutes=float(m)) for m in os.getenv('REMINDER_LEAD_MINUTES', '60').split(',') if m.strip()
+)
+# Only meetups whose reminders are due within this window are held in memory
+REMINDER_WINDOW = timedelta(hours=float(os.getenv('REMINDER_WINDOW_HOURS', 6)))
+# Reminders due this close together are claimed and sent as one batch
+REMINDER_BATCH = timedelta(seconds=float(os.getenv('REMINDER_BATCH_SECONDS', 1)))
+
+_Entry = Tuple[datetime, int, str, datetime, timedelta]  # fire at, tiebreak, meetup id, start, lead
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _collections() -> Optional[dict]:
+    try:
+        return get_collections()
+    except RuntimeError:
+        return None
+
+
+def claim_id(meetup: dict, lead: timedelta) -> str:
+    """One per meetup, start and lead: a meetup moved to a new time is reminded again"""
+    start = int(as_datetime(meetup['start']).timestamp())
+    return f"{meetup['id']}:{start}:{int(lead.total_seconds() // 60)}"
+
+
+class ReminderScheduler:
+    """In-process min-heap of upcoming reminders.
+
+    Filled from one indexed range query over the next REMINDER_WINDOW (again on
+    restart, and as the window slides), and kept current by the meetup routes. A
+    moved or cancelled meetup leaves stale heap entries behind; they are recognised
+    and dropped when popped. Due meetups are checked against the database (another
+    worker may have moved or cancelled them), and every reminder is claimed in
+    `reminderClaims` first, so with several workers (or after a restart) each one is
+    sent once.
+    """
+
+    def __init__(self):
+        self._heap: List[_Entry] = []
+        self._meetups: Dict[str, dict] = {}  # meetup id -> meetup as last scheduled
+        self._tiebreak = itertools.count()
+        self.horizon: Optional[datetime] = None  # meetups starting before this are loaded
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.batches = 0
+        self.stale = 0
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        await self._load(_now())
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, meetup: dict):
+        """Add, move or drop a meetup's reminders after it was created or updated"""
+        previous = self._meetups.pop(meetup['id'], None)
+        if self.horizon is None or meetup.get('status') != 'scheduled':
+            return
+        start = as_datetime(meetup['start'])
+        if start >= self.horizon:
+            return  # picked up when the window gets there
+        if previous is not None and as_datetime(previous['start']) == start:
+            self._meetups[meetup['id']] = meetup  # same time: its heap entries stay valid
+            return
+        now = _now()
+        for lead in REMINDER_LEADS:
+            if start - lead > now:
+                self._meetups[meetup['id']] = meetup
+                self._push((start - lead, next(self._tiebreak), meetup['id'], start, lead))
+
+    def schedule_series(self, series: dict):
+        """Re-expand a series inside the loaded window (skipped occurrences drop out)"""
+        dropped = {k for k, m in self._meetups.items() if m.get('seriesId') == series['id']}
+        if self.horizon is not None:
+            for occurrence in occurrences(series, _now(), self.horizon):
+                dropped.discard(occurrence['id'])
+                self.schedule(occurrence)
+        for meetup_id in dropped:
+            del self._meetups[meetup_id]
+
+    def _push(self, entry: _Entry):
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry and self._wake:
+            self._wake.set()  # earlier than what the loop is sleeping towards
+
+    async def _load(self, now: datetime):
+        """Load meetups starting between the current horizon and the end of the window"""
+        collections = _collections()
+        end = now + REMINDER_WINDOW + (REMINDER_LEADS[-1] if REMINDER_LEADS else timedelta(0))
+        start = self.horizon or now
+        if collections is None or start >= end:
+            self.horizon = max(self.horizon or end, end)
+            return
+        self.horizon = end
+        meetups = await collections['events'].find(
+            {"status": "scheduled", "start": {"$gte": start, "$lt": end}},
+            {"_id": 0}
+        ).to_list(None)
+        # Active series, each expanded inside the window only
+        async for series in collections['meetupSeries'].find(
+            {"status": "scheduled", "start": {"$lt": end}, "$or": [{"lastEnd": None}, {"lastEnd": {"$gt": start}}]},
+            {"_id": 0}
+        ):
+            meetups.extend(occurrences(series, start, end))
+        for meetup in meetups:
+            if as_datetime(meetup['start']) >= start:
+                self.schedule(meetup)
+
+    async def _run(self):
+        while True:
+            try:
+                now = _now()
+                if self.horizon - now < REMINDER_WINDOW / 2:
+                    await self._load(now)
+                due = []
+                while self._heap and self._heap[0][0] <= now + REMINDER_BATCH:
+                    due.append(heapq.heappop(self._heap))
+                if due:
+                    await self._fire(due)
+                    continue
+                wake_at = self.horizon - REMINDER_WINDOW / 2
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(0.0, (wake_at - _now()).total_seconds()))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[REMINDERS] Scheduler error: {e}")
+                await asyncio.sleep(5)
+
+    def _current(self, entry: _Entry) -> Optional[dict]:
+        meetup = self._meetups.get(entry[2])
+        if meetup is None or as_datetime(meetup['start']) != entry[3]:
+            self.stale += 1
+            return None
+        return meetup
+
+    async def _verify(self, due: List[Tuple[dict, timedelta]]) -> List[Tuple[dict, timedelta]]:
+        """Keep the reminders whose meetup is still scheduled at the same start, as stored now"""
+        collections = _collections()
+        if collections is None or not due:
+            return due
+        series_ids = {series_id_of(m['id']) for m, _ in due} - {None}
+        plain = [m for m, _ in due if series_id_of(m['id']) is None]
+        stored = {}
+        if plain:
+            for meetup in await collections['events'].find(
+                {"id": {"$in": [m['id'] for m in plain]}, "status": "scheduled",
+                 "start": {"$in": list({as_datetime(m['start']) for m in plain})}},
+                {"_id": 0}
+            ).to_list(None):
+                stored[meetup['id']] = meetup
+        if series_ids:
+            series = {s['id']: s for s in await collections['meetupSeries'].find(
+                {"id": {"$in": list(series_ids)}, "status": "scheduled"}, {"_id": 0}
+            ).to_list(None)}
+            for meetup, _ in due:
+                series_id = series_id_of(meetup['id'])
+                if series_id in series:
+                    occurrence = occurrence_at(series[series_id], int(meetup['id'].rpartition(OCCURRENCE_SEPARATOR)[2]))
+                    if occurrence:
+                        stored[meetup['id']] = occurrence
+        current = [(stored[m['id']], lead) for m, lead in due
+                   if m['id'] in stored and as_datetime(stored[m['id']]['start']) == as_datetime(m['start'])]
+        self.stale += len(due) - len(current)
+        return current
+
+    async def _claim(self, due: List[Tuple[dict, timedelta]]) -> List[Tuple[dict, timedelta]]:
+        """Keep the reminders no other worker (or earlier run) has sent, in one insert_many"""
+        collections = _collections()
+        if collections is None:
+            return due
+        claims = [{"_id": claim_id(m, lead), "createdAt": _now()} for m, lead in due]
+        try:
+            await collections['reminderClaims'].insert_many(claims, ordered=False)
+        except BulkWriteError as e:
+            taken = {error['index'] for error in e.details.get('writeErrors', [])}
+            return [reminder for i, reminder in enumerate(due) if i not in taken]
+        return due
+
+    async def _fire(self, entries: List[_Entry]):
+        # A meetup moved away and back has two live entries for the same reminder
+        unique = {(entry[2], entry[4]): entry for entry in entries}
+        due = [(meetup, entry[4]) for entry in unique.values() if (meetup := self._current(entry))]
+        due = await self._claim(await self._verify(due))
+        if not due:
+            return
+        self.batches += 1
+        for meetup, lead in due:
+            message = json.dumps({
+                "type": "meetup.reminder",
+                "meetupId": meetup['id'],
+                "title": meetup.get('title'),
+                "start": iso(meetup['start']),
+                "minutesBefore": int(lead.total_seconds() // 60),
+            })
+            for user_id in {meetup['requesterId'], meetup['participantId']}:
+                await matchmaking.manager.publish(user_topic(user_id), message)
+            scheduled = self._meetups.get(meetup['id'])
+            if lead == REMINDER_LEADS[0] and scheduled and as_datetime(scheduled['start']) == as_datetime(meetup['start']):
+                del self._meetups[meetup['id']]  # its last reminder
+        await self._email(due)
+        self.sent += len(due)
+
+    async def _email(self, due: List[Tuple[dict, timedelta]]):
+        collections = _collections()
+        if collections is None:
+            return
+        user_ids = list({uid for meetup, _ in due for uid in (meetup['requesterId'], meetup['participantId'])})
+        addresses = {}
+        for name in ('consumers', 'providers'):
+            for user in await collections[name].find(
+                {"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "email": 1, "emailOriginal": 1}
+            ).to_list(None):
+                addresses[user['id']] = user.get('emailOriginal') or user.get('email')
+        await asyncio.gather(*(
+            send_meetup_reminder_email(addresses[uid], meetup.get('title') or 'Meetup', iso(meetup['start']),
+                                       int(lead.total_seconds() // 60))
+            for meetup, lead in due
+            for uid in {meetup['requesterId'], meetup['participantId']} if addresses.get(uid)
+        ), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "meetups": len(self._meetups),
+            "queued": len(self._heap),
+            "horizon": iso(self.horizon) if self.horizon else None,
+            "sent": self.sent,
+            "batches": self.batches,
+            "stale": self.stale,
+        }
+
+
+scheduler = ReminderScheduler()
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+
+
+def to_utc(value: datetime) -> datetime:
+    """Aware UTC datetime; naive values are taken to be UTC already"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def stored(value: datetime) -> datetime:
+    """The representation `start`/`end` are kept in: BSON dates, UTC"""
+    return to_utc(value)
+
+
+def as_datetime(value) -> datetime:
+    """A stored `start`/`end` (BSON date, or an ISO string not migrated yet) as aware UTC"""
+    return to_utc(value if isinstance(value, datetime) else datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+
+def iso(value) -> str:
+    """How `start`/`end` appear in API responses"""
+    return as_datetime(value).isoformat()
@@ -0,0 +1,191 @@
+import os
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+BUS_TICK_SECONDS = float(os.getenv('WS_BUS_TICK_MS', 10)) / 1000
+BUS_COLLECTION = os.getenv('WS_BUS_COLLECTION', 'wsBus')
+BUS_CAPPED_BYTES = int(os.getenv('WS_BUS_CAPPED_BYTES', 64 * 1024 * 1024))
+# A restarted tail re-reads this far behind the last batch seen, for workers whose clocks
+# (and so ObjectIds) lag; batches already delivered are recognised and skipped
+BUS_RESUME_SLACK = timedelta(seconds=float(os.getenv('WS_BUS_RESUME_SLACK_SECONDS', 5)))
+BUS_SEEN_IDS = 10000
+
+# handler(topic, message) is called for every message published by *another* worker
+Handler = Callable[[str, str], Awaitable[None]]
+
+
+class Backplane:
+    """Pub/sub between workers.
+
+    publish() only buffers; a flusher sends everything buffered during one tick as a
+    single batch, so a burst of N messages costs one backplane write instead of N.
+    """
+
+    def __init__(self, tick_seconds: float = None):
+        self.worker_id = uuid.uuid4().hex
+        self.tick_seconds = BUS_TICK_SECONDS if tick_seconds is None else tick_seconds
+        self._buffer: List[dict] = []
+        self._handler: Optional[Handler] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.batches_sent = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    def publish(self, topic: str, message: str):
+        self._buffer.append({"topic": topic, "message": message})
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await self._write(batch)
+            self.batches_sent += 1
+            self.messages_sent += len(batch)
+        except Exception as e:
+            logger.error(f"[BUS] Failed to publish batch of {len(batch)}: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            await self.flush()
+
+    async def _deliver(self, origin: str, batch: List[dict]):
+        if origin == self.worker_id or self._handler is None:
+            return
+        for item in batch:
+            self.messages_received += 1
+            try:
+                await self._handler(item["topic"], item["message"])
+            except Exception as e:
+                logger.error(f"[BUS] Handler failed for {item.get('topic')}: {e}")
+
+    async def _write(self, batch: List[dict]):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            "backplane": type(self).__name__,
+            "workerId": self.worker_id,
+            "batchesSent": self.batches_sent,
+            "messagesSent": self.messages_sent,
+            "messagesReceived": self.messages_received,
+            "buffered": len(self._buffer),
+        }
+
+
+class InProcessBackplane(Backplane):
+    """Backplane between managers in one process (single worker, tests)"""
+
+    _hubs: Dict[str, List['InProcessBackplane']] = {}
+
+    def __init__(self, hub: str = 'default', tick_seconds: float = None):
+        super().__init__(tick_seconds)
+        self.hub = hub
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._hubs.setdefault(self.hub, []).append(self)
+
+    async def stop(self):
+        await super().stop()
+        members = self._hubs.get(self.hub, [])
+        if self in members:
+            members.remove(self)
+
+    async def _write(self, batch: List[dict]):
+        for member in list(self._hubs.get(self.hub, [])):
+            await member._deliver(self.worker_id, batch)
+
+
+class MongoBackplane(Backplane):
+    """Backplane over a tailable cursor on a capped collection: no extra service needed"""
+
+    def __init__(self, database, collection_name: str = BUS_COLLECTION, tick_seconds: float = None):
+        super().__init__(tick_seconds)
+        self.database = database
+        self.collection_name = collection_name
+        self.collection = database[collection_name]
+        self._tailer: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        try:
+            await self.database.create_collection(self.collection_name, capped=True, size=BUS_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass  # already exists
+        # A tailable cursor needs at least one document to sit on
+        last = await self.collection.find_one({}, sort=[("$natural", -1)])
+        if last is None:
+            result = await self.collection.insert_one({"origin": self.worker_id, "messages": [], "ts": datetime.utcnow()})
+            last_id = result.inserted_id
+        else:
+            last_id = last["_id"]
+        await super().start(handler)
+        self._tailer = asyncio.create_task(self._tail(last_id))
+
+    async def stop(self):
+        if self._tailer:
+            self._tailer.cancel()
+            self._tailer = None
+        await super().stop()
+
+    async def _write(self, batch: List[dict]):
+        await self.collection.insert_one({"origin": self.worker_id, "messages": batch, "ts": datetime.utcnow()})
+
+    async def _tail(self, last_id):
+        # Start after the newest batch at startup; after a failure, resume from a bound just
+        # behind the last batch seen so the server skips the rest (never a full re-read)
+        query = {"_id": {"$gt": last_id}}
+        seen: 'OrderedDict[ObjectId, None]' = OrderedDict()
+        while True:
+            try:
+                cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        if doc["_id"] in seen:
+                            continue
+                        seen[doc["_id"]] = None
+                        if len(seen) > BUS_SEEN_IDS:
+                            seen.popitem(last=False)
+                        last_id = doc["_id"]
+                        await self._deliver(doc.get("origin"), doc.get("messages") or [])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[BUS] Tailing {self.collection_name} failed: {e}")
+            query = {"_id": {"$gt": ObjectId.from_datetime(last_id.generation_time - BUS_RESUME_SLACK)}}
+            await asyncio.sleep(0.5)
+
+
+def create_backplane(kind: str = None, database=None) -> Optional[Backplane]:
+    """Build the backplane selected by WS_BACKPLANE (none | memory | mongo)"""
+    kind = (kind or os.getenv('WS_BACKPLANE', 'none')).strip().lower()
+    if kind == 'none':
+        return None
+    if kind == 'mongo':
+        if database is None:
+            raise RuntimeError('Mongo backplane needs a connected database')
+        return MongoBackplane(database)
+    if kind != 'memory':
+        logger.warning(f"Unknown WS_BACKPLANE '{kind}', using in-process backplane")
+    return InProcessBackplane()
@@ -0,0 +1,555 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+from .topics import user_topic, normalize_specialization
+from ..services.consult_requests import ConsultRequestStore, EXPIRED, CANCELLED
+
+logger = logging.getLogger(__name__)
+
+OFFER_TIMEOUT_SECONDS = float(os.getenv('MATCH_OFFER_TIMEOUT_SECONDS', 20))
+REQUEST_TTL_SECONDS = float(os.getenv('MATCH_REQUEST_TTL_SECONDS', 300))
+PROVIDER_CAPACITY = int(os.getenv('MATCH_PROVIDER_CAPACITY', 1))
+LATENCY_SAMPLES = 1000
+
+ANY_POOL = '*'  # every online provider, for requests without a (served) specialization
+
+
+class _Provider:
+    __slots__ = ('id', 'specialization', 'rank', 'load', 'connections', 'remote', 'last_assigned', 'version')
+
+    def __init__(self, provider_id: str, specialization: str, rank: int):
+        self.id = provider_id
+        self.specialization = specialization
+        self.rank = rank
+        self.load = 0
+        self.connections = 0
+        self.remote = False  # also connected to another worker
+        self.last_assigned = -1
+        self.version = 0
+
+
+class _Request:
+    __slots__ = (
+        'id', 'requester_id', 'connection_id', 'role', 'symptom', 'specialization', 'pool',
+        'submitted_at', 'offered_at', 'offered_to', 'tried', 'offer_timer', 'expiry_timer', 'waiting'
+    )
+
+    def __init__(self, requester_id: Optional[str], connection_id: str, role: str, symptom: str, specialization: str):
+        self.id = str(uuid.uuid4())
+        self.requester_id = requester_id
+        self.connection_id = connection_id
+        self.role = role
+        self.symptom = symptom
+        self.specialization = specialization
+        self.pool = ANY_POOL
+        self.submitted_at = time.monotonic()
+        self.offered_at: Optional[float] = None
+        self.offered_to: Optional[str] = None
+        self.tried: Set[str] = set()
+        self.offer_timer: Optional[asyncio.TimerHandle] = None
+        self.expiry_timer: Optional[asyncio.TimerHandle] = None
+        self.waiting = False
+
+
+class _Match:
+    __slots__ = ('request_id', 'requester_id', 'connection_id', 'provider_id')
+
+    def __init__(self, request_id: str, requester_id: Optional[str], connection_id: str, provider_id: str):
+        self.request_id = request_id
+        self.requester_id = requester_id
+        self.connection_id = connection_id
+        self.provider_id = provider_id
+
+    @classmethod
+    def of(cls, request: _Request, provider_id: str) -> '_Match':
+        return cls(request.id, request.requester_id, request.connection_id, provider_id)
+
+
+def _percentiles(samples) -> dict:
+    if not samples:
+        return {"p50": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    return {
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class MatchmakingEngine:
+    """Queues consult requests and offers them to online providers one at a time.
+
+    Providers live in per-specialization heaps keyed by (load, last assignment, -rank):
+    the least-loaded provider who has waited longest wins, rank breaks ties. Entries are
+    invalidated lazily by a version counter, so every assignment is O(log n).
+
+    With a backplane, providers on other workers are indexed too (from presence) and
+    load changes are mirrored between workers. A request stays with the worker it was
+    submitted on; accepts, declines and ends for it are forwarded there.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.providers: Dict[str, _Provider] = {}
+        self.heaps: Dict[str, list] = {}
+        self.pool_sizes: Dict[str, int] = {}
+        self.waiting: Dict[str, deque] = {}
+        self.requests: Dict[str, _Request] = {}
+        self.matches: Dict[str, _Match] = {}
+        self.by_connection: Dict[str, Set[str]] = {}
+        self._assignments = itertools.count()
+        self.queue_wait_ms: deque = deque(maxlen=LATENCY_SAMPLES)
+        self.match_latency_ms: deque = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {"submitted": 0, "offered": 0, "matched": 0, "declined": 0, "timeouts": 0, "expired": 0, "cancelled": 0}
+        self.store = ConsultRequestStore()
+
+    # ---- Provider availability index -----------------------------------------
+    def _pools(self, provider: _Provider) -> List[str]:
+        return [provider.specialization, ANY_POOL] if provider.specialization else [ANY_POOL]
+
+    def _push(self, provider: _Provider):
+        provider.version += 1
+        entry = (provider.load, provider.last_assigned, -provider.rank, provider.id, provider.version)
+        for pool in self._pools(provider):
+            heap = self.heaps.setdefault(pool, [])
+            heapq.heappush(heap, entry)
+            if len(heap) > 4 * self.pool_sizes.get(pool, 0) + 64:
+                self._compact(pool)
+
+    def _compact(self, pool: str):
+        """Drop stale entries left behind by lazy invalidation"""
+        heap = [e for e in self.heaps.get(pool, []) if self._valid(e)]
+        heapq.heapify(heap)
+        self.heaps[pool] = heap
+
+    def _valid(self, entry) -> bool:
+        provider = self.providers.get(entry[3])
+        return provider is not None and provider.version == entry[4]
+
+    def _pick(self, pool: str, exclude: Set[str]) -> Optional[_Provider]:
+        heap = self.heaps.get(pool)
+        skipped = []
+        found = None
+        while heap:
+            entry = heap[0]
+            if not self._valid(entry):
+                heapq.heappop(heap)
+                continue
+            if entry[0] >= PROVIDER_CAPACITY:
+                break
+            if entry[3] in exclude:
+                skipped.append(heapq.heappop(heap))
+                continue
+            found = self.providers[entry[3]]
+            break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return found
+
+    def _add(self, provider_id: str) -> _Provider:
+        provider = _Provider(provider_id, '', 0)
+        self.providers[provider_id] = provider
+        self.pool_sizes[ANY_POOL] = self.pool_sizes.get(ANY_POOL, 0) + 1
+        return provider
+
+    async def provider_online(self, provider_id: str, specialization: str = None, rank: int = 0):
+        """Register one more live connection for a provider (or refresh its profile)"""
+        provider = self.providers.get(provider_id) or self._add(provider_id)
+        provider.connections += 1
+        self._set_profile(provider, specialization, rank)
+        self._push(provider)
+        await self._drain_waiting(provider)
+
+    async def provider_updated(self, provider_id: str, specialization: str = None, rank: int = None):
+        provider = self.providers.get(provider_id)
+        if provider is None:
+            return
+        self._set_profile(provider, specialization, provider.rank if rank is None else rank)
+        self._push(provider)
+        await self._drain_waiting(provider)
+
+    def _set_profile(self, provider: _Provider, specialization: Optional[str], rank: Optional[int]):
+        specialization = normalize_specialization(specialization)
+        if specialization != provider.specialization:
+            if provider.specialization:
+                self.pool_sizes[provider.specialization] -= 1
+            if specialization:
+                self.pool_sizes[specialization] = self.pool_sizes.get(specialization, 0) + 1
+            provider.specialization = specialization
+        try:
+            provider.rank = int(rank or 0)
+        except (TypeError, ValueError):
+            provider.rank = 0
+
+    async def provider_offline(self, provider_id: str):
+        """Drop one live connection; the provider leaves the index with its last one"""
+        provider = self.providers.get(provider_id)
+        if provider is None:
+            return
+        provider.connections -= 1
+        if provider.connections > 0 or provider.remote:
+            return
+        await self._remove(provider)
+
+    async def remote_providers(self, entries: Dict[str, dict]):
+        """Mirror the providers connected to other workers (presence entries by user id)"""
+        for provider_id, entry in entries.items():
+            provider = self.providers.get(provider_id)
+            if provider is None:
+                provider = self._add(provider_id)
+            elif provider.remote and (
+                provider.connections or normalize_specialization(entry.get('specialization')) == provider.specialization
+            ):
+                continue
+            provider.remote = True
+            if not provider.connections:
+                self._set_profile(provider, entry.get('specialization'), provider.rank)
+            self._push(provider)
+            await self._drain_waiting(provider)
+        for provider in [p for p in self.providers.values() if p.remote and p.id not in entries]:
+            provider.remote = False
+            if provider.connections <= 0:
+                await self._remove(provider)
+
+    async def _remove(self, provider: _Provider):
+        provider_id = provider.id
+        del self.providers[provider_id]
+        for pool in self._pools(provider):
+            self.pool_sizes[pool] -= 1
+
+        for request in [r for r in self.requests.values() if r.offered_to == provider_id]:
+            await self._offer_failed(request, provider_id, 'offline')
+        for match in [m for m in self.matches.values() if m.provider_id == provider_id]:
+            del self.matches[match.request_id]
+            self.manager.revoke_room(f"consult:{match.request_id}")
+            await self._send_requester(match, {"type": "consult_ended", "requestId": match.request_id, "reason": "provider_offline"})
+
+    # ---- Request lifecycle ---------------------------------------------------
+    async def submit(self, requester_id: Optional[str], connection_id: str, role: str, symptom: str, specialization: str = None) -> dict:
+        request = _Request(requester_id, connection_id, role, symptom, normalize_specialization(specialization))
+        fallback = False
+        if request.specialization:
+            if self.pool_sizes.get(request.specialization):
+                request.pool = request.specialization
+            else:
+                fallback = True  # nobody with this specialization is online
+        self.requests[request.id] = request
+        self.by_connection.setdefault(connection_id, set()).add(request.id)
+        self.counters["submitted"] += 1
+        self.store.created(request.id, requester_id, role, symptom, request.specialization, REQUEST_TTL_SECONDS)
+        loop = asyncio.get_running_loop()
+        request.expiry_timer = loop.call_later(REQUEST_TTL_SECONDS, self._schedule, self.expire, request.id)
+
+        await self._dispatch(request)
+        return {
+            "requestId": request.id,
+            "status": "offered" if request.offered_to else "queued",
+            "fallback": fallback,
+        }
+
+    def _schedule(self, func, *args):
+        asyncio.ensure_future(func(*args))
+
+    async def _dispatch(self, request: _Request, front: bool = False):
+        provider = self._pick(request.pool, request.tried)
+        if provider is not None:
+            await self._offer(request, provider)
+            return
+        if request.tried and self._exhausted(request):
+            await self._finish(request, "consult_unmatched", "expired")
+            return
+        if not request.waiting:
+            request.waiting = True
+            queue = self.waiting.setdefault(request.pool, deque())
+            if front:
+                queue.appendleft(request.id)
+            else:
+                queue.append(request.id)
+
+    def _exhausted(self, request: _Request) -> bool:
+        """Every online provider in the request's pool has already declined it"""
+        tried_online = sum(
+            1 for pid in request.tried
+            if pid in self.providers and (request.pool == ANY_POOL or self.providers[pid].specialization == request.pool)
+        )
+        return tried_online >= self.pool_sizes.get(request.pool, 0)
+
+    async def _offer(self, request: _Request, provider: _Provider):
+        now = time.monotonic()
+        request.waiting = False
+        request.offered_to = provider.id
+        if request.offered_at is None:
+            request.offered_at = now
+            self.queue_wait_ms.append((now - request.submitted_at) * 1000)
+        provider.load += 1
+        provider.last_assigned = next(self._assignments)
+        self._push(provider)
+        self._forward({"op": "load", "providerId": provider.id, "delta": 1})
+        self.counters["offered"] += 1
+        self.store.offered(request.id, provider.id)
+
+        loop = asyncio.get_running_loop()
+        request.offer_timer = loop.call_later(OFFER_TIMEOUT_SECONDS, self._schedule, self.decline, provider.id, request.id, 'timeout')
+        await self._send_provider(provider.id, {
+            "type": "consult_offer",
+            "requestId": request.id,
+            "from": request.requester_id or 'anonymous',
+            "role": request.role,
+            "symptom": request.symptom,
+            "specialization": request.specialization or None,
+            "timeoutMs": int(OFFER_TIMEOUT_SECONDS * 1000),
+        })
+
+    async def accept(self, provider_id: str, request_id: str) -> bool:
+        request = self.requests.get(request_id)
+        if request is None:
+            return self._forward({"op": "accept", "requestId": request_id, "providerId": provider_id})
+        if request.offered_to != provider_id:
+            return False
+        # The offer can no longer time out while the claim is in flight
+        if request.offer_timer:
+            request.offer_timer.cancel()
+            request.offer_timer = None
+        claimed, _ = await self.store.claim(request_id, provider_id)
+        if self.requests.get(request_id) is not request:
+            return False  # withdrawn by the requester meanwhile
+        if not claimed:
+            # Taken through the REST queue (possibly on another worker) or already expired
+            self._forget(request)
+            await self._release(provider_id)
+            return False
+        await self._matched(request, provider_id)
+        return True
+
+    async def claimed(self, request_id: str, provider_id: str, doc: dict):
+        """A provider won the request through the persistent queue (POST /consults/{id}/claim)"""
+        request = self.requests.get(request_id)
+        if request is None:
+            # Submitted on another worker (whose engine takes it off its queue) or before a restart
+            self._forward({"op": "claimed", "requestId": request_id, "providerId": provider_id})
+            await self._announce_match(_Match(request_id, doc.get('requesterId'), '', provider_id))
+            return
+        offered_to = request.offered_to
+        await self._matched(request, provider_id)
+        await self._withdraw_offer(request_id, offered_to, provider_id)
+
+    async def _claimed_elsewhere(self, request: _Request, provider_id: str):
+        """Claimed through another worker, which announced the match: stop offering it here"""
+        offered_to = request.offered_to
+        self._forget(request)
+        self.counters["matched"] += 1
+        match = _Match.of(request, provider_id)
+        self.matches[request.id] = match
+        if not request.requester_id:
+            # A guest is only reachable through its socket on this worker
+            await self._send_requester(match, self._match_event(match))
+        await self._withdraw_offer(request.id, offered_to, provider_id)
+
+    async def _withdraw_offer(self, request_id: str, offered_to: Optional[str], provider_id: str):
+        if offered_to and offered_to != provider_id:
+            await self._send_provider(offered_to, {"type": "consult_offer_cancelled", "requestId": request_id})
+            await self._release(offered_to)
+
+    async def _matched(self, request: _Request, provider_id: str):
+        self._forget(request)
+        self.counters["matched"] += 1
+        self.match_latency_ms.append((time.monotonic() - request.submitted_at) * 1000)
+
+        match = _Match.of(request, provider_id)
+        self.matches[request.id] = match
+        await self._announce_match(match)
+
+    def _match_event(self, match: _Match) -> dict:
+        return {"type": "consult_matched", "requestId": match.request_id, "room": f"consult:{match.request_id}",
+                "providerId": match.provider_id, "requesterId": match.requester_id}
+
+    async def _announce_match(self, match: _Match):
+        event = self._match_event(match)
+        self.manager.grant_room(event["room"], {uid for uid in (match.requester_id, match.provider_id) if uid})
+        await self._send_requester(match, event)
+        await self._send_provider(match.provider_id, event)
+
+    async def decline(self, provider_id: str, request_id: str, reason: str = 'declined') -> bool:
+        request = self.requests.get(request_id)
+        if request is None:
+            return self._forward({"op": "decline", "requestId": request_id, "providerId": provider_id})
+        if request.offered_to != provider_id:
+            return False
+        await self._offer_failed(request, provider_id, reason)
+        return True
+
+    async def _offer_failed(self, request: _Request, provider_id: str, reason: str):
+        if request.offer_timer:
+            request.offer_timer.cancel()
+            request.offer_timer = None
+        request.offered_to = None
+        request.tried.add(provider_id)
+        self.counters["timeouts" if reason == 'timeout' else "declined"] += 1
+        self.store.requeued(request.id)
+        if reason == 'timeout':
+            await self._send_provider(provider_id, {"type": "consult_offer_expired", "requestId": request.id})
+        # Fall through to the next candidate before the freed provider picks up queued work
+        await self._dispatch(request)
+        await self._release(provider_id)
+
+    async def cancel(self, request_id: str, connection_id: str) -> bool:
+        request = self.requests.get(request_id)
+        if request is None or request.connection_id != connection_id:
+            return False
+        self.counters["cancelled"] += 1
+        offered_to = request.offered_to
+        self._forget(request)
+        self.store.finished(request.id, CANCELLED)
+        if offered_to:
+            await self._send_provider(offered_to, {"type": "consult_offer_cancelled", "requestId": request.id})
+            await self._release(offered_to)
+        return True
+
+    async def expire(self, request_id: str):
+        request = self.requests.get(request_id)
+        if request is None:
+            return
+        offered_to = request.offered_to
+        await self._finish(request, "consult_unmatched", "expired")
+        if offered_to:
+            await self._send_provider(offered_to, {"type": "consult_offer_expired", "requestId": request.id})
+            await self._release(offered_to)
+
+    async def end(self, request_id: str, user_id: str) -> bool:
+        """Either party closes a matched consult, freeing the provider"""
+        match = self.matches.get(request_id)
+        if match is None:
+            return self._forward({"op": "end", "requestId": request_id, "userId": user_id})
+        if user_id not in (match.provider_id, match.requester_id):
+            return False
+        del self.matches[request_id]
+        self.manager.revoke_room(f"consult:{request_id}")
+        event = {"type": "consult_ended", "requestId": request_id, "reason": "ended"}
+        await self._send_requester(match, event)
+        await self._send_provider(match.provider_id, event)
+        await self._release(match.provider_id)
+        return True
+
+    async def connection_closed(self, connection_id: str):
+        """Withdraw requests made over a socket that went away"""
+        for request_id in list(self.by_connection.get(connection_id, ())):
+            await self.cancel(request_id, connection_id)
+        self.by_connection.pop(connection_id, None)
+
+    async def _finish(self, request: _Request, event_type: str, counter: str):
+        self._forget(request)
+        self.counters[counter] += 1
+        self.store.finished(request.id, EXPIRED)
+        await self._send_requester(_Match.of(request, ''), {"type": event_type, "requestId": request.id})
+
+    def _forget(self, request: _Request):
+        for timer in (request.offer_timer, request.expiry_timer):
+            if timer:
+                timer.cancel()
+        request.offer_timer = request.expiry_timer = None
+        request.waiting = False
+        request.offered_to = None
+        self.requests.pop(request.id, None)
+        ids = self.by_connection.get(request.connection_id)
+        if ids is not None:
+            ids.discard(request.id)
+            if not ids:
+                del self.by_connection[request.connection_id]
+
+    async def _release(self, provider_id: str):
+        provider = self.providers.get(provider_id)
+        if provider is None:
+            return
+        provider.load = max(0, provider.load - 1)
+        self._push(provider)
+        self._forward({"op": "load", "providerId": provider_id, "delta": -1})
+        await self._drain_waiting(provider)
+
+    async def _drain_waiting(self, provider: _Provider):
+        """Hand the oldest queued requests this provider can serve to the best candidates"""
+        while provider.id in self.providers and provider.load < PROVIDER_CAPACITY:
+            request = self._oldest_waiting(self._pools(provider), provider.id)
+            if request is None:
+                return
+            self.waiting[request.pool].remove(request.id)
+            request.waiting = False
+            await self._dispatch(request, front=True)
+            if request.waiting:
+                return  # nobody could take it after all; it keeps its place at the head
+
+    def _oldest_waiting(self, pools: List[str], provider_id: str) -> Optional[_Request]:
+        """Oldest queued request in these pools that the provider has not declined yet"""
+        oldest = None
+        for pool in pools:
+            queue = self.waiting.get(pool)
+            while queue:
+                request = self.requests.get(queue[0])
+                if request is None or not request.waiting:
+                    queue.popleft()
+                    continue
+                break
+            # Heads this provider already declined stay put for the others
+            for request_id in queue or ():
+                request = self.requests.get(request_id)
+                if request is None or not request.waiting or provider_id in request.tried:
+                    continue
+                if oldest is None or request.submitted_at < oldest.submitted_at:
+                    oldest = request
+                break
+        return oldest
+
+    # ---- Other workers -------------------------------------------------------
+    def _forward(self, event: dict) -> bool:
+        """Tell the other workers' engines; False when there are none"""
+        return self.manager.relay_match(event)
+
+    async def remote_event(self, event: dict):
+        """Another worker's engine changed a provider's load, or acted on a request held here"""
+        op = event.get('op')
+        if op == 'load':
+            provider = self.providers.get(event.get('providerId'))
+            if provider is None:
+                return
+            provider.load = max(0, provider.load + event['delta'])
+            self._push(provider)
+            if event['delta'] < 0:
+                await self._drain_waiting(provider)
+        elif op in ('accept', 'decline') and event.get('requestId') in self.requests:
+            if op == 'accept':
+                await self.accept(event['providerId'], event['requestId'])
+            else:
+                await self.decline(event['providerId'], event['requestId'])
+        elif op == 'claimed' and event.get('requestId') in self.requests:
+            await self._claimed_elsewhere(self.requests[event['requestId']], event['providerId'])
+        elif op == 'end' and event.get('requestId') in self.matches:
+            await self.end(event['requestId'], event['userId'])
+
+    # ---- Delivery -----------------------------------------------------------
+    async def _send_provider(self, provider_id: str, message: dict):
+        await self.manager.publish(user_topic(provider_id), json.dumps(message))
+
+    async def _send_requester(self, match: _Match, message: dict):
+        if match.requester_id:
+            await self.manager.publish(user_topic(match.requester_id), json.dumps(message))
+        else:
+            await self.manager.send_personal_message(json.dumps(message), match.connection_id)
+
+    def stats(self) -> dict:
+        return {
+            "onlineProviders": len(self.providers),
+            "waitingRequests": sum(1 for r in self.requests.values() if r.waiting),
+            "pendingOffers": sum(1 for r in self.requests.values() if r.offered_to),
+            "activeMatches": len(self.matches),
+            "counters": dict(self.counters),
+            "queueWaitMs": _percentiles(self.queue_wait_ms),
+            "matchLatencyMs": _percentiles(self.match_latency_ms),
+            "store": self.store.stats(),
+        }
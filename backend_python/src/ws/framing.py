@@ -0,0 +1,87 @@
+import json
+import logging
+from typing import List, Optional, Sequence, Union
+
+try:  # msgpack is optional; without it only the JSON subprotocol is offered
+    import msgpack  # type: ignore
+except Exception:  # pragma: no cover - depends on the environment
+    msgpack = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+JSON_SUBPROTOCOL = 'consultflow.json'
+MSGPACK_SUBPROTOCOL = 'consultflow.msgpack'
+
+
+def supported_subprotocols() -> List[str]:
+    return [JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL] if msgpack is not None else [JSON_SUBPROTOCOL]
+
+
+def negotiate(requested: Sequence[str]) -> Optional[str]:
+    """Pick the first subprotocol the client offered that we support (None = plain JSON)"""
+    supported = supported_subprotocols()
+    for protocol in requested or ():
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def codec_for(subprotocol: Optional[str]) -> str:
+    return 'msgpack' if subprotocol == MSGPACK_SUBPROTOCOL else 'json'
+
+
+class Frame:
+    """One outbound message, encoded at most once per codec however many sockets it goes to"""
+
+    __slots__ = ('_text', '_data', '_packed')
+
+    def __init__(self, text: str = None, data: dict = None):
+        self._text = text
+        self._data = data
+        self._packed: Optional[bytes] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = json.dumps(self._data)
+        return self._text
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = json.loads(self._text)
+        return self._data
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            self._packed = msgpack.packb(self.data, use_bin_type=True)
+        return self._packed
+
+    def encode(self, codec: str) -> Union[str, bytes]:
+        return self.packed if codec == 'msgpack' else self.text
+
+
+def as_frame(message: Union[str, Frame]) -> Frame:
+    return message if isinstance(message, Frame) else Frame(text=message)
+
+
+def encode_batch(frames: List[Frame], codec: str) -> Union[str, bytes]:
+    """Wrap several frames as {"type": "batch", "messages": [...]} reusing their cached encodings"""
+    if codec == 'msgpack':
+        packer = msgpack.Packer(use_bin_type=True)
+        return (
+            packer.pack_map_header(2) + packer.pack('type') + packer.pack('batch')
+            + packer.pack('messages') + packer.pack_array_header(len(frames))
+            + b''.join(frame.packed for frame in frames)
+        )
+    return '{"type": "batch", "messages": [' + ', '.join(frame.text for frame in frames) + ']}'
+
+
+def decode_inbound(message: dict, codec: str):
+    """Decode an ASGI websocket.receive message into a Python object"""
+    if message.get('bytes') is not None:
+        if codec == 'msgpack':
+            return msgpack.unpackb(message['bytes'], raw=False)
+        return json.loads(message['bytes'])
+    return json.loads(message.get('text') or '')
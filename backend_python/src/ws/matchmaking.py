@@ -1,64 +1,536 @@
+import os
 import json
+import time
+import asyncio
 import logging
-from typing import Dict, Set
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
+from typing import Dict, Optional, Set, Union
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, HTTPException, Depends, status
 from fastapi.websockets import WebSocketState
 
-from ..utils.auth import verify_token
+from ..db import get_collections, get_db
+from ..utils.auth import verify_token, verify_token_middleware
+from ..services.chat import ChatLog, CHAT_MAX_LENGTH
+from .topics import USER_TOPIC_PREFIX, user_topic, room_topic, default_topics
+from .engine import MatchmakingEngine
+from .backplane import Backplane, create_backplane
+from .presence import PresenceRegistry, PRESENCE_EVENTS_TOPIC, PRESENCE_HEARTBEAT_SECONDS, presence_entry
+from .replay import ReplayBuffer
+from .signaling import ConsultChatAuth, SignalingAuth, SIGNALING_TYPES
+from .framing import Frame, as_frame, codec_for, decode_inbound, encode_batch, negotiate
 
 logger = logging.getLogger(__name__)
 
+# Outbound queue configuration
+SEND_QUEUE_SIZE = int(os.getenv('WS_SEND_QUEUE_SIZE', 256))
+SLOW_CONSUMER_POLICIES = ('drop_oldest', 'disconnect')
+SLOW_CONSUMER_POLICY = os.getenv('WS_SLOW_CONSUMER_POLICY', 'drop_oldest').strip().lower()
+if SLOW_CONSUMER_POLICY not in SLOW_CONSUMER_POLICIES:
+    logger.warning(
+        f"Invalid WS_SLOW_CONSUMER_POLICY '{SLOW_CONSUMER_POLICY}', "
+        f"expected one of {SLOW_CONSUMER_POLICIES}; using 'drop_oldest'"
+    )
+    SLOW_CONSUMER_POLICY = 'drop_oldest'
+
+# Heartbeats: uvicorn sends protocol-level pings (browsers answer them on their own) and
+# closes sockets that stop answering. Quiet sockets also get a JSON ping; one that has
+# answered with a JSON pong is reaped by the app once it stays silent
+PING_INTERVAL_SECONDS = float(os.getenv('WS_PING_INTERVAL_SECONDS', 20))
+IDLE_TIMEOUT_SECONDS = float(os.getenv('WS_IDLE_TIMEOUT_SECONDS', 60))
+
+# Inbound token buckets (messages per second, burst); guests get a tighter budget
+RATE_LIMIT_PER_SECOND = float(os.getenv('WS_RATE_LIMIT_PER_SECOND', 20))
+RATE_LIMIT_BURST = float(os.getenv('WS_RATE_LIMIT_BURST', 40))
+GUEST_RATE_LIMIT_PER_SECOND = float(os.getenv('WS_GUEST_RATE_LIMIT_PER_SECOND', 2))
+GUEST_RATE_LIMIT_BURST = float(os.getenv('WS_GUEST_RATE_LIMIT_BURST', 10))
+MESSAGE_COSTS = {
+    'consult_request': float(os.getenv('WS_CONSULT_REQUEST_COST', 5)),
+    # Candidates arrive in bursts while a call connects
+    'webrtc.ice': float(os.getenv('WS_WEBRTC_ICE_COST', 0.25)),
+}
+
+# Optional micro-batching: frames queued within the window go out as one {"type": "batch"} frame
+BATCH_WINDOW_SECONDS = float(os.getenv('WS_BATCH_WINDOW_MS', 0)) / 1000
+BATCH_MAX_MESSAGES = int(os.getenv('WS_BATCH_MAX_MESSAGES', 32))
+
+# Reserved backplane topics
+BROADCAST_TOPIC = '__broadcast__'
+PRESENCE_TOPIC = '__presence__'
+MATCH_TOPIC = '__match__'
+
+
+class Connection:
+    """A connected socket with its own bounded outbound queue drained by a writer task"""
+
+    kind = 'ws'
+
+    def __init__(self, websocket: WebSocket, connection_id: str, user_data: dict = None, subprotocol: str = None):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.user_data = user_data or {}
+        self.subprotocol = subprotocol
+        self.codec = codec_for(subprotocol)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+        self.max_depth = 0
+        self.topics: Set[str] = set()
+        self.last_seen = time.monotonic()
+        self.json_heartbeat = False  # answered a JSON ping, so silence means it is gone
+        self.pinged_at = float('-inf')
+        guest = not self.user_data.get('id')
+        self.rate = GUEST_RATE_LIMIT_PER_SECOND if guest else RATE_LIMIT_PER_SECOND
+        self.burst = GUEST_RATE_LIMIT_BURST if guest else RATE_LIMIT_BURST
+        self.tokens = self.burst
+        self.throttled = False
+
+    @property
+    def open(self) -> bool:
+        return self.websocket.client_state == WebSocketState.CONNECTED
+
+    async def run_writer(self):
+        """Send queued frames; a stalled socket only blocks itself"""
+        try:
+            while True:
+                frames = [await self.queue.get()]
+                if BATCH_WINDOW_SECONDS > 0:
+                    await asyncio.sleep(BATCH_WINDOW_SECONDS)
+                    while len(frames) < BATCH_MAX_MESSAGES and not self.queue.empty():
+                        frames.append(self.queue.get_nowait())
+                if not self.open:
+                    continue
+                payload = frames[0].encode(self.codec) if len(frames) == 1 else encode_batch(frames, self.codec)
+                if isinstance(payload, bytes):
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to {self.connection_id}: {e}")
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.user_connections: Dict[str, str] = {}  # user_id -> connection_id
-
-    async def connect(self, websocket: WebSocket, connection_id: str, user_data: dict = None):
-        await websocket.accept()
-        self.active_connections[connection_id] = websocket
-        
-        if user_data and user_data.get('id'):
-            self.user_connections[user_data['id']] = connection_id
-        
-        # Send welcome message
+        self.active_connections: Dict[str, Connection] = {}
+        self.topics: Dict[str, Set[str]] = {}  # topic -> connection_ids
+        self.room_grants: Dict[str, Set[str]] = {}  # room -> user_ids allowed to join
+        self.dropped_messages = 0
+        self.slow_consumer_disconnects = 0
+        self.engine = MatchmakingEngine(self)
+        self.backplane: Optional[Backplane] = None
+        self.presence = PresenceRegistry()
+        self.replay = ReplayBuffer()
+        self.chat = ChatLog()
+        self.signaling = SignalingAuth()
+        self.chat_auth = ConsultChatAuth()
+        self._presence_heartbeat: Optional[asyncio.Task] = None
+        self.reaped_connections = 0
+        self.throttled_messages = 0
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def attach_backplane(self, backplane: Backplane):
+        """Relay topic traffic and presence to/from other workers"""
+        await backplane.start(self._on_remote)
+        self.backplane = backplane
+        self._announce_snapshot()
+        self._presence_heartbeat = asyncio.create_task(self._presence_loop())
+
+    async def detach_backplane(self):
+        if self.backplane:
+            if self._presence_heartbeat:
+                self._presence_heartbeat.cancel()
+                self._presence_heartbeat = None
+            # Let the other workers drop our users now rather than after the TTL
+            self.backplane.publish(PRESENCE_TOPIC, json.dumps({"worker": self.backplane.worker_id, "op": "stop"}))
+            await self.backplane.stop()
+            self.backplane = None
+
+    async def _on_remote(self, topic: str, message: str):
+        if topic == PRESENCE_TOPIC:
+            event = json.loads(message)
+            if event['op'] == 'change':
+                deltas = self.presence.remote_change(event['worker'], event['entry'], event['online'])
+            elif event['op'] == 'snapshot':
+                deltas = self.presence.apply_remote(event['worker'], event['users'])
+            else:
+                deltas = self.presence.drop_worker(event['worker'])
+            await self._publish_presence(deltas)
+            await self.engine.remote_providers(self.presence.remote_providers())
+        elif topic == MATCH_TOPIC:
+            await self.engine.remote_event(json.loads(message))
+        elif topic == BROADCAST_TOPIC:
+            await self.broadcast(message, local_only=True)
+        else:
+            await self.publish(topic, message, local_only=True)
+
+    def _announce_presence(self, user_data: dict, online: bool):
+        if self.backplane and user_data.get('id'):
+            self.backplane.publish(PRESENCE_TOPIC, json.dumps({
+                "worker": self.backplane.worker_id,
+                "op": "change",
+                "entry": presence_entry(user_data),
+                "online": online
+            }))
+
+    def relay_match(self, event: dict) -> bool:
+        """Send a matchmaking event to the other workers' engines; False without a backplane"""
+        if not self.backplane:
+            return False
+        self.backplane.publish(MATCH_TOPIC, json.dumps(event))
+        return True
+
+    def _announce_snapshot(self):
+        if self.backplane:
+            self.backplane.publish(PRESENCE_TOPIC, json.dumps({
+                "worker": self.backplane.worker_id,
+                "op": "snapshot",
+                "users": self.presence.snapshot()
+            }))
+
+    async def _presence_loop(self):
+        # Heartbeat our user list and expire workers that stopped sending theirs
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_SECONDS)
+            try:
+                self._announce_snapshot()
+                deltas = self.presence.expire()
+                if deltas:
+                    await self._publish_presence(deltas)
+                    await self.engine.remote_providers(self.presence.remote_providers())
+            except Exception as e:
+                logger.error(f"Presence heartbeat failed: {e}")
+
+    async def _publish_presence(self, deltas):
+        """Tell this worker's presence subscribers about providers coming and going"""
+        for delta in deltas:
+            if delta and delta.get('role') == 'provider':
+                await self.publish(PRESENCE_EVENTS_TOPIC, json.dumps(delta), local_only=True)
+
+    def is_online(self, user_id: str) -> bool:
+        """True if the user has a socket on this or any other worker"""
+        return self.presence.is_online(user_id)
+
+    async def connect(self, websocket: WebSocket, connection_id: str, user_data: dict = None,
+                      subprotocol: str = None, since: int = None):
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(websocket, connection_id, user_data, subprotocol)
+        connection.writer = asyncio.create_task(connection.run_writer())
+        connection.writer.add_done_callback(lambda task: self._writer_done(connection, task))
+        self.active_connections[connection_id] = connection
+        user_id = user_data.get('id') if user_data else None
+
+        # Send welcome message; `seq` is the newest sequence number on the user's stream
         welcome_msg = {
             "type": "welcome",
             "message": "Connected to realtime provider channel",
             "role": user_data.get('role', 'guest') if user_data else 'guest'
         }
-        await self.send_personal_message(json.dumps(welcome_msg), connection_id)
+        if user_id:
+            welcome_msg["seq"] = self.replay.last_seq(user_id)
+        self._enqueue(connection, json.dumps(welcome_msg))
+
+        first_for_user = bool(user_id) and user_id not in self.presence.local_counts
+        for topic in default_topics(user_data):
+            self.subscribe(connection_id, topic)
+        # No await since subscribing, so nothing published meanwhile is both replayed and delivered live
+        if user_id and since is not None:
+            self._replay(connection, user_id, since)
+        if first_for_user:
+            self._announce_presence(user_data, True)
+        await self._publish_presence([self.presence.connected(user_data)])
+
+        if _is_provider(user_data):
+            await self.engine.provider_online(user_data['id'], user_data.get('specialization'), user_data.get('rank'))
+
+    def connect_stream(self, subscriber, since: int = None):
+        """Register a one-way event stream; it gets the same topic routing as a socket"""
+        self.active_connections[subscriber.connection_id] = subscriber
+        for topic in default_topics(subscriber.user_data):
+            self.subscribe(subscriber.connection_id, topic)
+        user_id = subscriber.user_data.get('id')
+        if user_id and since is not None:
+            self._replay(subscriber, user_id, since)
+
+    def _replay(self, connection: Connection, user_id: str, since: int):
+        """Resend what the user's stream carried after `since`; flag a gap if some of it is gone"""
+        frames, floor = self.replay.since(user_id, since)
+        if floor is not None:
+            self._enqueue(connection, json.dumps({"type": "replay_gap", "since": since, "floor": floor}))
+        for frame in frames:
+            self._enqueue(connection, frame)
 
     def disconnect(self, connection_id: str):
-        # Remove from user connections
-        user_to_remove = None
-        for user_id, conn_id in self.user_connections.items():
-            if conn_id == connection_id:
-                user_to_remove = user_id
-                break
-        
-        if user_to_remove:
-            del self.user_connections[user_to_remove]
-        
-        # Remove from active connections
-        if connection_id in self.active_connections:
-            del self.active_connections[connection_id]
-
-    async def send_personal_message(self, message: str, connection_id: str):
-        websocket = self.active_connections.get(connection_id)
-        if websocket and websocket.client_state == WebSocketState.CONNECTED:
+        # Remove from active connections and stop its writer
+        connection = self.active_connections.pop(connection_id, None)
+        if not connection:
+            return
+
+        for topic in list(connection.topics):
+            self.unsubscribe(connection_id, topic, connection)
+        if connection.kind == 'sse':
+            # Event streams are receive-only: not part of presence or matchmaking
+            return
+        delta = self.presence.disconnected(connection.user_data)
+        user_id = connection.user_data.get('id')
+        if user_id and user_id not in self.presence.local_counts:
+            self._announce_presence(connection.user_data, False)
+        if delta:
+            asyncio.ensure_future(self._publish_presence([delta]))
+
+        if connection.writer:
+            connection.writer.cancel()
+
+        # Engine bookkeeping may send messages, so it runs as its own task
+        asyncio.ensure_future(self._release_engine(connection))
+
+    async def _release_engine(self, connection: Connection):
+        try:
+            await self.engine.connection_closed(connection.connection_id)
+            if _is_provider(connection.user_data):
+                await self.engine.provider_offline(connection.user_data['id'])
+        except Exception as e:
+            logger.error(f"Matchmaking cleanup failed for {connection.connection_id}: {e}")
+
+    def subscribe(self, connection_id: str, topic: str):
+        connection = self.active_connections.get(connection_id)
+        if not connection:
+            return
+        connection.topics.add(topic)
+        self.topics.setdefault(topic, set()).add(connection_id)
+
+    def unsubscribe(self, connection_id: str, topic: str, connection: Connection = None):
+        connection = connection or self.active_connections.get(connection_id)
+        if connection:
+            connection.topics.discard(topic)
+        members = self.topics.get(topic)
+        if members is not None:
+            members.discard(connection_id)
+            if not members:
+                del self.topics[topic]
+
+    async def update_profile(self, user_id: str, changes: dict):
+        """Apply profile changes to a user's live connections and re-derive their topics"""
+        updated = None
+        for connection_id in list(self.topics.get(user_topic(user_id), ())):
+            connection = self.active_connections.get(connection_id)
+            if not connection:
+                continue
+            old_topics = default_topics(connection.user_data)
+            connection.user_data = {**connection.user_data, **changes}
+            new_topics = default_topics(connection.user_data)
+            for topic in old_topics - new_topics:
+                self.unsubscribe(connection_id, topic, connection)
+            for topic in new_topics - old_topics:
+                self.subscribe(connection_id, topic)
+            updated = connection.user_data
+        if updated is None:
+            return
+        delta = self.presence.updated(updated)
+        if delta:
+            self._announce_presence(updated, True)
+            await self._publish_presence([delta])
+        if _is_provider(updated):
+            await self.engine.provider_updated(user_id, updated.get('specialization'), updated.get('rank'))
+
+    def grant_room(self, room: str, user_ids):
+        """Server-side: allow these users to join a room"""
+        self.room_grants.setdefault(room, set()).update(user_ids)
+
+    def revoke_room(self, room: str):
+        """Server-side: close a room and unsubscribe its members"""
+        self.room_grants.pop(room, None)
+        for connection_id in list(self.topics.get(room_topic(room), ())):
+            self.unsubscribe(connection_id, room_topic(room))
+
+    def can_join_room(self, room: str, user_data: dict) -> bool:
+        if user_data.get('role') == 'admin':
+            return True
+        return user_data.get('id') in self.room_grants.get(room, ())
+
+    def allow(self, connection_id: str, message_type: str = None) -> bool:
+        """Charge an inbound message against the connection's token bucket.
+
+        Also records activity: any inbound frame proves the socket is alive, and a JSON
+        pong opts the connection in to idle reaping.
+        """
+        connection = self.active_connections.get(connection_id)
+        if not connection:
+            return False
+        if message_type == 'pong':
+            connection.json_heartbeat = True
+        now = time.monotonic()
+        connection.tokens = min(connection.burst, connection.tokens + (now - connection.last_seen) * connection.rate)
+        connection.last_seen = now
+        cost = MESSAGE_COSTS.get(message_type, 1.0)
+        if connection.tokens < cost:
+            self.throttled_messages += 1
+            return False
+        connection.tokens -= cost
+        connection.throttled = False
+        return True
+
+    async def sweep(self):
+        """One heartbeat pass: ping quiet sockets and reap silent ones that use JSON heartbeats"""
+        now = time.monotonic()
+        ping = None
+        for connection in list(self.active_connections.values()):
+            if connection.kind == 'sse':
+                continue  # event streams send their own keep-alives
+            idle = now - connection.last_seen
+            if idle >= IDLE_TIMEOUT_SECONDS and connection.json_heartbeat:
+                self.reaped_connections += 1
+                logger.info(f"Reaping idle WebSocket {connection.connection_id} ({idle:.0f}s silent)")
+                self.disconnect(connection.connection_id)
+                asyncio.ensure_future(self._close(connection.websocket, code=1001))
+            elif idle >= PING_INTERVAL_SECONDS and now - connection.pinged_at >= PING_INTERVAL_SECONDS:
+                connection.pinged_at = now
+                if ping is None:
+                    ping = json.dumps({"type": "ping", "time": int(time.time() * 1000)})
+                self._enqueue(connection, ping)
+
+    def start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    def stop_heartbeat(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    async def _heartbeat_loop(self):
+        # Check a few times per interval so reaping happens close to the timeout
+        while True:
+            await asyncio.sleep(max(0.05, min(PING_INTERVAL_SECONDS, IDLE_TIMEOUT_SECONDS) / 4))
             try:
-                await websocket.send_text(message)
+                await self.sweep()
             except Exception as e:
-                logger.error(f"Error sending message to {connection_id}: {e}")
+                logger.error(f"Heartbeat sweep failed: {e}")
 
-    async def broadcast(self, message: str, exclude_connection: str = None):
-        for connection_id, websocket in self.active_connections.items():
-            if connection_id != exclude_connection and websocket.client_state == WebSocketState.CONNECTED:
-                try:
-                    await websocket.send_text(message)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to {connection_id}: {e}")
+    def _writer_done(self, connection: Connection, task: asyncio.Task):
+        """A writer only exits on its own after a failed send: drop the connection too"""
+        if task.cancelled() or self.active_connections.get(connection.connection_id) is not connection:
+            return
+        self.disconnect(connection.connection_id)
+        asyncio.create_task(self._close(connection.websocket, code=1011))
+
+    def _enqueue(self, connection: Connection, message: Union[str, Frame]):
+        """Queue a message for one connection, applying the slow-consumer policy when full"""
+        if connection.queue.full():
+            if SLOW_CONSUMER_POLICY == 'disconnect':
+                self._evict(connection)
+                return
+            # drop_oldest: discard the stalest message to make room
+            connection.queue.get_nowait()
+            self.dropped_messages += 1
+        connection.queue.put_nowait(as_frame(message))
+        depth = connection.queue.qsize()
+        if depth > connection.max_depth:
+            connection.max_depth = depth
+
+    def _evict(self, connection: Connection):
+        """Disconnect a consumer that cannot keep up with its queue"""
+        self.slow_consumer_disconnects += 1
+        self.dropped_messages += connection.queue.qsize() + 1
+        logger.warning(f"Disconnecting slow consumer {connection.connection_id}")
+        self.disconnect(connection.connection_id)
+        asyncio.create_task(self._close(connection.websocket))
+
+    async def _close(self, websocket: WebSocket, code: int = 1008):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def send_personal_message(self, message: Union[str, Frame], connection_id: str):
+        connection = self.active_connections.get(connection_id)
+        if connection and connection.open:
+            self._enqueue(connection, message)
+
+    async def broadcast(self, message: Union[str, Frame], exclude_connection: str = None, local_only: bool = False):
+        # Kept on purpose for system-wide announcements; targeted traffic goes through publish()
+        # One Frame for every recipient, so each codec encodes the payload once
+        frame = as_frame(message)
+        # Snapshot: eviction may remove entries while we iterate
+        for connection_id, connection in list(self.active_connections.items()):
+            if connection_id != exclude_connection and connection.open:
+                self._enqueue(connection, frame)
+        if self.backplane and not local_only:
+            self.backplane.publish(BROADCAST_TOPIC, frame.text)
+
+    async def publish(self, topic: str, message: Union[str, Frame], exclude_connection: str = None,
+                      local_only: bool = False, replay: bool = True) -> int:
+        """Send to subscribers of a topic; cost scales with the number of recipients.
+
+        Also forwarded to other workers through the backplane; returns local deliveries only.
+        With replay=False a user-stream message is neither sequence-numbered nor buffered for
+        reconnects (and, carrying no seq, other workers do not buffer it either).
+        """
+        frame = as_frame(message)
+        if topic.startswith(USER_TOPIC_PREFIX) and replay:
+            # A user's own stream is sequence-numbered (once, by the worker that publishes) for replay
+            if local_only:
+                self.replay.observe(topic[len(USER_TOPIC_PREFIX):], frame)
+            else:
+                frame = self.replay.stamp(topic[len(USER_TOPIC_PREFIX):], frame)
+        if self.backplane and not local_only:
+            self.backplane.publish(topic, frame.text)
+        delivered = 0
+        for connection_id in list(self.topics.get(topic, ())):
+            if connection_id == exclude_connection:
+                continue
+            connection = self.active_connections.get(connection_id)
+            if connection and connection.open:
+                self._enqueue(connection, frame)
+                delivered += 1
+        return delivered
+
+    def stats(self) -> dict:
+        """Outbound queue metrics"""
+        depths = [c.queue.qsize() for c in self.active_connections.values()]
+        return {
+            "connections": len(self.active_connections),
+            "topics": len(self.topics),
+            "queueSize": SEND_QUEUE_SIZE,
+            "slowConsumerPolicy": SLOW_CONSUMER_POLICY,
+            "queuedMessages": sum(depths),
+            "maxQueueDepth": max(depths, default=0),
+            "peakQueueDepth": max((c.max_depth for c in self.active_connections.values()), default=0),
+            "droppedMessages": self.dropped_messages,
+            "slowConsumerDisconnects": self.slow_consumer_disconnects,
+            "pingIntervalSeconds": PING_INTERVAL_SECONDS,
+            "idleTimeoutSeconds": IDLE_TIMEOUT_SECONDS,
+            "reapedConnections": self.reaped_connections,
+            "throttledMessages": self.throttled_messages,
+            "msgpackConnections": sum(1 for c in self.active_connections.values() if c.codec == 'msgpack'),
+            "eventStreams": sum(1 for c in self.active_connections.values() if c.kind == 'sse'),
+            "batchWindowMs": BATCH_WINDOW_SECONDS * 1000,
+            "matchmaking": self.engine.stats(),
+            "backplane": self.backplane.stats() if self.backplane else None,
+            "presence": self.presence.stats(),
+            "replay": self.replay.stats(),
+            "chat": self.chat.stats(),
+            "signaling": self.signaling.stats(),
+            "chatAuth": self.chat_auth.stats(),
+        }
+
+
+async def start_realtime():
+    """Start heartbeats and attach the cross-worker backplane selected by WS_BACKPLANE"""
+    manager.start_heartbeat()
+    kind = os.getenv('WS_BACKPLANE', 'none').strip().lower()
+    backplane = create_backplane(kind, get_db() if kind == 'mongo' else None)
+    if backplane:
+        await manager.attach_backplane(backplane)
+        logger.info(f"[WS] Backplane {type(backplane).__name__} attached as worker {backplane.worker_id}")
+
+
+async def stop_realtime():
+    manager.stop_heartbeat()
+    await manager.detach_backplane()
+    await manager.chat.flush()
+
+
+def _is_provider(user_data: dict) -> bool:
+    return bool(user_data) and user_data.get('role') == 'provider' and bool(user_data.get('id'))
 
 
 manager = ConnectionManager()
@@ -68,7 +540,7 @@ async def handle_websocket_message(websocket: WebSocket, message_data: dict, con
     """Handle incoming WebSocket messages"""
     try:
         message_type = message_data.get('type')
-        
+
         if message_type == 'ping':
             response = {
                 "type": "pong",
@@ -76,17 +548,130 @@ async def handle_websocket_message(websocket: WebSocket, message_data: dict, con
                 "role": user_data.get('role', 'guest') if user_data else 'guest'
             }
             await manager.send_personal_message(json.dumps(response), connection_id)
-        
+
+        elif message_type == 'pong':
+            # Reply to a server ping; activity was already recorded
+            pass
+
         elif message_type == 'consult_request':
-            # Broadcast consultation request to all other connected clients
-            payload = {
-                "type": "consult_request",
-                "from": user_data.get('id') if user_data else message_data.get('user', 'anonymous'),
-                "role": user_data.get('role', 'guest') if user_data else 'guest',
-                "symptom": message_data.get('symptom', '')
-            }
-            await manager.broadcast(json.dumps(payload), exclude_connection=connection_id)
-        
+            # Queue for matchmaking; offers go to one matching provider at a time
+            result = await manager.engine.submit(
+                requester_id=user_data.get('id') if user_data else None,
+                connection_id=connection_id,
+                role=user_data.get('role', 'guest') if user_data else 'guest',
+                symptom=str(message_data.get('symptom', ''))[:2000],
+                specialization=message_data.get('specialization'),
+            )
+            await manager.send_personal_message(json.dumps({"type": "consult_request_ack", **result}), connection_id)
+
+        elif message_type in ('consult_accept', 'consult_decline'):
+            request_id = message_data.get('requestId')
+            if not _is_provider(user_data):
+                ok = False
+            elif message_type == 'consult_accept':
+                ok = await manager.engine.accept(user_data['id'], request_id)
+            else:
+                ok = await manager.engine.decline(user_data['id'], request_id)
+            if not ok:
+                await manager.send_personal_message(json.dumps({
+                    "type": "error",
+                    "error": "No pending offer for this request",
+                    "requestId": request_id
+                }), connection_id)
+
+        elif message_type == 'consult_cancel':
+            await manager.engine.cancel(message_data.get('requestId'), connection_id)
+
+        elif message_type == 'consult_end':
+            if user_data and user_data.get('id'):
+                await manager.engine.end(message_data.get('requestId'), user_data['id'])
+
+        elif message_type == 'chat':
+            # Consultation chat: only the matched pair (requester and provider of the accepted request) may talk
+            request_id = message_data.get('requestId')
+            text = message_data.get('text')
+            participants = frozenset()
+            if user_data and user_data.get('id') and isinstance(request_id, str):
+                participants = await manager.chat_auth.participants(request_id)
+            if not (user_data and user_data.get('id') in participants):
+                error = "Not a participant of this consult"
+            elif not isinstance(text, str) or not text.strip() or len(text) > CHAT_MAX_LENGTH:
+                error = "Invalid chat message"
+            else:
+                error = None
+                doc = manager.chat.record(request_id, user_data['id'], text)
+                event = json.dumps({"type": "chat", "message": {
+                    "conversationId": request_id,
+                    "seq": doc["seq"],
+                    "from": doc["from"],
+                    "text": doc["text"],
+                    "sentAt": int(doc["createdAt"].timestamp() * 1000)
+                }})
+                # Every device of both participants, the sender's included (doubles as the ack)
+                for participant in participants:
+                    await manager.publish(user_topic(participant), event)
+            if error:
+                await manager.send_personal_message(json.dumps({
+                    "type": "error",
+                    "error": error,
+                    "requestId": request_id
+                }), connection_id)
+
+        elif message_type in SIGNALING_TYPES:
+            meetup_id = message_data.get('meetupId')
+            peer_id = None
+            if user_data and user_data.get('id') and isinstance(meetup_id, str):
+                peer_id = await manager.signaling.peer(meetup_id, user_data['id'])
+            if peer_id is None:
+                await manager.send_personal_message(json.dumps({
+                    "type": "error",
+                    "error": "Not a participant of this meetup",
+                    "meetupId": meetup_id
+                }), connection_id)
+            else:
+                # SDP and candidates pass through untouched; the server only adds the sender.
+                # Live only: stale SDP/ICE must not be replayed, nor push events out of the replay ring
+                await manager.publish(user_topic(peer_id), Frame(data={**message_data, "from": user_data['id']}), replay=False)
+
+        elif message_type in ('presence_subscribe', 'presence_unsubscribe'):
+            if not (user_data and user_data.get('id')):
+                response = {"type": "error", "error": "Authentication required for presence"}
+            elif message_type == 'presence_subscribe':
+                manager.subscribe(connection_id, PRESENCE_EVENTS_TOPIC)
+                # Current state first, then `presence` deltas as providers come and go
+                response = {"type": "presence_snapshot", "providers": manager.presence.providers()}
+            else:
+                manager.unsubscribe(connection_id, PRESENCE_EVENTS_TOPIC)
+                response = {"type": "presence_unsubscribed"}
+            await manager.send_personal_message(json.dumps(response), connection_id)
+
+        elif message_type in ('subscribe', 'unsubscribe', 'room_message'):
+            room = message_data.get('room')
+            if not (user_data and user_data.get('id')):
+                response = {"type": "error", "error": "Authentication required for rooms"}
+            elif not isinstance(room, str) or not room or len(room) > 120:
+                response = {"type": "error", "error": "Invalid room"}
+            elif message_type == 'subscribe' and not manager.can_join_room(room, user_data):
+                response = {"type": "error", "error": "Not allowed to join room"}
+            elif message_type == 'subscribe':
+                manager.subscribe(connection_id, room_topic(room))
+                response = {"type": "subscribed", "room": room}
+            elif message_type == 'unsubscribe':
+                manager.unsubscribe(connection_id, room_topic(room))
+                response = {"type": "unsubscribed", "room": room}
+            elif connection_id not in manager.topics.get(room_topic(room), ()):
+                response = {"type": "error", "error": "Not subscribed to room"}
+            else:
+                await manager.publish(room_topic(room), json.dumps({
+                    "type": "room_message",
+                    "room": room,
+                    "from": user_data['id'],
+                    "data": message_data.get('data')
+                }), exclude_connection=connection_id)
+                response = None
+            if response:
+                await manager.send_personal_message(json.dumps(response), connection_id)
+
         else:
             # Unknown message type
             error_response = {
@@ -94,7 +679,7 @@ async def handle_websocket_message(websocket: WebSocket, message_data: dict, con
                 "error": f"Unknown message type: {message_type}"
             }
             await manager.send_personal_message(json.dumps(error_response), connection_id)
-            
+
     except Exception as e:
         error_response = {
             "type": "error",
@@ -103,14 +688,42 @@ async def handle_websocket_message(websocket: WebSocket, message_data: dict, con
         await manager.send_personal_message(json.dumps(error_response), connection_id)
 
 
+async def load_connection_profile(user_data: dict) -> dict:
+    """Attach routing attributes (specialization, rank) for provider connections"""
+    if not user_data or user_data.get('role') != 'provider' or not user_data.get('id'):
+        return user_data
+    try:
+        collections = get_collections()
+        provider = await collections['providers'].find_one(
+            {"id": user_data['id']},
+            {"_id": 0, "specialization": 1, "rank": 1, "name": 1}
+        )
+    except Exception as e:
+        logger.warning(f"Could not load provider profile for {user_data['id']}: {e}")
+        return user_data
+    if provider:
+        user_data = {**user_data, **{k: provider.get(k) for k in ('specialization', 'rank', 'name') if provider.get(k) is not None}}
+    return user_data
+
+
 def setup_websocket_routes(app: FastAPI):
     """Setup WebSocket routes on the FastAPI app"""
-    
+
+    @app.get("/ws/stats")
+    async def websocket_stats(user: dict = Depends(verify_token_middleware)):
+        """Admin-only: connection and outbound queue metrics for this worker"""
+        if user.get("role") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="admin only"
+            )
+        return manager.stats()
+
     @app.websocket("/ws")
-    async def websocket_endpoint(websocket: WebSocket, token: str = Query(None)):
+    async def websocket_endpoint(websocket: WebSocket, token: str = Query(None), since: Optional[int] = Query(None)):
         connection_id = f"conn_{id(websocket)}"
         user_data = None
-        
+
         # Try to verify token if provided
         if token:
             try:
@@ -118,24 +731,45 @@ def setup_websocket_routes(app: FastAPI):
             except Exception:
                 # Invalid token, but still allow connection as guest
                 pass
-        
-        await manager.connect(websocket, connection_id, user_data)
-        
+
+        user_data = await load_connection_profile(user_data)
+        # JSON text frames unless the client offered a subprotocol we speak (e.g. msgpack)
+        subprotocol = negotiate(websocket.scope.get('subprotocols', []))
+        codec = codec_for(subprotocol)
+        await manager.connect(websocket, connection_id, user_data, subprotocol, since)
+
         try:
             while True:
-                # Receive message
-                raw_message = await websocket.receive_text()
-                
+                # Receive message (text or binary, depending on the negotiated codec)
+                raw_message = await websocket.receive()
+                if raw_message['type'] == 'websocket.disconnect':
+                    raise WebSocketDisconnect(raw_message.get('code', 1000))
+
                 try:
-                    message_data = json.loads(raw_message)
-                    await handle_websocket_message(websocket, message_data, connection_id, user_data)
-                except json.JSONDecodeError:
+                    message_data = decode_inbound(raw_message, codec)
+                except ValueError:
+                    if not manager.allow(connection_id):
+                        continue
                     error_response = {
                         "type": "error",
-                        "error": "Invalid JSON format"
+                        "error": "Invalid msgpack format" if codec == 'msgpack' else "Invalid JSON format"
                     }
                     await manager.send_personal_message(json.dumps(error_response), connection_id)
-                
+                    continue
+
+                message_type = message_data.get('type') if isinstance(message_data, dict) else None
+                if not manager.allow(connection_id, message_type):
+                    connection = manager.active_connections.get(connection_id)
+                    if connection and not connection.throttled:
+                        # Tell the client once per burst rather than once per dropped message
+                        connection.throttled = True
+                        await manager.send_personal_message(json.dumps({
+                            "type": "error",
+                            "error": "rate_limited"
+                        }), connection_id)
+                    continue
+                await handle_websocket_message(websocket, message_data, connection_id, user_data)
+
         except WebSocketDisconnect:
             logger.info(f"WebSocket {connection_id} disconnected")
         except Exception as e:
@@ -0,0 +1,164 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+from .topics import normalize_specialization
+
+# Each worker re-announces the users it holds every heartbeat; a worker that misses
+# PRESENCE_TTL_SECONDS worth of heartbeats is presumed dead and its users go offline
+PRESENCE_HEARTBEAT_SECONDS = float(os.getenv('WS_PRESENCE_HEARTBEAT_SECONDS', 10))
+PRESENCE_TTL_SECONDS = float(os.getenv('WS_PRESENCE_TTL_SECONDS', 30))
+
+# Sockets subscribed to this topic receive provider presence deltas
+PRESENCE_EVENTS_TOPIC = 'presence'
+
+
+def presence_entry(user_data: dict) -> dict:
+    """The public view of a connected user; only what the providers list needs"""
+    entry = {"userId": user_data['id'], "role": user_data.get('role', 'guest')}
+    for key in ('name', 'specialization'):
+        if user_data.get(key) is not None:
+            entry[key] = user_data[key]
+    return entry
+
+
+class PresenceRegistry:
+    """Who is connected, on this worker and (via backplane heartbeats) on the others.
+
+    Every read is served from memory. Mutators return the cluster-wide change, if any,
+    as a delta event ({"type": "presence", "online": ...}) for the caller to publish.
+    """
+
+    def __init__(self):
+        self.local: Dict[str, dict] = {}  # user_id -> entry
+        self.local_counts: Dict[str, int] = {}  # user_id -> open sockets on this worker
+        self.remote: Dict[str, Dict[str, dict]] = {}  # worker_id -> {user_id: entry}
+        self.remote_expires: Dict[str, float] = {}  # worker_id -> monotonic deadline
+
+    def _lookup(self, user_id: str) -> Optional[dict]:
+        entry = self.local.get(user_id)
+        if entry is not None:
+            return entry
+        for users in self.remote.values():
+            if user_id in users:
+                return users[user_id]
+        return None
+
+    def is_online(self, user_id: str) -> bool:
+        return self._lookup(user_id) is not None
+
+    def _delta(self, entry: dict, online: bool) -> dict:
+        return {"type": "presence", **entry, "online": online}
+
+    # --- this worker -------------------------------------------------------
+
+    def connected(self, user_data: dict) -> Optional[dict]:
+        user_id = user_data.get('id') if user_data else None
+        if not user_id:
+            return None
+        was_online = self.is_online(user_id)
+        self.local_counts[user_id] = self.local_counts.get(user_id, 0) + 1
+        self.local[user_id] = presence_entry(user_data)
+        return None if was_online else self._delta(self.local[user_id], True)
+
+    def disconnected(self, user_data: dict) -> Optional[dict]:
+        user_id = user_data.get('id') if user_data else None
+        if not user_id or user_id not in self.local_counts:
+            return None
+        self.local_counts[user_id] -= 1
+        if self.local_counts[user_id] > 0:
+            return None
+        del self.local_counts[user_id]
+        entry = self.local.pop(user_id)
+        return None if self.is_online(user_id) else self._delta(entry, False)
+
+    def updated(self, user_data: dict) -> Optional[dict]:
+        user_id = user_data.get('id')
+        if user_id not in self.local:
+            return None
+        entry = presence_entry(user_data)
+        if entry == self.local[user_id]:
+            return None
+        self.local[user_id] = entry
+        return self._delta(entry, True)
+
+    def snapshot(self) -> List[dict]:
+        return list(self.local.values())
+
+    # --- other workers -----------------------------------------------------
+
+    def apply_remote(self, worker_id: str, users: List[dict], now: float = None) -> List[dict]:
+        """Replace a worker's user list (from its heartbeat or a change) and refresh its expiry"""
+        now = time.monotonic() if now is None else now
+        affected = set(self.remote.get(worker_id, ())) | {entry['userId'] for entry in users}
+        before = {user_id: self._lookup(user_id) for user_id in affected}
+        self.remote[worker_id] = {entry['userId']: entry for entry in users}
+        self.remote_expires[worker_id] = now + PRESENCE_TTL_SECONDS
+        return self._changes(before)
+
+    def remote_change(self, worker_id: str, entry: dict, online: bool, now: float = None) -> List[dict]:
+        """One user joined or left another worker"""
+        now = time.monotonic() if now is None else now
+        before = {entry['userId']: self._lookup(entry['userId'])}
+        users = self.remote.setdefault(worker_id, {})
+        if online:
+            users[entry['userId']] = entry
+        else:
+            users.pop(entry['userId'], None)
+        self.remote_expires[worker_id] = now + PRESENCE_TTL_SECONDS
+        return self._changes(before)
+
+    def drop_worker(self, worker_id: str) -> List[dict]:
+        """Forget a worker (stopped, or its heartbeats expired)"""
+        before = {user_id: self._lookup(user_id) for user_id in self.remote.get(worker_id, ())}
+        self.remote.pop(worker_id, None)
+        self.remote_expires.pop(worker_id, None)
+        return self._changes(before)
+
+    def _changes(self, before: Dict[str, Optional[dict]]) -> List[dict]:
+        deltas = []
+        for user_id, old in before.items():
+            new = self._lookup(user_id)
+            if new is None and old is not None:
+                deltas.append(self._delta(old, False))
+            elif new is not None and new != old:
+                deltas.append(self._delta(new, True))
+        return deltas
+
+    def expire(self, now: float = None) -> List[dict]:
+        now = time.monotonic() if now is None else now
+        deltas = []
+        for worker_id, deadline in list(self.remote_expires.items()):
+            if deadline <= now:
+                deltas.extend(self.drop_worker(worker_id))
+        return deltas
+
+    # --- queries -----------------------------------------------------------
+
+    def providers(self, specialization: str = None) -> List[dict]:
+        """Online providers across the cluster, one entry per user"""
+        wanted = normalize_specialization(specialization)
+        merged: Dict[str, dict] = {}
+        for users in self.remote.values():
+            merged.update(users)
+        merged.update(self.local)
+        return [
+            entry for entry in merged.values()
+            if entry.get('role') == 'provider'
+            and (not wanted or normalize_specialization(entry.get('specialization')) == wanted)
+        ]
+
+    def remote_providers(self) -> Dict[str, dict]:
+        """Providers connected to other workers, by user id"""
+        return {
+            user_id: entry
+            for users in self.remote.values() for user_id, entry in users.items()
+            if entry.get('role') == 'provider'
+        }
+
+    def stats(self) -> dict:
+        return {
+            "localUsers": len(self.local),
+            "remoteWorkers": len(self.remote),
+            "remoteUsers": sum(len(users) for users in self.remote.values()),
+        }
@@ -0,0 +1,93 @@
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+
+from .framing import Frame
+
+# Per-user ring of recent messages, and how many users keep one (least recently used go first)
+REPLAY_BUFFER_SIZE = int(os.getenv('WS_REPLAY_BUFFER_SIZE', 100))
+REPLAY_MAX_USERS = int(os.getenv('WS_REPLAY_MAX_USERS', 10000))
+
+
+def _clock() -> int:
+    # Sequence numbers are hybrid logical clocks: milliseconds * 1000 + a counter. Every
+    # worker can stamp a user's messages without coordination and they still increase.
+    return int(time.time() * 1000) * 1000
+
+
+class _Stream:
+    __slots__ = ('last_seq', 'floor', 'messages')
+
+    def __init__(self):
+        self.last_seq = 0
+        # Messages at or below `floor` may have been sent but are not (or no longer) buffered
+        self.floor = _clock()
+        self.messages: Deque[Tuple[int, Frame]] = deque()
+
+
+class ReplayBuffer:
+    """Sequence numbers and a bounded in-memory history for each user's message stream"""
+
+    def __init__(self, size: int = None, max_users: int = None):
+        self.size = REPLAY_BUFFER_SIZE if size is None else size
+        self.max_users = REPLAY_MAX_USERS if max_users is None else max_users
+        self.streams: 'OrderedDict[str, _Stream]' = OrderedDict()
+        self.replayed_messages = 0
+        self.gaps = 0
+
+    def _stream(self, user_id: str) -> _Stream:
+        stream = self.streams.get(user_id)
+        if stream is None:
+            stream = self.streams[user_id] = _Stream()
+            while len(self.streams) > self.max_users:
+                self.streams.popitem(last=False)
+        else:
+            self.streams.move_to_end(user_id)
+        return stream
+
+    def last_seq(self, user_id: str) -> int:
+        stream = self.streams.get(user_id)
+        return stream.last_seq if stream else 0
+
+    def _keep(self, stream: _Stream, seq: int, frame: Frame):
+        stream.messages.append((seq, frame))
+        if len(stream.messages) > self.size:
+            evicted, _ = stream.messages.popleft()
+            stream.floor = max(stream.floor, evicted)
+
+    def stamp(self, user_id: str, message) -> Frame:
+        """Give a message for this user the next sequence number and remember it"""
+        stream = self._stream(user_id)
+        seq = max(stream.last_seq + 1, _clock())
+        stream.last_seq = seq
+        frame = Frame(data={**message.data, "seq": seq})
+        self._keep(stream, seq, frame)
+        return frame
+
+    def observe(self, user_id: str, frame: Frame):
+        """Remember a message another worker already stamped"""
+        seq = frame.data.get('seq') if isinstance(frame.data, dict) else None
+        if not isinstance(seq, int):
+            return
+        stream = self._stream(user_id)
+        stream.last_seq = max(stream.last_seq, seq)
+        self._keep(stream, seq, frame)
+
+    def since(self, user_id: str, seq: int) -> Tuple[List[Frame], Optional[int]]:
+        """Buffered messages after `seq`, plus the floor when older ones may be missing"""
+        stream = self._stream(user_id)
+        frames = [frame for message_seq, frame in stream.messages if message_seq > seq]
+        self.replayed_messages += len(frames)
+        if seq < stream.floor:
+            self.gaps += 1
+            return frames, stream.floor
+        return frames, None
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.streams),
+            "bufferSize": self.size,
+            "replayedMessages": self.replayed_messages,
+            "gaps": self.gaps,
+        }
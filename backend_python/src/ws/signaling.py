@@ -0,0 +1,102 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from ..db import get_collections
+from ..services.recurrence import series_id_of
+from ..services.consult_requests import ACCEPTED
+
+logger = logging.getLogger(__name__)
+
+# WebRTC signaling relayed point-to-point between the two participants of a meetup
+SIGNALING_TYPES = ('webrtc.offer', 'webrtc.answer', 'webrtc.ice', 'webrtc.hangup')
+SIGNALING_AUTH_TTL_SECONDS = float(os.getenv('WS_SIGNALING_AUTH_TTL_SECONDS', 60))
+SIGNALING_AUTH_CACHE_SIZE = 10000
+
+
+class SignalingAuth:
+    """Who may signal whom in a meetup, cached so ICE bursts skip the database.
+
+    One `events` lookup per meetup serves both participants until the TTL runs out or
+    the meetup changes. Denials are cached too; concurrent lookups share one query.
+    Occurrences of a recurring series share the series' entry.
+    """
+
+    def __init__(self, ttl: float = None, max_meetups: int = SIGNALING_AUTH_CACHE_SIZE):
+        self.ttl = SIGNALING_AUTH_TTL_SECONDS if ttl is None else ttl
+        self.max_meetups = max_meetups
+        self._cache: 'OrderedDict[str, Tuple[float, FrozenSet[str]]]' = OrderedDict()
+        self._lookups: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def peer(self, meetup_id: str, user_id: str) -> Optional[str]:
+        """The other participant, or None when this user may not signal in the meetup"""
+        participants = await self._participants(series_id_of(meetup_id) or meetup_id)
+        if user_id not in participants:
+            return None
+        others = participants - {user_id}
+        return next(iter(others)) if others else None
+
+    async def _participants(self, meetup_id: str) -> FrozenSet[str]:
+        cached = self._cache.get(meetup_id)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1]
+        lookup = self._lookups.get(meetup_id)
+        if lookup is None:
+            self.misses += 1
+            lookup = self._lookups[meetup_id] = asyncio.ensure_future(self._load(meetup_id))
+            lookup.add_done_callback(lambda _: self._lookups.pop(meetup_id, None))
+        return await asyncio.shield(lookup)
+
+    async def _load(self, meetup_id: str) -> FrozenSet[str]:
+        try:
+            participants = await self._fetch(meetup_id)
+        except Exception as e:
+            # Not cached: the next message retries
+            logger.warning(f"[{type(self).__name__}] Could not authorize {meetup_id}: {e}")
+            return frozenset()
+        self._cache[meetup_id] = (time.monotonic() + self.ttl, participants)
+        self._cache.move_to_end(meetup_id)
+        while len(self._cache) > self.max_meetups:
+            self._cache.popitem(last=False)
+        return participants
+
+    async def _fetch(self, meetup_id: str) -> FrozenSet[str]:
+        projection = {"_id": 0, "requesterId": 1, "participantId": 1, "status": 1}
+        event = await get_collections()['events'].find_one({"id": meetup_id}, projection)
+        if not event:
+            event = await get_collections()['meetupSeries'].find_one({"id": meetup_id}, projection)
+        if not event or event.get('status') == 'cancelled':
+            return frozenset()
+        return frozenset(uid for uid in (event.get('requesterId'), event.get('participantId')) if uid)
+
+    def forget(self, meetup_id: str):
+        """Drop a cached result, e.g. after the meetup was cancelled or edited"""
+        self._cache.pop(meetup_id, None)
+
+    def stats(self) -> dict:
+        return {"cachedMeetups": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+class ConsultChatAuth(SignalingAuth):
+    """Who may chat in a consult: its requester and provider once it was accepted.
+
+    Read from the persisted consultRequests document, so it holds on every worker and
+    across restarts, with the same per-request cache as signaling.
+    """
+
+    async def participants(self, request_id: str) -> FrozenSet[str]:
+        return await self._participants(request_id)
+
+    async def _fetch(self, request_id: str) -> FrozenSet[str]:
+        doc = await get_collections()['consultRequests'].find_one(
+            {"id": request_id}, {"_id": 0, "requesterId": 1, "providerId": 1, "status": 1}
+        )
+        if not doc or doc.get('status') != ACCEPTED:
+            return frozenset()
+        return frozenset(uid for uid in (doc.get('requesterId'), doc.get('providerId')) if uid)
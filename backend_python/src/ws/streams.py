@@ -0,0 +1,48 @@
+import asyncio
+import os
+import time
+from typing import Optional, Set
+
+from .framing import Frame
+
+# Comment lines sent on quiet streams so proxies and load balancers keep them open
+SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', 15))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 3000))
+
+
+class StreamSubscriber:
+    """A one-way (SSE) client: topics and a bounded queue, but no socket or writer task.
+
+    Registered with the ConnectionManager like a WebSocket Connection, so publish()
+    routes to it; the HTTP response drains the queue itself.
+    """
+
+    __slots__ = ('connection_id', 'user_data', 'queue', 'topics', 'max_depth', 'last_seen', 'open')
+    kind = 'sse'
+    codec = 'json'
+    websocket = None
+    writer = None
+
+    def __init__(self, connection_id: str, user_data: dict, queue_size: int):
+        self.connection_id = connection_id
+        self.user_data = user_data or {}
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.topics: Set[str] = set()
+        self.max_depth = 0
+        self.last_seen = time.monotonic()
+        self.open = True
+
+
+def format_event(frame: Frame) -> str:
+    """One SSE event; user-stream messages carry their seq as the event id for Last-Event-ID resume"""
+    data = frame.data
+    seq = data.get('seq') if isinstance(data, dict) else None
+    event_id = f"id: {seq}\n" if seq is not None else ""
+    return f"{event_id}data: {frame.text}\n\n"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
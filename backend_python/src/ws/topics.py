@@ -0,0 +1,34 @@
+from typing import Set
+
+USER_TOPIC_PREFIX = 'user:'
+
+
+def role_topic(role: str) -> str:
+    return f"role:{role}"
+
+
+def user_topic(user_id: str) -> str:
+    return f"{USER_TOPIC_PREFIX}{user_id}"
+
+
+def normalize_specialization(specialization: str) -> str:
+    return (specialization or '').strip().lower()
+
+
+def specialization_topic(specialization: str) -> str:
+    return f"specialization:{normalize_specialization(specialization)}"
+
+
+def room_topic(room: str) -> str:
+    return f"room:{room}"
+
+
+def default_topics(user_data: dict = None) -> Set[str]:
+    """Topics a connection joins on connect, derived from its identity"""
+    user_data = user_data or {}
+    topics = {role_topic(user_data.get('role', 'guest'))}
+    if user_data.get('id'):
+        topics.add(user_topic(user_data['id']))
+    if user_data.get('role') == 'provider' and normalize_specialization(user_data.get('specialization')):
+        topics.add(specialization_topic(user_data['specialization']))
+    return topics
@@ -137,14 +137,54 @@ if pytest is not None:  # only define hooks when pytest is available
 
 
 # --------------------------- Test scaffolding ---------------------------------
+_MISSING = object()
+
+
+def _compare(actual: Any, cond: Any) -> bool:
+    """Evaluate one field condition: a literal, or a dict of query operators."""
+    if not (isinstance(cond, dict) and cond and all(str(op).startswith("$") for op in cond)):
+        return actual == cond
+    for op, arg in cond.items():
+        if op == "$in":
+            ok = (None if actual is _MISSING else actual) in arg
+        elif op == "$nin":
+            ok = (None if actual is _MISSING else actual) not in arg
+        elif op == "$ne":
+            ok = actual != arg
+        elif op == "$exists":
+            ok = (actual is not _MISSING) == bool(arg)
+        elif op == "$regex":
+            import re
+
+            flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+            ok = isinstance(actual, str) and re.search(arg, actual, flags) is not None
+        elif op == "$options":
+            ok = True
+        elif op == "$type":
+            ok = isinstance(actual, {"string": str, "date": datetime, "int": int}[arg])
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if actual is _MISSING or actual is None:
+                return False
+            ok = {"$gt": actual > arg, "$gte": actual >= arg, "$lt": actual < arg, "$lte": actual <= arg}[op]
+        else:
+            raise NotImplementedError(f"fake query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
 def _match(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
     if not query:
         return True
     for k, v in query.items():
         if k == "$or" and isinstance(v, list):
-            if any(_match(doc, q) for q in v):
-                return True
-            return False
+            if not any(_match(doc, q) for q in v):
+                return False
+            continue
+        if k == "$and" and isinstance(v, list):
+            if not all(_match(doc, q) for q in v):
+                return False
+            continue
         # Support dot path like metadata.email
         if "." in k:
             parts = k.split(".")
@@ -156,38 +196,137 @@ def _match(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
                 else:
                     ok = False
                     break
-            if not ok or cur != v:
+            if not _compare(cur if ok else _MISSING, v):
                 return False
         else:
-            if doc.get(k) != v:
+            # A missing field compares equal to None, as in Mongo
+            if not _compare(doc.get(k, _MISSING if isinstance(v, dict) else None), v):
                 return False
     return True
 
 
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    if not projection:
+        return doc
+    omit = {k for k, v in projection.items() if v == 0}
+    return {k: v for k, v in doc.items() if k not in omit}
+
+
+def _apply_update(doc: Dict[str, Any], update: Dict[str, Any]) -> None:
+    if "$set" in update:
+        doc.update(update["$set"])
+    for key in update.get("$unset", {}):
+        doc.pop(key, None)
+    for key, amount in update.get("$inc", {}).items():
+        doc[key] = doc.get(key, 0) + amount
+    for key, value in update.get("$addToSet", {}).items():
+        values = doc.setdefault(key, [])
+        for item in (value["$each"] if isinstance(value, dict) and "$each" in value else [value]):
+            if item not in values:
+                values.append(item)
+
+
+def _evaluate(doc: Dict[str, Any], expr: Any) -> Any:
+    """The few aggregation expressions the app uses, with Mongo's date arithmetic."""
+    import math
+    from datetime import timedelta
+
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if not isinstance(expr, dict):
+        return expr
+    (op, arg), = expr.items()
+    if op == "$subtract":
+        a, b = (_evaluate(doc, x) for x in arg)
+        if isinstance(a, datetime) and isinstance(b, datetime):
+            return (a - b) // timedelta(milliseconds=1)
+        return a - b
+    if op == "$divide":
+        a, b = (_evaluate(doc, x) for x in arg)
+        return a / b
+    functions = {"$floor": math.floor, "$ceil": math.ceil, "$toLong": int}
+    if op in functions:
+        return functions[op](_evaluate(doc, arg))
+    raise NotImplementedError(f"fake aggregation expression {op}")
+
+
+def _project_stage(doc: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    projected = {}
+    for key, value in spec.items():
+        if isinstance(value, dict) or isinstance(value, str):
+            projected[key] = _evaluate(doc, value)
+        elif value and key in doc:
+            projected[key] = doc[key]
+    return projected
+
+
+class FakeAggregation:
+    def __init__(self, docs: List[Dict[str, Any]], pipeline: List[Dict[str, Any]]):
+        items = list(docs)
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                items = [d for d in items if _match(d, spec)]
+            elif name == "$project":
+                items = [_project_stage(d, spec) for d in items]
+            elif name == "$group":
+                groups: Dict[Any, Dict[str, Any]] = {}
+                for d in items:
+                    key = _evaluate(d, spec["_id"])
+                    group = groups.setdefault(key, {"_id": key})
+                    for field, acc in spec.items():
+                        if field != "_id":
+                            group[field] = group.get(field, 0) + _evaluate(d, acc["$sum"])
+                items = list(groups.values())
+            else:
+                raise NotImplementedError(f"fake aggregation stage {name}")
+        self._items = items
+
+    async def to_list(self, limit: Optional[int]):
+        return self._items if limit in (None, 0) else self._items[:limit]
+
+    async def __aiter__(self):
+        for item in self._items:
+            yield item
+
+
 class FakeCursor:
     def __init__(self, docs: List[Dict[str, Any]], query: Dict[str, Any], projection: Optional[Dict[str, int]] = None):
         self._docs = [d for d in docs if _match(d, query or {})]
         self._projection = projection
-        self._sort_key: Optional[str] = None
-        self._sort_dir: int = 1
+        self._sort: List[tuple] = []
+        self._limit: Optional[int] = None
+
+    def sort(self, key, direction: int = 1):
+        # Accepts sort("field", dir) or sort([("field", dir), ...]) like Motor
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
 
-    def sort(self, key: str, direction: int):
-        self._sort_key = key
-        self._sort_dir = direction
+    def limit(self, count: int):
+        self._limit = count
         return self
 
     async def to_list(self, limit: Optional[int]):
         items = list(self._docs)
-        if self._sort_key is not None:
-            items.sort(key=lambda x: x.get(self._sort_key), reverse=(self._sort_dir == -1))
+        for key, direction in reversed(self._sort):
+            # Missing fields sort first, as in Mongo
+            items.sort(key=lambda x: (x.get(key) is not None, x.get(key)), reverse=(direction == -1))
+        if self._limit:
+            items = items[:self._limit]
         if self._projection:
             omit = {k for k, v in self._projection.items() if v == 0}
             items = [
                 {k: v for k, v in d.items() if k not in omit}
                 for d in items
             ]
+        else:
+            items = [dict(d) for d in items]  # copies, like documents read from the server
         return items if limit in (None, 0) else items[:limit]
 
+    async def __aiter__(self):
+        for item in await self.to_list(None):
+            yield item
+
 
 class FakeCollection:
     def __init__(self):
@@ -205,17 +344,75 @@ class FakeCollection:
     def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, int]] = None):
         return FakeCursor(self.docs, query or {}, projection)
 
+    def aggregate(self, pipeline: List[Dict[str, Any]]):
+        return FakeAggregation(self.docs, pipeline)
+
     async def insert_one(self, doc: Dict[str, Any]):
-        self.docs.append(dict(doc))
+        self.docs.append({"_id": str(uuid.uuid4()), **doc})
         return types.SimpleNamespace(inserted_id=doc.get("id") or str(uuid.uuid4()))
 
-    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any]):
+    async def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        # Duplicate `_id`s fail like MongoDB's unordered bulk insert: the rest still go in
+        taken = {d["_id"] for d in self.docs if "_id" in d}
+        errors = []
+        for i, doc in enumerate(docs):
+            if "_id" in doc and doc["_id"] in taken:
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key error"})
+                if ordered:
+                    break
+                continue
+            taken.add(doc.get("_id"))
+            self.docs.append(dict(doc))
+        if errors:
+            from pymongo.errors import BulkWriteError
+
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+        return types.SimpleNamespace(inserted_ids=[d.get("id") or str(uuid.uuid4()) for d in docs])
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
         for d in self.docs:
             if _match(d, filter):
-                if "$set" in update:
-                    d.update(update["$set"])
-                return types.SimpleNamespace(modified_count=1)
-        return types.SimpleNamespace(modified_count=0)
+                _apply_update(d, update)
+                return types.SimpleNamespace(modified_count=1, upserted_id=None)
+        if upsert:
+            doc = {k: v for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+            _apply_update(doc, update)
+            self.docs.append(doc)
+            return types.SimpleNamespace(modified_count=0, upserted_id=str(uuid.uuid4()))
+        return types.SimpleNamespace(modified_count=0, upserted_id=None)
+
+    async def update_many(self, filter: Dict[str, Any], update: Dict[str, Any]):
+        matched = [d for d in self.docs if _match(d, filter)]
+        for d in matched:
+            _apply_update(d, update)
+        return types.SimpleNamespace(modified_count=len(matched))
+
+    async def find_one_and_update(self, filter: Dict[str, Any], update: Dict[str, Any],
+                                  projection: Optional[Dict[str, int]] = None, return_document: Any = False,
+                                  sort: Optional[List[tuple]] = None, **kwargs):
+        # Single-threaded, so match-then-update is atomic just like the server-side operation
+        docs = list(self.docs)
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda x: x.get(key), reverse=(direction == -1))
+        for d in docs:
+            if _match(d, filter):
+                before = dict(d)
+                _apply_update(d, update)
+                return _project(dict(d) if return_document else before, projection)
+        return None
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True):
+        # pymongo's InsertOne / UpdateOne keep their arguments in private attributes
+        inserted = modified = 0
+        for request in requests:
+            if hasattr(request, "_filter"):
+                result = await self.update_one(request._filter, request._doc, upsert=bool(getattr(request, "_upsert", False)))
+                modified += result.modified_count
+            else:
+                await self.insert_one(request._doc)
+                inserted += 1
+        return types.SimpleNamespace(inserted_count=inserted, modified_count=modified)
 
     async def delete_one(self, filter: Dict[str, Any]):
         for i, d in enumerate(self.docs):
@@ -224,6 +421,15 @@ class FakeCollection:
                 return types.SimpleNamespace(deleted_count=1)
         return types.SimpleNamespace(deleted_count=0)
 
+    async def delete_many(self, filter: Dict[str, Any]):
+        kept = [d for d in self.docs if not _match(d, filter)]
+        deleted = len(self.docs) - len(kept)
+        self.docs[:] = kept
+        return types.SimpleNamespace(deleted_count=deleted)
+
+    async def count_documents(self, filter: Dict[str, Any]):
+        return sum(1 for d in self.docs if _match(d, filter))
+
     async def estimated_document_count(self):
         return len(self.docs)
 
@@ -282,6 +488,18 @@ def fake_collections():
         "providers": FakeCollection(),
         "verificationTokens": FakeCollection(),
         "events": FakeCollection(),
+        "meetupSeries": FakeCollection(),
+        "calendarFeeds": FakeCollection(),
+        "reminderClaims": FakeCollection(),
+        "eventsArchive": FakeCollection(),
+        "eventSummaries": FakeCollection(),
+        "automationProjects": FakeCollection(),
+        "automationTestCases": FakeCollection(),
+        "automationTestRuns": FakeCollection(),
+        "automationProjectRuns": FakeCollection(),
+        "automationJobs": FakeCollection(),
+        "consultRequests": FakeCollection(),
+        "messages": FakeCollection(),
     }
     return collections
 
@@ -295,6 +513,7 @@ def fake_minio():
 def app_with_routers(monkeypatch, fake_collections, fake_minio):
     from fastapi import FastAPI
     from src.routes import auth as auth_routes, users as users_routes, payments as payments_routes, uploads as uploads_routes, meetups as meetups_routes, profile as profile_routes
+    from src.routes import automation as automation_routes
     from src.utils import auth as auth_utils
 
     app = FastAPI()
@@ -304,6 +523,7 @@ def app_with_routers(monkeypatch, fake_collections, fake_minio):
     app.include_router(payments_routes.router, prefix="/payments")
     app.include_router(uploads_routes.router, prefix="/uploads")
     app.include_router(meetups_routes.router, prefix="/meetups")
+    app.include_router(automation_routes.router)
 
     @app.get("/health")
     async def _health():
@@ -314,6 +534,7 @@ def app_with_routers(monkeypatch, fake_collections, fake_minio):
     monkeypatch.setattr(users_routes, "get_collections", lambda: fake_collections, raising=False)
     monkeypatch.setattr(profile_routes, "get_collections", lambda: fake_collections, raising=False)
     monkeypatch.setattr(meetups_routes, "get_collections", lambda: fake_collections, raising=False)
+    monkeypatch.setattr(automation_routes, "get_collections", lambda: fake_collections, raising=False)
     monkeypatch.setattr(uploads_routes, "get_minio_client", lambda: fake_minio, raising=False)
 
     # Avoid sending emails during tests
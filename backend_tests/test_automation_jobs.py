@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+
+def _expire(jobs):
+    for job in jobs.docs:
+        if job["status"] == "leased":
+            job["leaseExpiresAt"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+
+def test_jobs_are_claimed_by_priority_and_expired_leases_requeued(fake_collections):
+    from src.services import automation_jobs as queue
+
+    jobs = fake_collections["automationJobs"]
+    fake_collections["automationProjectRuns"].docs.append({"id": "r-dying", "status": "running"})
+
+    async def _run():
+        await queue.enqueue_job(fake_collections, "r-low", "p", priority=-1)
+        await queue.enqueue_job(fake_collections, "r-old", "p")
+        await queue.enqueue_job(fake_collections, "r-high", "p", priority=5)
+        await queue.enqueue_job(fake_collections, "r-new", "p")
+        claimed = [(await queue.claim_job(fake_collections, "w1"))["runId"] for _ in range(3)]
+        assert claimed == ["r-high", "r-old", "r-new"]
+        assert await queue.cancel_queued_job(fake_collections, "r-low")
+        assert await queue.claim_job(fake_collections, "w1") is None
+
+        # w1 dies: its jobs go back to the queue and another worker takes them over
+        _expire(jobs)
+        assert await queue.requeue_expired(fake_collections) == 3
+        job = await queue.claim_job(fake_collections, "w2")
+        assert job["runId"] == "r-high" and job["attempts"] == 2
+        assert not await queue.renew_lease(fake_collections, job["id"], "w1")
+        assert await queue.renew_lease(fake_collections, job["id"], "w2")
+
+        # A job whose workers keep dying is given up, with its run
+        await queue.enqueue_job(fake_collections, "r-dying", "p", priority=9)
+        for _ in range(queue.AUTOMATION_JOB_MAX_ATTEMPTS):
+            assert (await queue.claim_job(fake_collections, "w3"))["runId"] == "r-dying"
+            _expire(jobs)
+            await queue.requeue_expired(fake_collections)
+
+    asyncio.run(_run())
+    statuses = {job["runId"]: job["status"] for job in jobs.docs}
+    assert statuses == {"r-low": "cancelled", "r-old": "queued", "r-high": "queued", "r-new": "queued", "r-dying": "failed"}
+    assert fake_collections["automationProjectRuns"].docs[0]["status"] == "failed"
+
+
+def test_run_abandoned_by_a_dead_worker_resumes_after_its_last_batch(fake_collections, monkeypatch):
+    from src.services import automation_jobs as queue, automation_runs
+
+    monkeypatch.setattr(automation_runs, "AUTOMATION_RUN_BATCH_SIZE", 2)
+    executed = []
+
+    async def execute(test_case, cancelled=None):
+        executed.append(test_case["id"])
+        if len(executed) == 3:
+            await asyncio.sleep(60)  # the first worker dies during its second batch
+        return {"status": "passed", "duration": 1, "steps": 1}
+
+    monkeypatch.setattr(automation_runs, "execute_test_case", execute)
+    fake_collections["automationTestCases"].docs.extend(
+        {"id": f"tc{i}", "name": f"case {i}", "projectId": "p"} for i in range(5)
+    )
+
+    async def _run():
+        run = await automation_runs.create_project_run(fake_collections, "p", 5)
+        first = queue.AutomationWorker(fake_collections, poll_seconds=0.01, worker_id="first")
+        task = asyncio.create_task(first.run())
+        while len(executed) < 4:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        _expire(fake_collections["automationJobs"])
+        second = queue.AutomationWorker(fake_collections, poll_seconds=0.01, worker_id="second")
+        task = asyncio.create_task(second.run())
+        while (await fake_collections["automationProjectRuns"].find_one({"id": run["id"]}))["status"] != "completed":
+            await asyncio.sleep(0.01)
+        second.stop()
+        await task
+
+    asyncio.run(_run())
+    # tc0-tc1 ran once; the interrupted batch tc2-tc3 was not saved and ran again
+    assert executed == ["tc0", "tc1", "tc2", "tc3", "tc2", "tc3", "tc4"]
+    run = fake_collections["automationProjectRuns"].docs[0]
+    assert run["completed"] == run["passed"] == 5
+    assert len(fake_collections["automationTestRuns"].docs) == 5
+    job = fake_collections["automationJobs"].docs[0]
+    assert job["status"] == "done" and job["attempts"] == 2 and job["leaseOwner"] == "second"
@@ -0,0 +1,160 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.websockets import WebSocketState
+
+
+class _Socket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        return None
+
+    async def send_text(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+def _chats(socket):
+    return [m["message"] for m in socket.sent if m.get("type") == "chat"]
+
+
+@pytest.fixture()
+def chat_collections(monkeypatch, fake_collections):
+    from src.services import chat, consult_requests
+    from src.ws import signaling
+
+    monkeypatch.setattr(chat, "get_collections", lambda: fake_collections)
+    monkeypatch.setattr(consult_requests, "get_collections", lambda: fake_collections)
+    monkeypatch.setattr(signaling, "get_collections", lambda: fake_collections)
+    return fake_collections
+
+
+def test_chat_reaches_both_participants_and_is_written_in_batches(chat_collections, monkeypatch):
+    from src.services import chat
+    from src.ws import matchmaking
+
+    monkeypatch.setattr(chat, "CHAT_FLUSH_BATCH", 10)
+    calls = []
+    messages = chat_collections["messages"]
+    insert_many = messages.insert_many
+
+    async def _counting_insert_many(docs, ordered=True):
+        calls.append(len(docs))
+        return await insert_many(docs, ordered=ordered)
+
+    monkeypatch.setattr(messages, "insert_many", _counting_insert_many)
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        monkeypatch.setattr(matchmaking, "manager", mgr)
+        consumer, provider, outsider = _Socket(), _Socket(), _Socket()
+        await mgr.connect(consumer, "c", {"role": "consumer", "id": "c1"})
+        await mgr.connect(provider, "p", {"role": "provider", "id": "p1"})
+        await mgr.connect(outsider, "o", {"role": "consumer", "id": "c2"})
+        queued = await mgr.engine.submit("c1", "c", "consumer", "cough", None)
+        request_id = queued["requestId"]
+        assert await mgr.engine.accept("p1", request_id)
+
+        users = {"c": ({"role": "consumer", "id": "c1"}, consumer), "p": ({"role": "provider", "id": "p1"}, provider),
+                 "o": ({"role": "consumer", "id": "c2"}, outsider)}
+
+        async def _say(connection_id, text):
+            user_data, socket = users[connection_id]
+            message = {"type": "chat", "requestId": request_id, "text": text}
+            await matchmaking.handle_websocket_message(socket, message, connection_id, user_data)
+
+        for i in range(25):
+            await _say("c", f"m{i}")
+        await _say("p", "hello")
+        await _say("o", "let me in")
+        await _say("c", "")
+        await asyncio.sleep(0.05)
+
+        # Delivered to both sides (the sender's copy is its ack), in order
+        for socket in (consumer, provider):
+            received = _chats(socket)
+            assert [m["text"] for m in received] == [f"m{i}" for i in range(25)] + ["hello"]
+            assert [m["seq"] for m in received] == sorted(m["seq"] for m in received)
+        assert _chats(outsider) == []
+        errors = [m["error"] for m in outsider.sent + consumer.sent if m.get("type") == "error"]
+        assert errors == ["Not a participant of this consult", "Invalid chat message"]
+
+        await mgr.chat.flush()
+        assert len(messages.docs) == 26
+        assert len(calls) <= 4 and max(calls) == 10  # batched, not one write per message
+        assert mgr.stats()["chat"]["recorded"] == 26
+
+    asyncio.run(_run())
+
+
+def test_history_pages_back_for_participants_only(chat_collections, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from src.routes import consults
+    from src.ws import matchmaking
+    from src.utils.auth import generate_token
+
+    mgr = matchmaking.ConnectionManager()
+    monkeypatch.setattr(matchmaking, "manager", mgr)
+    chat_collections["consultRequests"].docs.append({"id": "r1", "requesterId": "c1", "providerId": "p1", "status": "accepted"})
+    chat_collections["messages"].docs.extend(
+        {"conversationId": "r1", "seq": 1000 + i, "from": "c1", "text": f"m{i}"} for i in range(5)
+    )
+
+    app = FastAPI()
+    app.include_router(consults.router, prefix="/consults")
+    c1 = {"Authorization": "Bearer " + generate_token({"role": "consumer", "id": "c1"})}
+    p2 = {"Authorization": "Bearer " + generate_token({"role": "provider", "id": "p2"})}
+
+    with TestClient(app) as c:
+        assert c.get("/consults/r1/messages", headers=p2).status_code == 403
+
+        page = c.get("/consults/r1/messages?limit=3", headers=c1).json()
+        assert [m["text"] for m in page["items"]] == ["m4", "m3", "m2"]
+        rest = c.get("/consults/r1/messages", params={"limit": 3, "before": page["nextBefore"]}, headers=c1).json()
+        assert [m["text"] for m in rest["items"]] == ["m1", "m0"] and rest["nextBefore"] is None
+
+
+def test_chat_is_authorized_from_the_stored_consult_on_any_worker(chat_collections, monkeypatch):
+    from src.ws import matchmaking
+
+    chat_collections["consultRequests"].docs.extend([
+        {"id": "r1", "requesterId": "c1", "providerId": "p1", "status": "accepted"},
+        {"id": "r2", "requesterId": "c1", "providerId": "p1", "status": "pending"},
+    ])
+
+    async def _run():
+        # A fresh worker (or one restarted) that never saw the match
+        mgr = matchmaking.ConnectionManager()
+        monkeypatch.setattr(matchmaking, "manager", mgr)
+        consumer, provider = _Socket(), _Socket()
+        await mgr.connect(consumer, "c", {"role": "consumer", "id": "c1"})
+        await mgr.connect(provider, "p", {"role": "provider", "id": "p1"})
+        for request_id in ("r1", "r2", "r1"):
+            message = {"type": "chat", "requestId": request_id, "text": "hi"}
+            await matchmaking.handle_websocket_message(consumer, message, "c", {"role": "consumer", "id": "c1"})
+        await asyncio.sleep(0.02)
+
+        assert [m["conversationId"] for m in _chats(provider)] == ["r1", "r1"]
+        assert [m["error"] for m in consumer.sent if m.get("type") == "error"] == ["Not a participant of this consult"]
+        assert mgr.stats()["chatAuth"] == {"cachedMeetups": 2, "hits": 1, "misses": 2}
+
+    asyncio.run(_run())
+
+
+def test_chat_seqs_from_two_workers_in_one_millisecond_do_not_collide(monkeypatch):
+    from src.services import chat
+
+    monkeypatch.setattr(chat.time, "time", lambda: 1700000000.0)
+    worker_a, worker_b = chat.ChatLog(node_id=1), chat.ChatLog(node_id=2)
+    seqs_a = [worker_a.next_seq("r1") for _ in range(3)]
+    seqs_b = [worker_b.next_seq("r1") for _ in range(3)]
+    assert seqs_a == sorted(seqs_a) and seqs_b == sorted(seqs_b)
+    assert not set(seqs_a) & set(seqs_b)
+    assert max(seqs_a + seqs_b) < 2 ** 53
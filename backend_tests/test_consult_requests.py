@@ -0,0 +1,106 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.websockets import WebSocketState
+
+
+class _Socket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        return None
+
+    async def send_text(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+@pytest.fixture()
+def store_collections(monkeypatch, fake_collections):
+    from src.services import consult_requests
+
+    monkeypatch.setattr(consult_requests, "get_collections", lambda: fake_collections)
+    return fake_collections
+
+
+def test_engine_persists_status_lifecycle(store_collections):
+    from src.ws import matchmaking
+
+    docs = store_collections["consultRequests"].docs
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        store = mgr.engine.store
+        await mgr.connect(_Socket(), "c", {"role": "consumer", "id": "c1"})
+
+        queued = await mgr.engine.submit("c1", "c", "consumer", "rash", "dermatology")
+        await store.flush()
+        assert docs[0]["status"] == "pending" and docs[0]["specialization"] == "dermatology"
+        assert docs[0]["expiresAt"] > docs[0]["createdAt"]
+
+        await mgr.connect(_Socket(), "p", {"role": "provider", "id": "p1", "specialization": "Dermatology"})
+        await store.flush()
+        assert docs[0]["status"] == "offered" and docs[0]["offeredTo"] == "p1"
+
+        await mgr.engine.decline("p1", queued["requestId"])
+        await store.flush()
+        assert docs[0]["status"] == "expired"  # the only provider declined it
+
+        second = await mgr.engine.submit("c1", "c", "consumer", "rash again", None)
+        assert await mgr.engine.accept("p1", second["requestId"])
+        await store.flush()
+        assert docs[1]["status"] == "accepted" and docs[1]["providerId"] == "p1"
+        assert "expiresAt" not in docs[1]  # kept as history, out of the TTL index
+
+        # Terminal: a late expiry cannot overwrite an accepted request
+        mgr.engine.store.finished(second["requestId"], "expired")
+        await store.flush()
+        assert docs[1]["status"] == "accepted"
+
+    asyncio.run(_run())
+
+
+def test_pending_queue_pages_and_claim_is_exclusive(store_collections, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from src.routes import consults
+    from src.ws import matchmaking
+    from src.utils.auth import generate_token
+
+    monkeypatch.setattr(matchmaking, "manager", matchmaking.ConnectionManager())
+    now = datetime.utcnow()
+    store_collections["consultRequests"].docs.extend([
+        {"id": f"r{i}", "requesterId": "c1", "specialization": "cardiology" if i % 2 else "",
+         "status": "pending", "createdAt": now - timedelta(minutes=10 - i), "expiresAt": now + timedelta(minutes=5)}
+        for i in range(5)
+    ] + [
+        {"id": "stale", "specialization": "", "status": "pending", "createdAt": now - timedelta(hours=1), "expiresAt": now - timedelta(minutes=1)},
+        {"id": "derm", "specialization": "dermatology", "status": "pending", "createdAt": now, "expiresAt": now + timedelta(minutes=5)},
+    ])
+
+    app = FastAPI()
+    app.include_router(consults.router, prefix="/consults")
+    p1 = {"Authorization": "Bearer " + generate_token({"role": "provider", "id": "p1"})}
+    p2 = {"Authorization": "Bearer " + generate_token({"role": "provider", "id": "p2"})}
+    consumer = {"Authorization": "Bearer " + generate_token({"role": "consumer", "id": "c1"})}
+
+    with TestClient(app) as c:
+        assert c.get("/consults/pending", headers=consumer).status_code == 403
+
+        page = c.get("/consults/pending?specialization=Cardiology&limit=3", headers=p1).json()
+        assert [d["id"] for d in page["items"]] == ["r0", "r1", "r2"]
+        rest = c.get("/consults/pending", params={"specialization": "cardiology", "limit": 3, "cursor": page["nextCursor"]}, headers=p1).json()
+        assert [d["id"] for d in rest["items"]] == ["r3", "r4"] and rest["nextCursor"] is None
+
+        first = c.post("/consults/r1/claim", headers=p1)
+        assert first.status_code == 200 and first.json()["status"] == "accepted" and first.json()["providerId"] == "p1"
+        assert c.post("/consults/r1/claim", headers=p2).status_code == 409
+        assert c.post("/consults/stale/claim", headers=p2).status_code == 409
+        assert "r1" not in [d["id"] for d in c.get("/consults/pending", headers=p2).json()["items"]]
+        assert c.get("/consults/pending?cursor=garbage", headers=p1).status_code == 400
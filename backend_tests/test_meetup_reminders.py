@@ -0,0 +1,87 @@
+import asyncio
+import json
+import types
+from datetime import datetime, timedelta, timezone
+
+
+def _scheduler(monkeypatch, fake_collections, published, emails):
+    from src.services import reminders
+
+    async def publish(topic, message, **kwargs):
+        published.append((topic, json.loads(message)))
+        return 1
+
+    async def send(to, title, start, minutes_before):
+        emails.append((to, title, minutes_before))
+        return True
+
+    monkeypatch.setattr(reminders, "get_collections", lambda: fake_collections)
+    monkeypatch.setattr(reminders, "REMINDER_LEADS", [timedelta(seconds=1)])
+    monkeypatch.setattr(reminders, "REMINDER_BATCH", timedelta(milliseconds=500))
+    monkeypatch.setattr(reminders.matchmaking, "manager", types.SimpleNamespace(publish=publish))
+    monkeypatch.setattr(reminders, "send_meetup_reminder_email", send)
+    return reminders.ReminderScheduler()
+
+
+def test_due_reminders_are_sent_once_in_a_batch(monkeypatch, fake_collections):
+    from src.services import reminders
+
+    published, emails = [], []
+    scheduler = _scheduler(monkeypatch, fake_collections, published, emails)
+    now = datetime.now(timezone.utc)
+    fake_collections["consumers"].docs.append({"id": "c1", "email": "c1@example.com"})
+    fake_collections["providers"].docs.append({"id": "p1", "email": "p1@example.com"})
+    for i, (offset, status) in enumerate([(1.2, "scheduled"), (1.3, "scheduled"), (1.25, "cancelled"),
+                                          (1.2, "scheduled"), (60 * 60 * 24, "scheduled"), (1.2, "scheduled")]):
+        fake_collections["events"].docs.append({
+            "id": f"m{i}", "title": f"Meetup {i}", "requesterId": "c1", "participantId": "p1", "status": status,
+            "start": now + timedelta(seconds=offset), "end": now + timedelta(seconds=offset, hours=1),
+        })
+
+    events = fake_collections["events"].docs
+    m3_claim = reminders.claim_id(events[3], timedelta(seconds=1))
+
+    async def run():
+        # Another worker already sent m3's reminder
+        await fake_collections["reminderClaims"].insert_one({"_id": m3_claim})
+        # m0's reminder for its earlier start does not count
+        await fake_collections["reminderClaims"].insert_one(
+            {"_id": reminders.claim_id({**events[0], "start": now - timedelta(days=1)}, timedelta(seconds=1))})
+        await scheduler.start()
+        assert scheduler.stats()["meetups"] == 4  # m2 is cancelled, m4 is outside the window
+        # m1 moves out of reach before its reminder is due
+        scheduler.schedule({**events[1], "start": now + timedelta(hours=5)})
+        # m5 is cancelled through another worker, so this one was not told
+        events[5]["status"] = "cancelled"
+        await asyncio.sleep(0.8)
+        await scheduler.stop()
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+    assert sorted(topic for topic, _ in published) == ["user:c1", "user:p1"]
+    assert all(m["type"] == "meetup.reminder" and m["meetupId"] == "m0" for _, m in published)
+    assert sorted(emails) == [("c1@example.com", "Meetup 0", 0), ("p1@example.com", "Meetup 0", 0)]
+    assert scheduler.stats()["batches"] == 1 and scheduler.stats()["stale"] == 2
+    assert len(fake_collections["reminderClaims"].docs) == 3
+    assert reminders.claim_id(events[0], timedelta(seconds=1)) in {c["_id"] for c in fake_collections["reminderClaims"].docs}
+
+
+def test_series_occurrences_are_reminded(monkeypatch, fake_collections):
+    published, emails = [], []
+    scheduler = _scheduler(monkeypatch, fake_collections, published, emails)
+    now = datetime.now(timezone.utc)
+    first = now - timedelta(days=1) + timedelta(seconds=1.2)
+    fake_collections["meetupSeries"].docs.append({
+        "id": "s1", "type": "series", "title": "Weekly", "requesterId": "c1", "participantId": "p1",
+        "status": "scheduled", "freq": "daily", "interval": 1, "count": 3, "lastEnd": first + timedelta(days=2, hours=1),
+        "start": first, "end": first + timedelta(hours=1),
+    })
+
+    async def run():
+        await scheduler.start()
+        await asyncio.sleep(0.8)
+        await scheduler.stop()
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+    assert {m["meetupId"] for _, m in published} == {"s1:1"}
@@ -0,0 +1,195 @@
+import time
+
+import pytest
+
+
+@pytest.fixture()
+def case_executor(monkeypatch):
+    """A small process pool for this test, with shell steps allowed"""
+    from src.services import case_executor as module
+
+    executor = module.CaseExecutor(workers=2, timeout=2)
+    monkeypatch.setattr(module, "executor", executor)
+    monkeypatch.setattr(module, "AUTOMATION_ALLOW_SHELL", True)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture()
+def automation_worker(client, fake_collections, case_executor):
+    """An automation worker on the app's event loop, polling the fake job queue"""
+    from datetime import timedelta
+    from src.services.automation_jobs import AutomationWorker
+
+    worker = AutomationWorker(fake_collections, concurrency=2, lease=timedelta(seconds=0.6), poll_seconds=0.01)
+    running = client.portal.start_task_soon(worker.run)
+    yield worker
+    worker.stop()
+    running.result(timeout=30)
+
+
+def wait_for_run(client, run_id, statuses=("completed", "cancelled", "failed")):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        run = client.get(f"/automation/runs/{run_id}").json()
+        if run["status"] in statuses:
+            return run
+        time.sleep(0.02)
+    raise AssertionError(f"run {run_id} did not finish: {run}")
+
+
+def test_project_listing_pages_by_name_and_keeps_test_case_counts(client, fake_collections):
+    projects = fake_collections["automationProjects"]
+    for name in ["beta", "alpha", "alphabet", "gamma"]:
+        r = client.post("/automation/projects", json={"name": name})
+        assert r.status_code == 200, r.text
+    # Created before the counter existed: counted once by the listing, then kept
+    projects.docs.append({"_id": "5f1d7a3e9b1e8a0012345677", "id": "legacy", "name": "alpha-old", "createdAt": "2020-01-01T00:00:00"})
+    fake_collections["automationTestCases"].docs.extend(
+        {"id": f"old{i}", "name": "t", "projectId": "legacy"} for i in range(3)
+    )
+    ids = {p["name"]: p["id"] for p in projects.docs}
+    # Older still: no `id` at all, listed under its _id
+    projects.docs.append({"_id": "5f1d7a3e9b1e8a0012345678", "name": "zeta", "createdAt": "2019-01-01T00:00:00"})
+
+    case = client.post("/automation/testcases", json={"name": "login", "projectId": ids["alpha"]}).json()
+    client.post("/automation/testcases", json={"name": "logout", "projectId": ids["alpha"]})
+    client.post("/automation/testcases", json={"name": "new", "projectId": "legacy"})
+
+    r = client.get("/automation/projects", params={"limit": 2})
+    assert [p["name"] for p in r.json()] == ["alpha", "alpha-old"]
+    assert [p["testCaseCount"] for p in r.json()] == [2, 4]
+    assert r.json()[0]["testCases"] == [{"count": 2}]
+    assert next(p for p in projects.docs if p["id"] == "legacy")["testCaseCount"] == 4
+
+    r = client.get("/automation/projects", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert [p["name"] for p in r.json()] == ["alphabet", "beta"]
+    r = client.get("/automation/projects", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert [(p["name"], p["id"]) for p in r.json()] == [("gamma", ids["gamma"]), ("zeta", "5f1d7a3e9b1e8a0012345678")]
+    assert r.headers["X-Next-Cursor"] == "zeta|5f1d7a3e9b1e8a0012345678"
+    r = client.get("/automation/projects", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert r.json() == [] and "X-Next-Cursor" not in r.headers
+
+    assert [p["name"] for p in client.get("/automation/projects", params={"name": "alpha"}).json()] == ["alpha", "alpha-old", "alphabet"]
+    assert client.get("/automation/projects", params={"name": "a.p"}).json() == []
+
+    # Moving and deleting test cases keep both counters right
+    client.put(f"/automation/testcases/{case['id']}", json={"name": "login", "projectId": ids["beta"]})
+    client.delete(f"/automation/testcases/{case['id']}")
+    counts = {p["name"]: p["testCaseCount"] for p in client.get("/automation/projects").json()}
+    assert counts == {"alpha": 1, "alpha-old": 4, "alphabet": 0, "beta": 0, "gamma": 0, "zeta": 0}
+
+
+def test_project_run_is_queued_and_persisted_in_batches(client, fake_collections, monkeypatch, automation_worker):
+    from src.services import automation_runs
+
+    monkeypatch.setattr(automation_runs, "AUTOMATION_RUN_BATCH_SIZE", 2)
+    writes, nested = [], []
+    for name in ("automationTestRuns", "automationTestCases"):
+        collection = fake_collections[name]
+        for method in ("insert_one", "insert_many", "update_one", "bulk_write"):
+            original = getattr(collection, method)
+
+            async def counted(*args, _original=original, _name=f"{name}.{method}", **kwargs):
+                # The fake's bulk_write calls update_one; count round trips only
+                if not nested:
+                    writes.append(_name)
+                nested.append(_name)
+                try:
+                    return await _original(*args, **kwargs)
+                finally:
+                    nested.pop()
+            monkeypatch.setattr(collection, method, counted)
+
+    project = client.post("/automation/projects", json={"name": "checkout"}).json()
+    fake_collections["automationTestCases"].docs.extend(
+        {"id": f"tc{i}", "name": f"case {i}", "steps": f"Open the cart\nshell: echo case {i}",
+         "projectId": project["id"], "lastResult": "pending"}
+        for i in range(5)
+    )
+    assert client.post("/automation/projects/nothing/run").status_code == 404
+
+    r = client.post(f"/automation/projects/{project['id']}/run", params={"priority": 2})
+    assert r.status_code == 202, r.text
+    run = wait_for_run(client, r.json()["runId"])
+
+    assert run["status"] == "completed" and run["total"] == run["completed"] == run["passed"] == 5
+    test_runs = fake_collections["automationTestRuns"].docs
+    assert sorted(t["results"]["stdout"] for t in test_runs) == [f"case {i}\n" for i in range(5)]
+    assert all(tc["lastResult"] == "passed" for tc in fake_collections["automationTestCases"].docs)
+    # Three batches, each one insert_many and one bulk_write
+    assert writes == ["automationTestRuns.insert_many", "automationTestCases.bulk_write"] * 3
+    assert client.get("/automation/runs/unknown").status_code == 404
+
+
+def test_steps_run_in_parallel_with_timeouts_http_checks_and_cancellation(client, fake_collections, monkeypatch, automation_worker):
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from src.services import automation_runs, case_executor as module
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200 if self.path == "/ok" else 404)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    project = client.post("/automation/projects", json={"name": "engine"}).json()
+
+    def case(case_id, steps):
+        return client.post("/automation/testcases", json={"name": case_id, "steps": steps, "projectId": project["id"]}).json()["id"]
+
+    try:
+        ok = case("ok", f"http: GET {base}/ok\nhttp: GET {base}/missing 404")
+        missing = case("missing", f"http: GET {base}/missing\nshell: echo never")
+        slow = case("slow", "shell: sleep 30; echo late")
+        notes = case("notes", "Click around and see")
+        failing = case("failing", "shell: echo oops >&2; exit 3")
+        results = {c: client.post(f"/automation/testcases/{c}/run").json() for c in (ok, missing, slow, notes, failing)}
+        assert results[ok]["result"] == "passed"
+        assert results[missing]["result"] == "failed" and "404" in results[missing]["error"]
+        assert results[slow]["result"] == "failed" and "timed out" in results[slow]["error"]
+        assert results[notes]["result"] == "skipped"
+        failed_run = next(t for t in fake_collections["automationTestRuns"].docs if t["testCaseId"] == failing)
+        assert failed_run["results"]["failedStep"] == 0 and "oops" in failed_run["results"]["error"]
+
+        # Shell steps are refused unless enabled
+        monkeypatch.setattr(module, "AUTOMATION_ALLOW_SHELL", False)
+        assert "disabled" in client.post(f"/automation/testcases/{failing}/run").json()["error"]
+        monkeypatch.setattr(module, "AUTOMATION_ALLOW_SHELL", True)
+    finally:
+        server.shutdown()
+
+    # Two workers: cases of one batch overlap in time
+    fake_collections["automationTestCases"].docs.clear()
+    for i in range(2):
+        case(f"timed{i}", "shell: python -c 'import time; print(time.time())'; sleep 0.5; python -c 'import time; print(time.time())'")
+    run = wait_for_run(client, client.post(f"/automation/projects/{project['id']}/run").json()["runId"])
+    assert run["passed"] == 2
+    spans = [[float(x) for x in t["results"]["stdout"].split()] for t in fake_collections["automationTestRuns"].docs[-2:]]
+    assert max(s[0] for s in spans) < min(s[1] for s in spans)
+
+    # Cancelling stops the run between batches
+    monkeypatch.setattr(automation_runs, "AUTOMATION_RUN_BATCH_SIZE", 2)
+    for i in range(6):
+        case(f"queued{i}", "shell: sleep 0.3")
+    run_id = client.post(f"/automation/projects/{project['id']}/run").json()["runId"]
+    wait_for_run(client, run_id, statuses=("running",))
+    assert client.post(f"/automation/runs/{run_id}/cancel").status_code == 200
+    run = wait_for_run(client, run_id)
+    assert run["status"] == "cancelled" and run["completed"] < run["total"] == 8
+    assert client.post(f"/automation/runs/{run_id}/cancel").status_code == 409
+    job = next(j for j in fake_collections["automationJobs"].docs if j["runId"] == run_id)
+    assert job["status"] == "cancelled"
+
+    # A run no worker has claimed yet is cancelled straight away
+    automation_worker.stop()
+    run_id = client.post(f"/automation/projects/{project['id']}/run").json()["runId"]
+    time.sleep(0.05)
+    r = client.post(f"/automation/runs/{run_id}/cancel")
+    assert r.json()["message"] == "Run cancelled"
+    assert client.get(f"/automation/runs/{run_id}").json()["status"] == "cancelled"
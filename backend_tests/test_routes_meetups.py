@@ -1,5 +1,5 @@
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 
 def test_meetups_crud_and_permissions(client, set_auth_user):
@@ -79,3 +79,258 @@ def test_meetups_crud_and_permissions(client, set_auth_user):
     # Invalid timing
     r = client.patch(f"/meetups/{event_id}", json={"start": end, "end": start})
     assert r.status_code == 400
+
+
+def test_meetup_conflicts_and_provider_availability(client, set_auth_user, fake_collections):
+    fake_collections["providers"].docs.append({"id": "p1", "name": "P One"})
+    fake_collections["consumers"].docs.extend([{"id": "c1"}, {"id": "c2"}])
+    day = "2030-01-07T"
+
+    def book(user_id, start, end):
+        set_auth_user({"role": "consumer", "id": user_id})
+        return client.post("/meetups/", json={"targetUserId": "p1", "start": day + start + "Z", "end": day + end + "Z"})
+
+    first = book("c1", "09:00:00", "10:00:00")
+    assert first.status_code == 201, first.text
+    assert book("c2", "09:30:00", "10:30:00").status_code == 409  # provider is busy
+    assert book("c1", "09:45:00", "09:50:00").status_code == 409  # so is the consumer
+    assert book("c2", "10:00:00", "11:00:00").status_code == 201  # back to back is fine
+    assert book("c2", "12:00:00", "13:00:00+02:00").status_code == 400  # ends before it starts
+    assert len(fake_collections["events"].docs) == 2
+
+    set_auth_user({"role": "consumer", "id": "c1"})
+    r = client.get("/meetups/availability", params={"providerId": "p1", "from": day + "08:00:00Z", "to": day + "12:00:00Z", "slot": 30})
+    assert r.status_code == 200, r.text
+    starts = [s["start"][11:16] for s in r.json()["free"]]
+    assert starts == ["08:00", "08:30", "11:00", "11:30"]
+    assert client.get("/meetups/availability", params={"providerId": "nobody", "from": day + "08:00:00Z", "to": day + "09:00:00Z"}).status_code == 404
+
+    # Moving a meetup onto another one is rejected and leaves it where it was
+    event_id = first.json()["id"]
+    r = client.patch(f"/meetups/{event_id}", json={"start": day + "10:30:00Z", "end": day + "11:30:00Z"})
+    assert r.status_code == 409
+    assert client.get(f"/meetups/{event_id}").json()["start"].startswith(day + "09:00")
+
+    # Cancelling frees the slot
+    assert client.patch(f"/meetups/{event_id}", json={"status": "cancelled"}).status_code == 200
+    r = client.get("/meetups/availability", params={"providerId": "p1", "from": day + "08:00:00Z", "to": day + "10:00:00Z", "slot": 60})
+    assert [s["start"][11:16] for s in r.json()["free"]] == ["08:00", "09:00"]
+
+
+def test_bulk_availability_finds_providers_free_for_a_duration(client, set_auth_user, fake_collections):
+    day = datetime(2030, 1, 8, tzinfo=timezone.utc)
+    fake_collections["providers"].docs.extend([
+        {"id": "p1", "name": "Free", "specialization": "Cardiology", "active": True},
+        {"id": "p2", "name": "Booked", "specialization": "cardiology", "active": True},
+        {"id": "p3", "name": "Other", "specialization": "Dermatology", "active": True},
+        {"id": "p4", "name": "Unverified", "specialization": "Cardiology", "active": False},
+        {"id": "p5", "name": "Later", "specialization": "Cardiology", "active": True},
+    ])
+    fake_collections["events"].docs.extend([
+        # p2 is busy 14:50-16:10, which touches every 15-minute slot of 15:00-16:00
+        {"id": "e1", "requesterId": "c1", "participantId": "p2", "status": "scheduled",
+         "start": day.replace(hour=14, minute=50), "end": day.replace(hour=16, minute=10)},
+        {"id": "e2", "requesterId": "p1", "participantId": "c1", "status": "cancelled",
+         "start": day.replace(hour=15), "end": day.replace(hour=16)},
+        {"id": "e3", "requesterId": "c1", "participantId": "p5", "status": "scheduled",
+         "start": day.replace(hour=15), "end": day.replace(hour=15, minute=20)},
+    ])
+    fake_collections["meetupSeries"].docs.append({
+        "id": "s1", "type": "series", "requesterId": "c2", "participantId": "p1", "status": "scheduled",
+        "freq": "daily", "interval": 1, "lastEnd": None,
+        "start": day.replace(day=1, hour=16, minute=30), "end": day.replace(day=1, hour=17),
+    })
+
+    set_auth_user({"role": "consumer", "id": "c1"})
+    params = {"from": "2030-01-08T15:00:00Z", "to": "2030-01-08T16:00:00Z", "duration": 30, "specialization": " cardiology"}
+    r = client.get("/meetups/availability/providers", params=params)
+    assert r.status_code == 200, r.text
+    assert [(p["providerId"], p["firstFree"][11:16]) for p in r.json()["providers"]] == [("p1", "15:00"), ("p5", "15:30")]
+
+    # The series occurrence takes p1's 16:30-17:00
+    r = client.get("/meetups/availability/providers", params={**params, "from": "2030-01-08T16:15:00Z", "to": "2030-01-08T17:15:00Z"})
+    assert [p["providerId"] for p in r.json()["providers"]] == ["p2", "p5"]
+    r = client.get("/meetups/availability/providers", params={**params, "specialization": None, "duration": 60})
+    assert [p["providerId"] for p in r.json()["providers"]] == ["p1", "p3"]
+
+
+def test_meetup_listing_pages_by_start_and_migration_converts_dates(client, set_auth_user, fake_collections, monkeypatch):
+    from src import db
+
+    events = fake_collections["events"]
+    for i in range(6):
+        # Alternate sides of the meetup; the oldest ones still hold ISO strings
+        start = datetime(2030, 1, 1 + i, 9, tzinfo=timezone.utc)
+        events.docs.append({
+            "id": f"e{i}", "requesterId": "c1" if i % 2 else "p1", "participantId": "p1" if i % 2 else "c1",
+            "start": start.isoformat() if i < 3 else start, "end": (start + timedelta(hours=1)).isoformat() if i < 3 else start + timedelta(hours=1),
+            "status": "cancelled" if i == 4 else "scheduled",
+        })
+    events.docs.append({"id": "bad", "requesterId": "c9", "participantId": "p9", "start": "not a date", "end": "x"})
+
+    monkeypatch.setattr(db, "get_collections", lambda: fake_collections)
+    assert asyncio.run(db.migrate_event_dates(batch_size=2)) == 3
+    assert all(isinstance(e["start"], datetime) for e in events.docs if e["id"] != "bad")
+
+    set_auth_user({"role": "consumer", "id": "c1"})
+    r = client.get("/meetups/", params={"limit": 2})
+    assert [e["id"] for e in r.json()] == ["e0", "e1"]
+    assert r.json()[0]["start"] == "2030-01-01T09:00:00+00:00"
+    r = client.get("/meetups/", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert [e["id"] for e in r.json()] == ["e2", "e3"]
+    r = client.get("/meetups/", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert [e["id"] for e in r.json()] == ["e4", "e5"]
+
+    r = client.get("/meetups/", params={"from": "2030-01-02T00:00:00Z", "to": "2030-01-05T12:00:00Z", "status": "scheduled"})
+    assert [e["id"] for e in r.json()] == ["e1", "e2", "e3"] and "X-Next-Cursor" not in r.headers
+    assert client.get("/meetups/", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_finished_meetups_are_archived_with_per_user_counts(client, set_auth_user, fake_collections, monkeypatch):
+    from src.services import event_archive
+
+    now = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    events = fake_collections["events"]
+    for i, (days_ago, status) in enumerate([(400, "completed"), (300, "cancelled"), (250, "completed"),
+                                            (300, "scheduled"), (10, "cancelled")]):
+        start = now - timedelta(days=days_ago)
+        events.docs.append({"id": f"e{i}", "requesterId": "c1", "participantId": "p1" if i else "p2",
+                            "status": status, "start": start, "end": start + timedelta(hours=1)})
+
+    monkeypatch.setattr(event_archive, "get_collections", lambda: fake_collections)
+    assert asyncio.run(event_archive.archive_events(batch_size=2, now=now)) == 3
+    assert [e["id"] for e in events.docs] == ["e3", "e4"]  # still scheduled, or too recent
+    assert asyncio.run(event_archive.archive_events(batch_size=2, now=now)) == 0
+
+    set_auth_user({"role": "consumer", "id": "c1"})
+    assert client.get("/meetups/summary").json() == {"userId": "c1", "archived": {"cancelled": 1, "completed": 2}}
+    assert [e["id"] for e in client.get("/meetups/").json()] == ["e3", "e4"]
+    assert [e["id"] for e in client.get("/meetups/", params={"archived": True}).json()] == ["e0", "e1", "e2"]
+    assert client.get("/meetups/e1").status_code == 404
+    assert client.get("/meetups/e1", params={"archived": True}).json()["status"] == "cancelled"
+
+    set_auth_user({"role": "provider", "id": "p1"})
+    assert client.get("/meetups/summary").json()["archived"] == {"cancelled": 1, "completed": 1}
+    assert client.get("/meetups/e0", params={"archived": True}).status_code == 403
+
+
+def test_recurring_series_expands_lazily_into_listings_and_conflicts(client, set_auth_user, fake_collections):
+    fake_collections["providers"].docs.append({"id": "p1"})
+    fake_collections["consumers"].docs.extend([{"id": "c1"}, {"id": "c2"}])
+    set_auth_user({"role": "consumer", "id": "c1"})
+
+    # Open-ended weekly follow-up, Mondays 09:00-09:30
+    r = client.post("/meetups/series", json={"targetUserId": "p1", "start": "2030-01-07T09:00:00Z",
+                                             "end": "2030-01-07T09:30:00Z", "freq": "weekly", "title": "Follow-up"})
+    assert r.status_code == 201, r.text
+    series = r.json()
+    assert series["lastEnd"] is None and len(fake_collections["meetupSeries"].docs) == 1
+    assert client.post("/meetups/series", json={"targetUserId": "p1", "start": "2030-01-07T09:00:00Z",
+                                                "end": "2030-01-09T09:00:00Z", "freq": "daily"}).status_code == 400
+
+    # Years ahead: only the window is expanded
+    r = client.get("/meetups/", params={"from": "2035-03-01T00:00:00Z", "to": "2035-03-20T00:00:00Z"})
+    assert [e["start"] for e in r.json()] == ["2035-03-05T09:00:00+00:00", "2035-03-12T09:00:00+00:00", "2035-03-19T09:00:00+00:00"]
+    occurrence = r.json()[1]
+    assert occurrence["seriesId"] == series["id"] and occurrence["title"] == "Follow-up"
+    assert client.get(f"/meetups/{occurrence['id']}").json()["start"] == occurrence["start"]
+
+    # Occurrences block the provider's calendar, plain meetups in between do not clash
+    set_auth_user({"role": "consumer", "id": "c2"})
+    assert client.post("/meetups/", json={"targetUserId": "p1", "start": "2035-03-12T09:15:00Z", "end": "2035-03-12T10:00:00Z"}).status_code == 409
+    assert client.post("/meetups/", json={"targetUserId": "p1", "start": "2030-01-08T09:00:00Z", "end": "2030-01-08T10:00:00Z"}).status_code == 201
+    assert client.post("/meetups/series", json={"targetUserId": "p1", "start": "2030-01-02T09:00:00Z", "end": "2030-01-02T10:00:00Z",
+                                                "freq": "daily", "count": 10}).status_code == 409
+    r = client.get("/meetups/availability", params={"providerId": "p1", "from": "2035-03-12T08:00:00Z", "to": "2035-03-12T10:00:00Z", "slot": 30})
+    assert [s["start"][11:16] for s in r.json()["free"]] == ["08:00", "08:30", "09:30"]
+
+    # Skipping one occurrence frees it everywhere
+    set_auth_user({"role": "provider", "id": "p1"})
+    r = client.patch(f"/meetups/series/{series['id']}", json={"skip": ["2035-03-12T09:00:00Z"]})
+    assert r.json()["exdates"] == ["2035-03-12T09:00:00+00:00"]
+    r = client.get("/meetups/", params={"from": "2035-03-01T00:00:00Z", "to": "2035-03-20T00:00:00Z"})
+    assert [e["start"][:10] for e in r.json()] == ["2035-03-05", "2035-03-19"]
+    assert client.get(f"/meetups/{occurrence['id']}").status_code == 404
+
+    # Pages interleave stored meetups with occurrences in start order
+    page = client.get("/meetups/", params={"limit": 2})
+    assert [e["start"][:10] for e in page.json()] == ["2030-01-07", "2030-01-08"]
+    page = client.get("/meetups/", params={"limit": 2, "cursor": page.headers["X-Next-Cursor"]})
+    assert [e["start"][:10] for e in page.json()] == ["2030-01-14", "2030-01-21"]
+
+    set_auth_user({"role": "consumer", "id": "c2"})
+    assert client.get(f"/meetups/series/{series['id']}").status_code == 403
+
+
+def test_calendar_feed_streams_ics_and_answers_304_until_meetups_change(client, set_auth_user, fake_collections):
+    fake_collections["providers"].docs.append({"id": "p1"})
+    fake_collections["consumers"].docs.append({"id": "c1"})
+    set_auth_user({"role": "provider", "id": "p1"})
+    url = client.post("/meetups/calendar/token").json()["url"]
+    assert url.endswith(".ics") and url.split("/")[-1][:-4] not in str(fake_collections["calendarFeeds"].docs)
+
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(days=1)
+    r = client.post("/meetups/", json={"targetUserId": "c1", "start": start.isoformat() + "Z",
+                                       "end": (start + timedelta(hours=1)).isoformat() + "Z",
+                                       "title": "Check-up, follow; up", "description": "x" * 200})
+    assert r.status_code == 201
+    client.post("/meetups/series", json={"targetUserId": "c1", "start": (start + timedelta(days=2)).isoformat() + "Z",
+                                         "end": (start + timedelta(days=2, hours=1)).isoformat() + "Z", "freq": "weekly", "count": 4})
+
+    feed = client.get(url)
+    assert feed.status_code == 200 and feed.headers["content-type"].startswith("text/calendar")
+    body = feed.text
+    assert body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n")
+    assert body.count("BEGIN:VEVENT") == 2 and r"SUMMARY:Check-up\, follow\; up" in body
+    assert "RRULE:FREQ=WEEKLY;INTERVAL=1;COUNT=4" in body
+    assert all(len(line.encode()) <= 75 for line in body.split("\r\n"))
+
+    # Nothing changed: 304 without touching events
+    events = fake_collections["events"]
+    fake_collections["events"] = None
+    assert client.get(url, headers={"If-None-Match": feed.headers["ETag"]}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": feed.headers["Last-Modified"]}).status_code == 304
+    fake_collections["events"] = events
+
+    # An edit within the same second as the client's copy still changes the ETag
+    old_etag = client.get(url).headers["ETag"]
+    client.patch(f"/meetups/{r.json()['id']}", json={"status": "cancelled"})
+    fresh = client.get(url, headers={"If-None-Match": old_etag})
+    assert fresh.status_code == 200 and "STATUS:CANCELLED" in fresh.text
+    client.patch(f"/meetups/{r.json()['id']}", json={"description": "moved"})
+    assert client.get(url, headers={"If-None-Match": fresh.headers["ETag"]}).status_code == 200
+
+    assert client.get("/meetups/calendar/wrong.ics").status_code == 404
+
+
+def test_meetup_changes_are_pushed_to_both_participants(app_with_routers, set_auth_user, fake_collections, monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.ws import matchmaking
+    from src.utils.auth import generate_token
+
+    monkeypatch.setattr(matchmaking, "manager", matchmaking.ConnectionManager())
+    matchmaking.setup_websocket_routes(app_with_routers)
+    fake_collections["providers"].docs.append({"id": "p1"})
+    fake_collections["consumers"].docs.append({"id": "c1"})
+    start = datetime(2030, 3, 4, 9, tzinfo=timezone.utc)
+
+    with TestClient(app_with_routers) as c:
+        with c.websocket_connect(f"/ws?token={generate_token({'role': 'consumer', 'id': 'c1'})}") as consumer, \
+                c.websocket_connect(f"/ws?token={generate_token({'role': 'provider', 'id': 'p1'})}") as provider, \
+                c.websocket_connect(f"/ws?token={generate_token({'role': 'provider', 'id': 'p1'})}") as provider_tab:
+            for ws in (consumer, provider, provider_tab):
+                ws.receive_json()
+
+            set_auth_user({"role": "consumer", "id": "c1"})
+            r = c.post("/meetups/", json={"targetUserId": "p1", "start": start.isoformat(), "end": (start + timedelta(hours=1)).isoformat()})
+            for ws in (consumer, provider, provider_tab):
+                message = ws.receive_json()
+                assert message["type"] == "meetup.created" and message["by"] == "c1"
+                assert message["meetup"]["id"] == r.json()["id"] and message["meetup"]["start"] == "2030-03-04T09:00:00+00:00"
+
+            set_auth_user({"role": "provider", "id": "p1"})
+            c.patch(f"/meetups/{r.json()['id']}", json={"start": "2030-03-04T10:00:00Z", "end": "2030-03-04T11:00:00Z"})
+            for ws in (consumer, provider, provider_tab):
+                message = ws.receive_json()
+                assert message["type"] == "meetup.updated" and message["meetupId"] == r.json()["id"] and message["by"] == "p1"
+                assert message["changes"] == {"start": "2030-03-04T10:00:00+00:00", "end": "2030-03-04T11:00:00+00:00"}
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+
+async def _next_event(body, timeout: float = 1.0) -> str:
+    return await asyncio.wait_for(body.__anext__(), timeout)
+
+
+def test_event_stream_routes_resumes_and_keeps_alive(monkeypatch):
+    from src.routes import events
+    from src.ws import matchmaking
+    from src.utils.auth import generate_token
+
+    monkeypatch.setattr(matchmaking, "manager", matchmaking.ConnectionManager())
+    monkeypatch.setattr(events, "SSE_KEEPALIVE_SECONDS", 0.05)
+    token = generate_token({"role": "provider", "id": "p1"})
+
+    async def _run():
+        mgr = matchmaking.manager
+        response = await events.event_stream(token=token, last_event_id=None, last_event_id_header=None, credentials=None)
+        assert response.media_type == "text/event-stream"
+        body = response.body_iterator
+        assert (await _next_event(body)).startswith("retry:")
+        assert "role:provider" in mgr.topics and "user:p1" in mgr.topics
+
+        await mgr.publish("user:p1", json.dumps({"type": "consult_offer", "requestId": "r1"}))
+        await mgr.publish("role:provider", json.dumps({"type": "notice"}))
+        first, second = await _next_event(body), await _next_event(body)
+        seq = json.loads(first.split("data: ", 1)[1])["seq"]
+        assert first.startswith(f"id: {seq}\ndata: ") and first.endswith("\n\n")
+        assert second == 'data: {"type": "notice"}\n\n'
+        assert await _next_event(body) == ": keep-alive\n\n"
+
+        # Stream not in presence or matchmaking, and fully unregistered when closed
+        assert not mgr.is_online("p1")
+        await body.aclose()
+        assert not mgr.active_connections and "user:p1" not in mgr.topics
+
+        # Sent while disconnected; the browser reconnects with Last-Event-ID
+        await mgr.publish("user:p1", json.dumps({"type": "consult_offer", "requestId": "r2"}))
+        response = await events.event_stream(token=token, last_event_id=None, last_event_id_header=str(seq), credentials=None)
+        body = response.body_iterator
+        await _next_event(body)
+        replayed = await _next_event(body)
+        assert json.loads(replayed.split("data: ", 1)[1])["requestId"] == "r2"
+        await body.aclose()
+
+    asyncio.run(_run())
+
+
+def test_event_stream_requires_token():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from src.routes import events
+
+    app = FastAPI()
+    app.include_router(events.router, prefix="/events")
+    with TestClient(app) as c:
+        assert c.get("/events/stream").status_code == 401
+        assert c.get("/events/stream?token=bogus").status_code == 401
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.websockets import WebSocketState
+
+
+class _Socket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        return None
+
+    async def send_text(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+def test_in_process_backplane_relays_topics_and_presence():
+    from src.ws import matchmaking
+    from src.ws.backplane import InProcessBackplane
+
+    async def _run():
+        worker_a, worker_b = matchmaking.ConnectionManager(), matchmaking.ConnectionManager()
+        bus_a = InProcessBackplane(hub="test-relay", tick_seconds=0.005)
+        await worker_a.attach_backplane(bus_a)
+        await worker_b.attach_backplane(InProcessBackplane(hub="test-relay", tick_seconds=0.005))
+
+        on_a, on_b = _Socket(), _Socket()
+        await worker_a.connect(on_a, "a", {"role": "consumer", "id": "c1"})
+        await worker_b.connect(on_b, "b", {"role": "consumer", "id": "c1"})
+        await asyncio.sleep(0.03)
+        assert worker_b.is_online("c1") and not worker_b.is_online("nobody")
+
+        # Several publishes within one tick travel as a single batch
+        batches_before = bus_a.batches_sent
+        for i in range(5):
+            await worker_a.publish("user:c1", json.dumps({"type": "note", "i": i}))
+        await asyncio.sleep(0.03)
+        assert [m["i"] for m in on_b.sent if m["type"] == "note"] == list(range(5))
+        assert [m["i"] for m in on_a.sent if m["type"] == "note"] == list(range(5))
+        assert bus_a.batches_sent == batches_before + 1
+
+        worker_a.disconnect("a")
+        await asyncio.sleep(0.03)
+        assert "c1" not in worker_b.presence.remote[bus_a.worker_id]
+
+        await worker_a.detach_backplane()
+        await worker_b.detach_backplane()
+        worker_b.disconnect("b")
+
+    asyncio.run(_run())
+
+
+def test_presence_aggregates_across_workers_and_expires(monkeypatch):
+    from src.ws import matchmaking, presence
+    from src.ws.backplane import InProcessBackplane
+
+    monkeypatch.setattr(matchmaking, "PRESENCE_HEARTBEAT_SECONDS", 0.02)
+    monkeypatch.setattr(presence, "PRESENCE_TTL_SECONDS", 0.08)
+
+    async def _run():
+        worker_a, worker_b = matchmaking.ConnectionManager(), matchmaking.ConnectionManager()
+        bus_a = InProcessBackplane(hub="test-presence", tick_seconds=0.005)
+        await worker_a.attach_backplane(bus_a)
+        await worker_b.attach_backplane(InProcessBackplane(hub="test-presence", tick_seconds=0.005))
+
+        watcher = _Socket()
+        await worker_b.connect(watcher, "w", {"role": "consumer", "id": "c1"})
+        worker_b.subscribe("w", presence.PRESENCE_EVENTS_TOPIC)
+        await worker_a.connect(_Socket(), "p", {"role": "provider", "id": "p1", "specialization": "Cardiology"})
+        await asyncio.sleep(0.03)
+
+        assert worker_b.presence.providers("cardiology") == [{"userId": "p1", "role": "provider", "specialization": "Cardiology"}]
+        assert worker_b.presence.providers("neurology") == []
+        events = [m for m in watcher.sent if m["type"] == "presence"]
+        assert events == [{"type": "presence", "userId": "p1", "role": "provider", "specialization": "Cardiology", "online": True}]
+
+        # Worker A dies without saying goodbye: its heartbeats stop and B expires its users
+        await bus_a.stop()
+        worker_a._presence_heartbeat.cancel()
+        assert worker_b.is_online("p1")
+        await asyncio.sleep(0.15)
+        assert worker_b.presence.providers() == [] and not worker_b.is_online("p1")
+        assert [m["online"] for m in watcher.sent if m["type"] == "presence"] == [True, False]
+
+        await worker_b.detach_backplane()
+        worker_b.disconnect("w")
+
+    asyncio.run(_run())
+
+
+def test_consult_requests_reach_providers_on_other_workers():
+    from src.ws import matchmaking
+    from src.ws.backplane import InProcessBackplane
+
+    async def _run():
+        worker_a, worker_b = matchmaking.ConnectionManager(), matchmaking.ConnectionManager()
+        await worker_a.attach_backplane(InProcessBackplane(hub="test-match", tick_seconds=0.005))
+        await worker_b.attach_backplane(InProcessBackplane(hub="test-match", tick_seconds=0.005))
+        consumer, provider = _Socket(), _Socket()
+        await worker_a.connect(consumer, "c", {"role": "consumer", "id": "c1"})
+        await worker_b.connect(provider, "p", {"role": "provider", "id": "p1", "specialization": "Cardiology"})
+        await asyncio.sleep(0.03)
+
+        # Submitted on A, offered to the provider connected to B
+        first = await worker_a.engine.submit("c1", "c", "consumer", "chest pain", "cardiology")
+        assert first["status"] == "offered" and not first["fallback"]
+        await asyncio.sleep(0.03)
+        assert [m["requestId"] for m in provider.sent if m["type"] == "consult_offer"] == [first["requestId"]]
+        # B knows p1 is busy, so a request submitted there waits
+        second = await worker_b.engine.submit("c1", "c", "consumer", "again", "cardiology")
+        assert second["status"] == "queued"
+
+        # The accept and the end reach A, which holds the request
+        assert await worker_b.engine.accept("p1", first["requestId"])
+        await asyncio.sleep(0.03)
+        assert [m["providerId"] for m in consumer.sent if m["type"] == "consult_matched"] == ["p1"]
+        assert await worker_b.engine.end(first["requestId"], "p1")
+        await asyncio.sleep(0.03)
+        assert first["requestId"] not in worker_a.engine.matches
+
+        # p1 is free again everywhere: B's queued request is offered to it
+        offers = [m["requestId"] for m in provider.sent if m["type"] == "consult_offer"]
+        assert offers == [first["requestId"], second["requestId"]]
+        assert worker_a.engine.providers["p1"].load == worker_b.engine.providers["p1"].load == 1
+
+        worker_b.disconnect("p")
+        await asyncio.sleep(0.03)
+        assert "p1" not in worker_a.engine.providers
+        await worker_a.detach_backplane()
+        await worker_b.detach_backplane()
+        worker_a.disconnect("c")
+
+    asyncio.run(_run())
+
+
+def test_claim_through_another_worker_takes_the_request_off_the_owners_queue(monkeypatch):
+    from src.ws import engine as engine_mod, matchmaking
+    from src.ws.backplane import InProcessBackplane
+
+    monkeypatch.setattr(engine_mod, "REQUEST_TTL_SECONDS", 0.1)
+
+    async def _run():
+        worker_a, worker_b = matchmaking.ConnectionManager(), matchmaking.ConnectionManager()
+        await worker_a.attach_backplane(InProcessBackplane(hub="test-claim", tick_seconds=0.005))
+        await worker_b.attach_backplane(InProcessBackplane(hub="test-claim", tick_seconds=0.005))
+        consumer, offered = _Socket(), _Socket()
+        await worker_a.connect(consumer, "c", {"role": "consumer", "id": "c1"})
+        await worker_a.connect(offered, "p1", {"role": "provider", "id": "p1"})
+        request_id = (await worker_a.engine.submit("c1", "c", "consumer", "cough"))["requestId"]
+
+        # POST /consults/{id}/claim by p2 lands on worker B
+        await worker_b.engine.claimed(request_id, "p2", {"requesterId": "c1"})
+        await asyncio.sleep(0.2)
+
+        assert request_id not in worker_a.engine.requests and worker_a.engine.matches[request_id].provider_id == "p2"
+        assert [m["type"] for m in offered.sent if m.get("requestId") == request_id] == ["consult_offer", "consult_offer_cancelled"]
+        assert worker_a.engine.providers["p1"].load == 0
+        # Matched once, and never told it went unmatched when the TTL ran out
+        types = [m["type"] for m in consumer.sent if m.get("requestId") == request_id]
+        assert types == ["consult_matched"]
+
+        await worker_a.detach_backplane()
+        await worker_b.detach_backplane()
+        worker_a.disconnect("c")
+        worker_a.disconnect("p1")
+
+    asyncio.run(_run())
+
+
+def _mongo_url() -> str:
+    return os.getenv("MONGO_URL", "mongodb://127.0.0.1:8801")
+
+
+def _mongo_available() -> bool:
+    try:
+        from pymongo import MongoClient
+        MongoClient(_mongo_url(), serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"worker on port {port} did not start")
+
+
+@pytest.mark.skipif(not _mongo_available(), reason="MongoDB not available")
+def test_room_message_crosses_worker_processes_over_mongo():
+    import websockets
+    from src.utils.auth import generate_token
+
+    backend_dir = Path(__file__).resolve().parents[1] / "backend_python"
+    env = dict(os.environ, WS_BACKPLANE="mongo", MONGO_URL=_mongo_url(), JWT_SECRET=os.getenv("JWT_SECRET", "dev_jwt_secret"))
+    ports = [_free_port(), _free_port()]
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=str(backend_dir), env=env,
+        )
+        for port in ports
+    ]
+    try:
+        for port in ports:
+            _wait_for_port(port)
+        token = generate_token({"role": "admin", "id": "admin-bus", "username": "admin"})
+
+        async def _run():
+            async with websockets.connect(f"ws://127.0.0.1:{ports[0]}/ws?token={token}") as a, \
+                    websockets.connect(f"ws://127.0.0.1:{ports[1]}/ws?token={token}") as b:
+                for ws in (a, b):
+                    json.loads(await ws.recv())  # welcome
+                    await ws.send(json.dumps({"type": "subscribe", "room": "bus-test"}))
+                    assert json.loads(await ws.recv())["type"] == "subscribed"
+                await a.send(json.dumps({"type": "room_message", "room": "bus-test", "data": "hello"}))
+                msg = json.loads(await asyncio.wait_for(b.recv(), timeout=5))
+                assert msg == {"type": "room_message", "room": "bus-test", "from": "admin-bus", "data": "hello"}
+
+        asyncio.run(_run())
+    finally:
+        for proc in workers:
+            proc.terminate()
+            proc.wait(timeout=10)
@@ -0,0 +1,181 @@
+import asyncio
+import json
+
+from fastapi.websockets import WebSocketState
+
+
+class _Socket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        return None
+
+    async def send_text(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+    def of_type(self, message_type):
+        return [m for m in self.sent if m["type"] == message_type]
+
+
+async def _connect(mgr, connection_id, user=None):
+    sock = _Socket()
+    await mgr.connect(sock, connection_id, user)
+    return sock
+
+
+async def _settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_offer_goes_to_least_loaded_then_higher_rank_and_falls_through_on_decline():
+    from src.ws import matchmaking
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        engine = mgr.engine
+        low = await _connect(mgr, "low", {"role": "provider", "id": "p-low", "specialization": "cardiology", "rank": 10})
+        high = await _connect(mgr, "high", {"role": "provider", "id": "p-high", "specialization": "Cardiology", "rank": 90})
+        consumer = await _connect(mgr, "c", {"role": "consumer", "id": "c1"})
+
+        first = await engine.submit("c1", "c", "consumer", "chest pain", "cardiology")
+        await _settle()
+        assert first["status"] == "offered"
+        assert high.of_type("consult_offer")[0]["requestId"] == first["requestId"]
+
+        # p-high is busy with an offer, so the next request goes to p-low
+        second = await engine.submit("c1", "c", "consumer", "palpitations", "cardiology")
+        await _settle()
+        assert low.of_type("consult_offer")[0]["requestId"] == second["requestId"]
+
+        # Declining falls through to the next free candidate once one frees up
+        assert await engine.decline("p-high", first["requestId"])
+        await _settle()
+        assert await engine.accept("p-low", second["requestId"])
+        await _settle()
+        matched = consumer.of_type("consult_matched")
+        assert matched and matched[0]["providerId"] == "p-low"
+        assert "consult:" + second["requestId"] in mgr.room_grants
+
+        # The first request exhausted every cardiologist: p-high declined, p-low is now busy
+        stats = engine.stats()
+        assert stats["counters"]["declined"] == 1 and stats["counters"]["matched"] == 1
+        assert stats["matchLatencyMs"]["p50"] is not None
+
+    asyncio.run(_run())
+
+
+def test_offer_timeout_moves_to_next_provider(monkeypatch):
+    from src.ws import engine as engine_mod, matchmaking
+
+    monkeypatch.setattr(engine_mod, "OFFER_TIMEOUT_SECONDS", 0.02)
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        a = await _connect(mgr, "a", {"role": "provider", "id": "pa", "rank": 90})
+        b = await _connect(mgr, "b", {"role": "provider", "id": "pb", "rank": 10})
+        await _connect(mgr, "g")
+
+        result = await mgr.engine.submit(None, "g", "guest", "rash")
+        await asyncio.sleep(0.1)
+        assert a.of_type("consult_offer") and a.of_type("consult_offer_expired")
+        assert b.of_type("consult_offer")[0]["requestId"] == result["requestId"]
+        assert mgr.engine.stats()["counters"]["timeouts"] >= 1
+
+    asyncio.run(_run())
+
+
+def test_queued_requests_are_served_in_order_when_provider_frees_up():
+    from src.ws import matchmaking
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        engine = mgr.engine
+        await _connect(mgr, "c", {"role": "consumer", "id": "c1"})
+        first = await engine.submit("c1", "c", "consumer", "one")
+        second = await engine.submit("c1", "c", "consumer", "two")
+        assert first["status"] == second["status"] == "queued"
+
+        provider = await _connect(mgr, "p", {"role": "provider", "id": "p1"})
+        await _settle()
+        assert [m["requestId"] for m in provider.of_type("consult_offer")] == [first["requestId"]]
+
+        await engine.accept("p1", first["requestId"])
+        await engine.end(first["requestId"], "c1")
+        await _settle()
+        assert [m["requestId"] for m in provider.of_type("consult_offer")] == [first["requestId"], second["requestId"]]
+        assert engine.stats()["queueWaitMs"]["max"] is not None
+
+    asyncio.run(_run())
+
+
+def test_freed_provider_skips_queued_requests_it_already_declined():
+    from src.ws import matchmaking
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        engine = mgr.engine
+        p1 = await _connect(mgr, "p1", {"role": "provider", "id": "p1", "rank": 90})
+        await _connect(mgr, "p2", {"role": "provider", "id": "p2", "rank": 10})
+        await _connect(mgr, "c", {"role": "consumer", "id": "c1"})
+        a = await engine.submit("c1", "c", "consumer", "a")
+        await engine.submit("c1", "c", "consumer", "b")
+        c = await engine.submit("c1", "c", "consumer", "c")
+        assert c["status"] == "queued"
+
+        # p1 declines a, takes c, then d queues behind a (which p1 declined)
+        await engine.decline("p1", a["requestId"])
+        d = await engine.submit("c1", "c", "consumer", "d")
+        assert d["status"] == "queued"
+        await engine.decline("p1", c["requestId"])
+        await _settle()
+
+        # The freed p1 passes over a and gets d instead of idling
+        offers = [m["requestId"] for m in p1.of_type("consult_offer")]
+        assert offers == [a["requestId"], c["requestId"], d["requestId"]]
+        assert engine.providers["p1"].load == 1
+
+    asyncio.run(_run())
+
+
+def test_requester_disconnect_withdraws_offer():
+    from src.ws import matchmaking
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        provider = await _connect(mgr, "p", {"role": "provider", "id": "p1"})
+        await _connect(mgr, "g")
+        result = await mgr.engine.submit(None, "g", "guest", "x")
+        mgr.disconnect("g")
+        await _settle()
+        assert provider.of_type("consult_offer_cancelled")[0]["requestId"] == result["requestId"]
+        assert mgr.engine.stats()["pendingOffers"] == 0
+
+    asyncio.run(_run())
+
+
+def test_thousands_of_requests_assign_quickly():
+    import time
+    from src.ws import matchmaking
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        engine = mgr.engine
+        for i in range(2000):
+            await engine.provider_online(f"p{i}", f"s{i % 20}", i % 100)
+        started = time.perf_counter()
+        results = [await engine.submit(f"c{i}", f"conn{i}", "consumer", "", f"s{i % 20}") for i in range(5000)]
+        elapsed = time.perf_counter() - started
+        assert sum(r["status"] == "offered" for r in results) == 2000
+        assert engine.stats()["waitingRequests"] == 3000
+        assert elapsed < 5
+        for timer in [r.expiry_timer for r in engine.requests.values()] + [r.offer_timer for r in engine.requests.values()]:
+            if timer:
+                timer.cancel()
+
+    asyncio.run(_run())
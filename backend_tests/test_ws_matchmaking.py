@@ -0,0 +1,456 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.websockets import WebSocketState
+
+
+class _FakeSocket:
+    """Minimal stand-in for a Starlette WebSocket; `stall` blocks every send."""
+
+    def __init__(self, stall: bool = False, fail: bool = False):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+        self.closed_code = None
+        self._stall = stall
+        self._fail = fail
+
+    async def accept(self, subprotocol=None):
+        return None
+
+    async def send_text(self, data: str):
+        if self._stall:
+            await asyncio.Event().wait()
+        if self._fail:
+            raise RuntimeError("connection reset")
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.closed_code = code
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+@pytest.fixture()
+def ws_app(monkeypatch):
+    from fastapi import FastAPI
+    from src.ws import matchmaking
+
+    monkeypatch.setattr(matchmaking, "manager", matchmaking.ConnectionManager())
+    app = FastAPI()
+    matchmaking.setup_websocket_routes(app)
+    return app
+
+
+def test_ws_welcome_ping_and_consult_request(ws_app):
+    from fastapi.testclient import TestClient
+    from src.utils.auth import generate_token
+
+    provider = generate_token({"role": "provider", "id": "p1"})
+    admin = generate_token({"role": "admin", "username": "admin"})
+
+    with TestClient(ws_app) as c:
+        with c.websocket_connect("/ws") as a, c.websocket_connect(f"/ws?token={provider}") as b:
+            assert a.receive_json()["type"] == "welcome"
+            assert b.receive_json()["role"] == "provider"
+
+            a.send_json({"type": "ping"})
+            assert a.receive_json()["type"] == "pong"
+
+            a.send_json({"type": "consult_request", "symptom": "cough"})
+            msg = b.receive_json()
+            assert msg["type"] == "consult_offer" and msg["symptom"] == "cough"
+            assert a.receive_json()["status"] == "offered"
+
+        assert c.get("/ws/stats", headers={"Authorization": f"Bearer {provider}"}).status_code == 403
+        stats = c.get("/ws/stats", headers={"Authorization": f"Bearer {admin}"}).json()
+        assert stats["droppedMessages"] == 0 and stats["slowConsumerPolicy"] == "drop_oldest"
+
+
+def test_broadcast_does_not_wait_for_stalled_consumer(monkeypatch):
+    from src.ws import matchmaking
+
+    monkeypatch.setattr(matchmaking, "SEND_QUEUE_SIZE", 4)
+    monkeypatch.setattr(matchmaking, "SLOW_CONSUMER_POLICY", "drop_oldest")
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        slow, fast = _FakeSocket(stall=True), _FakeSocket()
+        await mgr.connect(slow, "slow")
+        await mgr.connect(fast, "fast")
+
+        for i in range(10):
+            await asyncio.wait_for(mgr.broadcast(json.dumps({"type": "n", "i": i})), timeout=0.5)
+        await asyncio.sleep(0.05)
+
+        assert [m["i"] for m in fast.sent if m["type"] == "n"] == list(range(10))
+        stats = mgr.stats()
+        assert stats["droppedMessages"] > 0
+        assert stats["maxQueueDepth"] <= 4
+        mgr.disconnect("slow")
+        mgr.disconnect("fast")
+
+    asyncio.run(_run())
+
+
+def test_disconnect_policy_evicts_slow_consumer(monkeypatch):
+    from src.ws import matchmaking
+
+    monkeypatch.setattr(matchmaking, "SEND_QUEUE_SIZE", 2)
+    monkeypatch.setattr(matchmaking, "SLOW_CONSUMER_POLICY", "disconnect")
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        slow = _FakeSocket(stall=True)
+        await mgr.connect(slow, "slow")
+        for i in range(5):
+            await mgr.broadcast(json.dumps({"type": "n", "i": i}))
+        await asyncio.sleep(0.01)
+
+        assert "slow" not in mgr.active_connections
+        assert slow.closed_code == 1008
+        assert mgr.stats()["slowConsumerDisconnects"] == 1
+
+    asyncio.run(_run())
+
+
+def test_failed_send_removes_connection():
+    from src.ws import matchmaking
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        broken = _FakeSocket(fail=True)
+        await mgr.connect(broken, "broken")
+        mgr.subscribe("broken", "room:r1")
+        await asyncio.sleep(0.01)
+
+        assert "broken" not in mgr.active_connections
+        assert "room:r1" not in mgr.topics
+        assert broken.closed_code == 1011
+        assert mgr.stats()["droppedMessages"] == 0
+
+    asyncio.run(_run())
+
+
+def test_consult_request_reaches_only_matching_providers(ws_app, monkeypatch, fake_collections):
+    from fastapi.testclient import TestClient
+    from src.ws import matchmaking
+    from src.utils.auth import generate_token
+
+    fake_collections["providers"].docs.extend([
+        {"id": "p-card", "specialization": "Cardiology", "rank": 50},
+        {"id": "p-derm", "specialization": "Dermatology", "rank": 90},
+    ])
+    monkeypatch.setattr(matchmaking, "get_collections", lambda: fake_collections)
+
+    card = generate_token({"role": "provider", "id": "p-card"})
+    derm = generate_token({"role": "provider", "id": "p-derm"})
+    consumer = generate_token({"role": "consumer", "id": "c1"})
+
+    with TestClient(ws_app) as c:
+        with c.websocket_connect(f"/ws?token={card}") as p1, \
+                c.websocket_connect(f"/ws?token={derm}") as p2, \
+                c.websocket_connect(f"/ws?token={consumer}") as cons, \
+                c.websocket_connect("/ws") as guest:
+            for ws in (p1, p2, cons, guest):
+                assert ws.receive_json()["type"] == "welcome"
+
+            cons.send_json({"type": "consult_request", "symptom": "chest pain", "specialization": " cardiology "})
+            ack = cons.receive_json()
+            assert ack["type"] == "consult_request_ack" and ack["status"] == "offered" and ack["fallback"] is False
+            msg = p1.receive_json()
+            assert msg["type"] == "consult_offer" and msg["from"] == "c1" and msg["requestId"] == ack["requestId"]
+
+            # Nobody else saw the request: their next message is the reply to their own ping
+            for ws in (p2, guest):
+                ws.send_json({"type": "ping"})
+                assert ws.receive_json()["type"] == "pong"
+
+
+def test_specialization_change_and_fallback(ws_app, monkeypatch, fake_collections):
+    from fastapi.testclient import TestClient
+    from src.ws import matchmaking
+    from src.utils.auth import generate_token
+
+    fake_collections["providers"].docs.append({"id": "p1", "specialization": "Cardiology"})
+    monkeypatch.setattr(matchmaking, "get_collections", lambda: fake_collections)
+    provider = generate_token({"role": "provider", "id": "p1"})
+
+    with TestClient(ws_app) as c:
+        with c.websocket_connect(f"/ws?token={provider}") as p, c.websocket_connect("/ws") as guest:
+            p.receive_json()
+            guest.receive_json()
+
+            # What PUT /profile does after saving a new specialization
+            c.portal.call(matchmaking.manager.update_profile, "p1", {"specialization": "Neurology"})
+            assert "specialization:cardiology" not in matchmaking.manager.topics
+            assert "specialization:neurology" in matchmaking.manager.topics
+
+            # Nobody online for dermatology: falls back to every provider
+            guest.send_json({"type": "consult_request", "specialization": "dermatology"})
+            ack = guest.receive_json()
+            assert ack["fallback"] is True and ack["status"] == "offered"
+            assert p.receive_json()["specialization"] == "dermatology"
+
+
+def test_rooms_require_grant_and_membership(ws_app):
+    from fastapi.testclient import TestClient
+    from src.ws import matchmaking
+    from src.utils.auth import generate_token
+
+    a_tok = generate_token({"role": "consumer", "id": "c1"})
+    b_tok = generate_token({"role": "provider", "id": "p1"})
+    other_tok = generate_token({"role": "consumer", "id": "c2"})
+    matchmaking.manager.grant_room("r1", {"c1", "p1"})
+
+    with TestClient(ws_app) as c:
+        with c.websocket_connect(f"/ws?token={a_tok}") as a, \
+                c.websocket_connect(f"/ws?token={b_tok}") as b, \
+                c.websocket_connect(f"/ws?token={other_tok}") as other, \
+                c.websocket_connect("/ws") as guest:
+            for ws in (a, b, other, guest):
+                ws.receive_json()
+
+            guest.send_json({"type": "subscribe", "room": "r1"})
+            assert guest.receive_json()["type"] == "error"
+
+            other.send_json({"type": "subscribe", "room": "r1"})
+            assert other.receive_json()["error"] == "Not allowed to join room"
+
+            a.send_json({"type": "room_message", "room": "r1", "data": "hi"})
+            assert a.receive_json()["error"] == "Not subscribed to room"
+
+            for ws in (a, b):
+                ws.send_json({"type": "subscribe", "room": "r1"})
+                assert ws.receive_json() == {"type": "subscribed", "room": "r1"}
+
+            a.send_json({"type": "room_message", "room": "r1", "data": "hi"})
+            assert b.receive_json() == {"type": "room_message", "room": "r1", "from": "c1", "data": "hi"}
+
+
+def test_server_pings_then_reaps_silent_sockets(monkeypatch):
+    from src.ws import matchmaking
+
+    monkeypatch.setattr(matchmaking, "PING_INTERVAL_SECONDS", 0.02)
+    monkeypatch.setattr(matchmaking, "IDLE_TIMEOUT_SECONDS", 0.06)
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        alive, dead, quiet = _FakeSocket(), _FakeSocket(), _FakeSocket()
+        await mgr.connect(alive, "alive")
+        await mgr.connect(dead, "dead")
+        await mgr.connect(quiet, "quiet")
+        # "dead" answered a JSON ping once; "quiet" (like the dashboard) never does
+        assert mgr.allow("dead", "pong")
+
+        await asyncio.sleep(0.03)
+        await mgr.sweep()
+        await mgr.sweep()
+        await asyncio.sleep(0)
+        assert [m["type"] for m in dead.sent].count("ping") == 1
+
+        # Only "alive" answers the ping
+        assert mgr.allow("alive", "pong")
+        await asyncio.sleep(0.04)
+        await mgr.sweep()
+        await asyncio.sleep(0)
+
+        assert "alive" in mgr.active_connections
+        assert "dead" not in mgr.active_connections and dead.closed_code == 1001
+        # Never opted in to JSON heartbeats: left to protocol-level pings
+        assert "quiet" in mgr.active_connections
+        assert mgr.stats()["reapedConnections"] == 1
+        mgr.disconnect("alive")
+        mgr.disconnect("quiet")
+
+    asyncio.run(_run())
+
+
+def test_guest_consult_requests_are_rate_limited(ws_app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(ws_app) as c:
+        with c.websocket_connect("/ws") as guest:
+            guest.receive_json()
+            for _ in range(5):
+                guest.send_json({"type": "consult_request", "symptom": "spam"})
+            replies = [guest.receive_json() for _ in range(3)]
+            assert [r["type"] for r in replies] == ["consult_request_ack", "consult_request_ack", "error"]
+            assert replies[2]["error"] == "rate_limited"
+
+            from src.ws import matchmaking
+            stats = matchmaking.manager.stats()
+            assert stats["throttledMessages"] >= 1
+            assert stats["matchmaking"]["counters"]["submitted"] == 2
+
+
+def test_msgpack_subprotocol_round_trip(ws_app):
+    msgpack = pytest.importorskip("msgpack")
+    from fastapi.testclient import TestClient
+    from src.ws.framing import MSGPACK_SUBPROTOCOL
+
+    with TestClient(ws_app) as c:
+        with c.websocket_connect("/ws", subprotocols=["v0.unknown", MSGPACK_SUBPROTOCOL]) as ws, \
+                c.websocket_connect("/ws") as plain:
+            assert ws.accepted_subprotocol == MSGPACK_SUBPROTOCOL
+            assert msgpack.unpackb(ws.receive_bytes())["type"] == "welcome"
+            assert plain.receive_json()["type"] == "welcome"
+
+            ws.send_bytes(msgpack.packb({"type": "ping"}))
+            assert msgpack.unpackb(ws.receive_bytes())["type"] == "pong"
+            ws.send_bytes(b"\xc1")  # never valid msgpack
+            assert msgpack.unpackb(ws.receive_bytes())["error"] == "Invalid msgpack format"
+
+
+def test_broadcast_encodes_each_frame_once_and_batches(monkeypatch):
+    from src.ws import matchmaking, framing
+
+    monkeypatch.setattr(matchmaking, "BATCH_WINDOW_SECONDS", 0.01)
+    dumps = []
+    real_dumps = framing.json.dumps
+    monkeypatch.setattr(framing.json, "dumps", lambda obj, *a, **kw: dumps.append(obj) or real_dumps(obj, *a, **kw))
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        sockets = [_FakeSocket() for _ in range(50)]
+        for i, ws in enumerate(sockets):
+            await mgr.connect(ws, f"c{i}")
+        await asyncio.sleep(0.02)
+        for ws in sockets:
+            ws.sent.clear()
+
+        dumps.clear()
+        for i in range(3):
+            await mgr.broadcast(framing.Frame(data={"type": "n", "i": i}))
+        await asyncio.sleep(0.03)
+
+        assert len(dumps) == 3  # one encoding per message, not per recipient
+        for ws in sockets:
+            assert ws.sent == [{"type": "batch", "messages": [{"type": "n", "i": i} for i in range(3)]}]
+        for i in range(50):
+            mgr.disconnect(f"c{i}")
+
+    asyncio.run(_run())
+
+
+def test_presence_endpoint_and_events(ws_app):
+    from fastapi.testclient import TestClient
+    from src.routes import presence
+    from src.utils.auth import generate_token
+
+    ws_app.include_router(presence.router, prefix="/presence")
+    consumer = generate_token({"role": "consumer", "id": "c1"})
+    provider = generate_token({"role": "provider", "id": "p1"})
+    auth = {"Authorization": f"Bearer {consumer}"}
+
+    with TestClient(ws_app) as c:
+        assert c.get("/presence/providers").status_code in (401, 403)
+        with c.websocket_connect(f"/ws?token={consumer}") as watcher, c.websocket_connect("/ws") as guest:
+            watcher.receive_json()
+            guest.receive_json()
+            guest.send_json({"type": "presence_subscribe"})
+            assert guest.receive_json()["type"] == "error"
+            watcher.send_json({"type": "presence_subscribe"})
+            assert watcher.receive_json() == {"type": "presence_snapshot", "providers": []}
+
+            with c.websocket_connect(f"/ws?token={provider}") as p:
+                p.receive_json()
+                assert watcher.receive_json() == {"type": "presence", "userId": "p1", "role": "provider", "online": True}
+                assert c.get("/presence/providers", headers=auth).json() == [{"userId": "p1", "role": "provider"}]
+            assert watcher.receive_json()["online"] is False
+            assert c.get("/presence/providers", headers=auth).json() == []
+
+
+def test_reconnect_with_since_replays_missed_messages(monkeypatch):
+    from src.ws import matchmaking
+    from src.ws.replay import ReplayBuffer
+
+    async def _run():
+        mgr = matchmaking.ConnectionManager()
+        mgr.replay = ReplayBuffer(size=3)
+        user = {"role": "consumer", "id": "c1"}
+
+        first = _FakeSocket()
+        await mgr.connect(first, "a", user)
+        await mgr.publish("user:c1", json.dumps({"type": "note", "i": 0}))
+        await asyncio.sleep(0.01)
+        seen = first.sent[-1]["seq"]
+        assert first.sent[0]["type"] == "welcome"
+        mgr.disconnect("a")
+
+        # Sent while the socket was down
+        for i in (1, 2):
+            await mgr.publish("user:c1", json.dumps({"type": "note", "i": i}))
+
+        second = _FakeSocket()
+        await mgr.connect(second, "b", user, since=seen)
+        await asyncio.sleep(0.01)
+        welcome, *replayed = second.sent
+        assert [m["i"] for m in replayed] == [1, 2]
+        assert welcome["seq"] == replayed[-1]["seq"] and replayed[0]["seq"] > seen
+        mgr.disconnect("b")
+
+        # More than the ring holds: the client is told to refetch, then gets what is left
+        for i in range(3, 8):
+            await mgr.publish("user:c1", json.dumps({"type": "note", "i": i}))
+        third = _FakeSocket()
+        await mgr.connect(third, "c", user, since=seen)
+        await asyncio.sleep(0.01)
+        assert third.sent[1]["type"] == "replay_gap"
+        assert [m["i"] for m in third.sent[2:]] == [5, 6, 7]
+        mgr.disconnect("c")
+
+    asyncio.run(_run())
+
+
+def test_webrtc_signaling_relays_between_meetup_participants(ws_app, monkeypatch, fake_collections):
+    from fastapi.testclient import TestClient
+    from src.ws import matchmaking, signaling
+    from src.utils.auth import generate_token
+
+    lookups = []
+    events = fake_collections["events"]
+    find_one = events.find_one
+
+    async def _counting_find_one(query, projection=None):
+        lookups.append(query["id"])
+        return await find_one(query, projection)
+
+    monkeypatch.setattr(events, "find_one", _counting_find_one)
+    monkeypatch.setattr(signaling, "get_collections", lambda: fake_collections)
+    events.docs.append({"id": "m1", "requesterId": "c1", "participantId": "p1", "status": "scheduled"})
+    c_tok = generate_token({"role": "consumer", "id": "c1"})
+    p_tok = generate_token({"role": "provider", "id": "p1"})
+    other_tok = generate_token({"role": "consumer", "id": "c2"})
+
+    with TestClient(ws_app) as c:
+        with c.websocket_connect(f"/ws?token={c_tok}") as caller, \
+                c.websocket_connect(f"/ws?token={p_tok}") as callee, \
+                c.websocket_connect(f"/ws?token={other_tok}") as other:
+            for ws in (caller, callee, other):
+                ws.receive_json()
+
+            sdp = {"type": "offer", "sdp": "v=0\r\no=- 1 2 IN IP4 127.0.0.1\r\n"}
+            caller.send_json({"type": "webrtc.offer", "meetupId": "m1", "sdp": sdp})
+            offer = callee.receive_json()
+            assert offer["type"] == "webrtc.offer" and offer["from"] == "c1" and offer["sdp"] == sdp
+
+            callee.send_json({"type": "webrtc.answer", "meetupId": "m1", "sdp": {"type": "answer", "sdp": "v=0"}})
+            assert caller.receive_json()["from"] == "p1"
+
+            for i in range(20):
+                caller.send_json({"type": "webrtc.ice", "meetupId": "m1", "candidate": {"candidate": f"c{i}", "sdpMid": "0"}})
+            candidates = [callee.receive_json() for _ in range(20)]
+            assert [m["candidate"]["candidate"] for m in candidates] == [f"c{i}" for i in range(20)]
+            assert lookups == ["m1"]  # one authorization for the whole exchange
+            # Live only: no seq, and nothing kept for reconnect replay
+            assert all("seq" not in m for m in candidates) and "seq" not in offer
+            assert matchmaking.manager.replay.since("p1", 0)[0] == []
+
+            other.send_json({"type": "webrtc.offer", "meetupId": "m1", "sdp": sdp})
+            assert other.receive_json()["error"] == "Not a participant of this meetup"
+
+            # Cancelling the meetup takes effect without waiting for the cache TTL
+            events.docs[0]["status"] = "cancelled"
+            matchmaking.manager.signaling.forget("m1")
+            caller.send_json({"type": "webrtc.ice", "meetupId": "m1", "candidate": {}})
+            assert caller.receive_json()["error"] == "Not a participant of this meetup"
@@ -4,6 +4,7 @@ import { useNavigate } from 'react-router-dom';
 import { RefreshCw as RefreshIcon, Plus, TestTube, FolderOpen, BarChart3, Play } from 'lucide-react';
 import PageHeader from './PageHeader.jsx';
 import axios from 'axios';
+import { getAllPages } from '../utils/paging.js';
 
 export default function DashboardAutomation({ token, mode, onToggleMode, role }) {
   const [projects, setProjects] = useState([]);
@@ -18,9 +19,9 @@ export default function DashboardAutomation({ token, mode, onToggleMode, role })
 
   const loadProjects = async () => {
     try {
-      const res = await axios.get(import.meta.env.VITE_API_URL + '/automation/projects');
-      setProjects(res.data);
-      setAnalytics(prev => ({ ...prev, totalProjects: res.data.length }));
+      const list = await getAllPages(import.meta.env.VITE_API_URL + '/automation/projects', { limit: 200 });
+      setProjects(list);
+      setAnalytics(prev => ({ ...prev, totalProjects: list.length }));
     } catch (error) {
       console.error('Error loading projects:', error);
     }
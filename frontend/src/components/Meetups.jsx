@@ -6,6 +6,7 @@ import { Plus as AddIcon, Video as VideoIcon } from 'lucide-react';
 import axios from 'axios';
 import dayjs from 'dayjs';
 import PageHeader from './PageHeader.jsx';
+import { getAllPages } from '../utils/paging.js';
 
 // Simple month grid calendar (no external heavy calendar lib)
 function buildMonth(year, month){
@@ -40,8 +41,7 @@ export default function Meetups({ auth }){
   const load = async ()=>{
     setLoading(true);
     try {
-      const res = await axios.get(import.meta.env.VITE_API_URL + '/meetups');
-      setEvents(res.data);
+      setEvents(await getAllPages(import.meta.env.VITE_API_URL + '/meetups', { limit: 500 }));
     } finally { setLoading(false);} }
 
   useEffect(()=>{ load(); },[]);
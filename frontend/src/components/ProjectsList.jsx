@@ -7,6 +7,7 @@ import { useNavigate } from 'react-router-dom';
 import { ArrowLeft, Plus, FolderOpen, Calendar, TestTube } from 'lucide-react';
 import PageHeader from './PageHeader.jsx';
 import axios from 'axios';
+import { getAllPages } from '../utils/paging.js';
 
 export default function ProjectsList({ token, mode, onToggleMode }) {
   const navigate = useNavigate();
@@ -22,8 +23,8 @@ export default function ProjectsList({ token, mode, onToggleMode }) {
 
   const loadProjects = async () => {
     try {
-      const res = await axios.get(`${import.meta.env.VITE_API_URL}/automation/projects`);
-      setProjects(res.data);
+      const list = await getAllPages(`${import.meta.env.VITE_API_URL}/automation/projects`, { limit: 200 });
+      setProjects(list);
     } catch (error) {
       console.error('Error loading projects:', error);
     }
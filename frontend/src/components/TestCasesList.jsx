@@ -8,6 +8,7 @@ import { useNavigate } from 'react-router-dom';
 import { ArrowLeft, Plus, Play, Edit, Trash2, Search, Filter } from 'lucide-react';
 import PageHeader from './PageHeader.jsx';
 import axios from 'axios';
+import { getAllPages } from '../utils/paging.js';
 
 export default function TestCasesList({ token, mode, onToggleMode }) {
   const navigate = useNavigate();
@@ -41,8 +42,8 @@ export default function TestCasesList({ token, mode, onToggleMode }) {
 
   const loadProjects = async () => {
     try {
-      const res = await axios.get(`${import.meta.env.VITE_API_URL}/automation/projects`);
-      setProjects(res.data);
+      const list = await getAllPages(`${import.meta.env.VITE_API_URL}/automation/projects`, { limit: 200 });
+      setProjects(list);
     } catch (error) {
       console.error('Error loading projects:', error);
     }
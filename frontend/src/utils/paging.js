@@ -0,0 +1,13 @@
+import axios from 'axios';
+
+// Fetch every page of a cursor-paginated list, following the X-Next-Cursor header
+export const getAllPages = async (url, params = {}) => {
+  const items = [];
+  let cursor;
+  do {
+    const res = await axios.get(url, { params: cursor ? { ...params, cursor } : params });
+    items.push(...res.data);
+    cursor = res.headers['x-next-cursor'];
+  } while (cursor);
+  return items;
+};